@@ -150,4 +150,16 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
-}
\ No newline at end of file
+}
+
+# Seconds between two bulk writes of the buffered rider locations
+RIDER_LOCATION_FLUSH_INTERVAL = 2
+
+# Seconds between two appends of the buffered pings to the rider track history
+RIDER_TRACK_FLUSH_INTERVAL = 60
+
+# Precomputed cell-to-cell travel time matrix, built with `manage.py build_eta_matrix`
+ETA_MATRIX_PATH = BASE_DIR / 'eta_matrix.npy'
+
+# Restaurant search backend: 'memory' (in-process index, typo tolerant) or 'fts5' (SQLite FTS5 table)
+RESTAURANT_SEARCH_BACKEND = 'memory'
@@ -0,0 +1,5 @@
+from .grid import GridIndex, haversine_km, EARTH_RADIUS_KM
+from .bounds import bounding_box, bounding_box_q
+from .functions import Haversine
+from .matrix import distance_matrix
+from .eta import EtaMatrix, get_eta_matrix
@@ -0,0 +1,54 @@
+import math
+from django.db.models import Q
+from .grid import KM_PER_DEGREE
+
+
+def bounding_box(latitude, longitude, distance_km):
+    """
+    Computes the lat/lng box enclosing a circle on the earth's surface.
+
+    Args:
+        latitude (float): Latitude of the circle's center.
+        longitude (float): Longitude of the circle's center.
+        distance_km (float): Radius of the circle in kilometers.
+
+    Returns:
+        tuple: (min_latitude, max_latitude, min_longitude, max_longitude).
+    """
+    latitude, longitude = float(latitude), float(longitude)
+    lat_delta = distance_km / KM_PER_DEGREE
+    min_latitude = max(-90.0, latitude - lat_delta)
+    max_latitude = min(90.0, latitude + lat_delta)
+
+    # Near the poles the box spans every longitude.
+    widest = max(abs(min_latitude), abs(max_latitude))
+    if widest >= 89.999:
+        return min_latitude, max_latitude, -180.0, 180.0
+
+    lng_delta = lat_delta / math.cos(math.radians(widest))
+    return min_latitude, max_latitude, longitude - lng_delta, longitude + lng_delta
+
+
+def bounding_box_q(latitude, longitude, distance_km, latitude_field='latitude', longitude_field='longitude'):
+    """
+    Builds a filter narrowing a queryset to the bounding box of a circle.
+
+    The filter only uses range comparisons, so a database index on the
+    latitude and longitude columns can serve it before any distance is
+    computed.
+
+    Args:
+        latitude (float): Latitude of the circle's center.
+        longitude (float): Longitude of the circle's center.
+        distance_km (float): Radius of the circle in kilometers.
+        latitude_field (str): Name of the latitude field to filter on.
+        longitude_field (str): Name of the longitude field to filter on.
+
+    Returns:
+        Q: Filter matching the points inside the bounding box.
+    """
+    min_latitude, max_latitude, min_longitude, max_longitude = bounding_box(latitude, longitude, distance_km)
+    return Q(**{
+        f'{latitude_field}__range': (min_latitude, max_latitude),
+        f'{longitude_field}__range': (min_longitude, max_longitude),
+    })
@@ -0,0 +1,286 @@
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+import numpy as np
+from django.conf import settings
+from .grid import KM_PER_DEGREE
+from .matrix import distance_matrix
+
+# Seconds between two checks of the matrix file for a rebuild.
+ETA_MATRIX_RECHECK = 60
+
+
+class EtaMatrix:
+    """
+    Precomputed cell-to-cell travel times over a city.
+
+    The city's bounding box is divided into square cells and the travel
+    time between every pair of cells is kept in a float32 NumPy array
+    stored in a .npy file, with the grid's bounds in a JSON sidecar. The
+    file is memory-mapped, so every worker process shares one copy through
+    the page cache, and an estimate is a single array lookup. Observed
+    travel times are folded in with an exponentially weighted moving
+    average written through the shared mapping.
+
+    Attributes:
+        path (str): Path of the .npy file.
+        times (ndarray): Memory-mapped array of shape (cells, cells) with the travel times in seconds.
+        bounds (tuple): (min_lat, max_lat, min_lng, max_lng) covered by the grid.
+        cell_km (float): Side of a cell in kilometers.
+        smoothing (float): Weight of a new observation in the moving average.
+        rows (int): Number of cells along the latitude.
+        cols (int): Number of cells along the longitude.
+    """
+
+    def __init__(self, path, times, bounds, cell_km, smoothing=0.2):
+        """
+        Wraps a loaded travel time array.
+
+        Args:
+            path (str): Path of the .npy file.
+            times (ndarray): The travel time array.
+            bounds (tuple): (min_lat, max_lat, min_lng, max_lng) covered by the grid.
+            cell_km (float): Side of a cell in kilometers.
+            smoothing (float): Weight of a new observation in the moving average.
+
+        Raises:
+            ValueError: If the array does not match the grid.
+        """
+        self.path = path
+        self.times = times
+        self.bounds = tuple(bounds)
+        self.cell_km = cell_km
+        self.smoothing = smoothing
+        self.rows, self.cols, self._lat_step, self._lng_step = self.grid_shape(self.bounds, cell_km)
+        cells = self.rows * self.cols
+        if times.shape != (cells, cells):
+            raise ValueError(f"{path} holds a {times.shape} matrix, expected ({cells}, {cells}).")
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def grid_shape(bounds, cell_km):
+        """
+        Computes the layout of the grid covering a bounding box.
+
+        Args:
+            bounds (tuple): (min_lat, max_lat, min_lng, max_lng).
+            cell_km (float): Side of a cell in kilometers.
+
+        Returns:
+            tuple: (rows, cols, cell height in degrees, cell width in degrees).
+        """
+        min_lat, max_lat, min_lng, max_lng = bounds
+        lat_step = cell_km / KM_PER_DEGREE
+        lng_step = lat_step / math.cos(math.radians((min_lat + max_lat) / 2))
+        rows = max(1, math.ceil((max_lat - min_lat) / lat_step))
+        cols = max(1, math.ceil((max_lng - min_lng) / lng_step))
+        return rows, cols, lat_step, lng_step
+
+    @staticmethod
+    def sidecar_path(path):
+        """
+        Returns the path of the JSON file describing a matrix file.
+        """
+        return os.path.splitext(path)[0] + '.json'
+
+    @classmethod
+    def build(cls, path, bounds, cell_km=0.5, speed_kmh=20, detour=1.3, overhead_seconds=60, smoothing=0.2):
+        """
+        Writes a matrix file estimated from the distance between cell centers.
+
+        The new file replaces the previous one atomically, so processes that
+        still map the old file keep reading it until they reload.
+
+        Args:
+            path (str): Path of the .npy file.
+            bounds (tuple): (min_lat, max_lat, min_lng, max_lng) to cover.
+            cell_km (float): Side of a cell in kilometers.
+            speed_kmh (float): Average travel speed.
+            detour (float): Ratio of the road distance to the straight-line distance.
+            overhead_seconds (float): Fixed time added to every trip (parking, handover).
+            smoothing (float): Weight of a new observation in the moving average.
+
+        Returns:
+            EtaMatrix: The new matrix, loaded from the written file.
+        """
+        rows, cols, lat_step, lng_step = cls.grid_shape(bounds, cell_km)
+        min_lat, _, min_lng, _ = bounds
+        row_index, col_index = np.divmod(np.arange(rows * cols), cols)
+        centers = np.column_stack([
+            min_lat + (row_index + 0.5) * lat_step,
+            min_lng + (col_index + 0.5) * lng_step,
+        ])
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, matrix_tmp = tempfile.mkstemp(suffix='.npy', dir=directory)
+        os.close(fd)
+        times = np.lib.format.open_memmap(matrix_tmp, mode='w+', dtype=np.float32, shape=(len(centers), len(centers)))
+        seconds_per_km = detour * 3600 / speed_kmh
+        for start in range(0, len(centers), 512):
+            block = distance_matrix(centers[start:start + 512], centers)
+            times[start:start + 512] = block * seconds_per_km + overhead_seconds
+        times.flush()
+        del times
+
+        fd, sidecar_tmp = tempfile.mkstemp(suffix='.json', dir=directory)
+        with os.fdopen(fd, 'w') as sidecar:
+            json.dump({'bounds': list(bounds), 'cell_km': cell_km, 'smoothing': smoothing}, sidecar)
+        os.replace(sidecar_tmp, cls.sidecar_path(path))
+        os.replace(matrix_tmp, path)
+        return cls.load(path)
+
+    @classmethod
+    def load(cls, path, writable=True):
+        """
+        Memory-maps a matrix file.
+
+        Args:
+            path (str): Path of the .npy file.
+            writable (bool): Maps the file read-write so that observations are shared.
+
+        Returns:
+            EtaMatrix: The loaded matrix.
+        """
+        with open(cls.sidecar_path(path)) as sidecar:
+            meta = json.load(sidecar)
+        times = np.load(path, mmap_mode='r+' if writable else 'r')
+        return cls(path, times, meta['bounds'], meta['cell_km'], meta.get('smoothing', 0.2))
+
+    def cells(self, latitudes, longitudes):
+        """
+        Finds the cells of points; points outside the grid use the nearest edge cell.
+
+        Args:
+            latitudes (ndarray): Latitudes of the points.
+            longitudes (ndarray): Longitudes of the points.
+
+        Returns:
+            ndarray: The cell index of each point.
+        """
+        min_lat, _, min_lng, _ = self.bounds
+        rows = np.clip(((np.asarray(latitudes, dtype=float) - min_lat) // self._lat_step).astype(int), 0, self.rows - 1)
+        cols = np.clip(((np.asarray(longitudes, dtype=float) - min_lng) // self._lng_step).astype(int), 0, self.cols - 1)
+        return rows * self.cols + cols
+
+    def cell(self, latitude, longitude):
+        """
+        Finds the cell of a point.
+
+        Args:
+            latitude (float): Latitude of the point.
+            longitude (float): Longitude of the point.
+
+        Returns:
+            int: The cell index.
+        """
+        min_lat, _, min_lng, _ = self.bounds
+        row = min(max(int((float(latitude) - min_lat) // self._lat_step), 0), self.rows - 1)
+        col = min(max(int((float(longitude) - min_lng) // self._lng_step), 0), self.cols - 1)
+        return row * self.cols + col
+
+    def eta(self, from_latitude, from_longitude, to_latitude, to_longitude):
+        """
+        Estimates the travel time between two points.
+
+        Args:
+            from_latitude (float): Latitude of the origin.
+            from_longitude (float): Longitude of the origin.
+            to_latitude (float): Latitude of the destination.
+            to_longitude (float): Longitude of the destination.
+
+        Returns:
+            float: The travel time in seconds.
+        """
+        return float(self.times[self.cell(from_latitude, from_longitude), self.cell(to_latitude, to_longitude)])
+
+    def etas_to(self, origins, to_latitude, to_longitude):
+        """
+        Estimates the travel times from several points to one destination.
+
+        Args:
+            origins (ndarray): Array of shape (n, 2) holding latitudes and longitudes.
+            to_latitude (float): Latitude of the destination.
+            to_longitude (float): Longitude of the destination.
+
+        Returns:
+            ndarray: The n travel times in seconds.
+        """
+        origins = np.asarray(origins, dtype=float).reshape(-1, 2)
+        return self.times[self.cells(origins[:, 0], origins[:, 1]), self.cell(to_latitude, to_longitude)].astype(float)
+
+    def observe(self, from_latitude, from_longitude, to_latitude, to_longitude, seconds):
+        """
+        Folds an observed travel time into the estimate of its cell pair.
+
+        Args:
+            from_latitude (float): Latitude of the origin.
+            from_longitude (float): Longitude of the origin.
+            to_latitude (float): Latitude of the destination.
+            to_longitude (float): Longitude of the destination.
+            seconds (float): The observed travel time.
+
+        Returns:
+            float: The updated estimate in seconds.
+        """
+        origin = self.cell(from_latitude, from_longitude)
+        destination = self.cell(to_latitude, to_longitude)
+        # Concurrent observations from other processes may interleave; the
+        # average absorbs an occasional lost update.
+        with self._lock:
+            estimate = (1 - self.smoothing) * float(self.times[origin, destination]) + self.smoothing * seconds
+            self.times[origin, destination] = estimate
+        return estimate
+
+    def flush(self):
+        """
+        Writes the observations made through this process's mapping to disk.
+        """
+        if self.times.flags.writeable:
+            self.times.flush()
+
+
+_loaded = {'matrix': None, 'inode': None, 'checked_at': float('-inf')}
+_loaded_lock = threading.Lock()
+
+
+def get_eta_matrix():
+    """
+    Returns the ETA matrix configured by the ETA_MATRIX_PATH setting.
+
+    The file is checked for a rebuild at most every ETA_MATRIX_RECHECK
+    seconds and reloaded when it was replaced.
+
+    Returns:
+        EtaMatrix: The shared matrix, or None if it has not been built.
+    """
+    path = getattr(settings, 'ETA_MATRIX_PATH', None)
+    if not path:
+        return None
+
+    now = time.monotonic()
+    if now - _loaded['checked_at'] < ETA_MATRIX_RECHECK:
+        return _loaded['matrix']
+
+    with _loaded_lock:
+        if now - _loaded['checked_at'] < ETA_MATRIX_RECHECK:
+            return _loaded['matrix']
+        _loaded['checked_at'] = now
+        try:
+            inode = os.stat(path).st_ino
+        except FileNotFoundError:
+            _loaded.update(matrix=None, inode=None)
+            return None
+
+        if inode != _loaded['inode']:
+            try:
+                matrix = EtaMatrix.load(str(path))
+            except (OSError, ValueError):
+                # Caught between the replacement of the sidecar and the matrix.
+                _loaded['checked_at'] = float('-inf')
+                return _loaded['matrix']
+            _loaded.update(matrix=matrix, inode=inode)
+        return _loaded['matrix']
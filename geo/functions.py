@@ -0,0 +1,62 @@
+from django.db.backends.signals import connection_created
+from django.db.models import FloatField, Func
+from django.dispatch import receiver
+from .grid import EARTH_RADIUS_KM, haversine_km
+
+
+def _sqlite_haversine(lat1, lng1, lat2, lng2):
+    if lat1 is None or lng1 is None or lat2 is None or lng2 is None:
+        return None
+    # Decimal parameters reach SQLite as strings.
+    return haversine_km(float(lat1), float(lng1), float(lat2), float(lng2))
+
+
+@receiver(connection_created)
+def register_sqlite_functions(sender, connection, **kwargs):
+    """
+    Registers the native HAVERSINE function on every new SQLite connection.
+
+    Args:
+        sender: The database wrapper class.
+        connection (BaseDatabaseWrapper): The newly created connection.
+    """
+    if connection.vendor == 'sqlite':
+        connection.connection.create_function('HAVERSINE', 4, _sqlite_haversine, deterministic=True)
+
+
+class Haversine(Func):
+    """
+    Great-circle distance in kilometers between two lat/lng points.
+
+    On SQLite this calls a native user-defined function registered on the
+    connection. Other backends get an equivalent SQL expression, clamped so
+    that rounding can never push ASIN out of its domain.
+
+    Example:
+        Rider.objects.annotate(distance=Haversine(18.52, 73.85, 'latitude', 'longitude'))
+    """
+
+    function = 'HAVERSINE'
+    arity = 4
+    output_field = FloatField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, **extra_context)
+
+    def as_sql(self, compiler, connection, **extra_context):
+        compiled = [compiler.compile(expression) for expression in self.get_source_expressions()]
+        (lat1, lat1_params), (lng1, lng1_params), (lat2, lat2_params), (lng2, lng2_params) = compiled
+
+        sql = (
+            f'(2 * {EARTH_RADIUS_KM} * ASIN(SQRT(LEAST(1.0, '
+            f'POWER(SIN((RADIANS({lat2}) - RADIANS({lat1})) / 2), 2) + '
+            f'COS(RADIANS({lat1})) * COS(RADIANS({lat2})) * '
+            f'POWER(SIN((RADIANS({lng2}) - RADIANS({lng1})) / 2), 2)'
+            f'))))'
+        )
+        params = (
+            *lat2_params, *lat1_params,
+            *lat1_params, *lat2_params,
+            *lng2_params, *lng1_params,
+        )
+        return sql, params
@@ -0,0 +1,245 @@
+import heapq
+import math
+import threading
+import time
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = EARTH_RADIUS_KM * math.pi / 180
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """
+    Computes the great-circle distance between two points.
+
+    Args:
+        lat1 (float or Decimal): Latitude of the first point.
+        lng1 (float or Decimal): Longitude of the first point.
+        lat2 (float or Decimal): Latitude of the second point.
+        lng2 (float or Decimal): Longitude of the second point.
+
+    Returns:
+        float: Distance in kilometers.
+    """
+    # Model coordinates are Decimals, which do not mix with floats.
+    lat1, lng1, lat2, lng2 = float(lat1), float(lng1), float(lat2), float(lng2)
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lng2 - lng1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(1.0, a)))
+
+
+class GridIndex:
+    """
+    In-memory spatial index bucketing points into uniform lat/lng grid cells.
+
+    Lookups only visit the cells around the query point, so the cost of a
+    query depends on the local density rather than on the total number of
+    indexed points. The index is process-local and safe to share between
+    threads.
+
+    Attributes:
+        cell_degrees (float): Size of a grid cell in degrees.
+        is_warm (bool): Indicates if the index has been loaded.
+        loaded_at (float): Monotonic time of the last full load.
+    """
+
+    def __init__(self, cell_degrees=0.01):
+        """
+        Initializes an empty index.
+
+        Args:
+            cell_degrees (float): Size of a grid cell in degrees (0.01 is roughly 1.1 km).
+        """
+        self.cell_degrees = cell_degrees
+        self.is_warm = False
+        self.loaded_at = None
+        self._cells = {}
+        self._positions = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __contains__(self, key):
+        return key in self._positions
+
+    def _cell(self, latitude, longitude):
+        return (math.floor(latitude / self.cell_degrees), math.floor(longitude / self.cell_degrees))
+
+    def load(self, points):
+        """
+        Replaces the contents of the index and marks it as warm.
+
+        Args:
+            points (iterable): Iterable of (key, latitude, longitude) tuples.
+        """
+        cells = {}
+        positions = {}
+        for key, latitude, longitude in points:
+            latitude, longitude = float(latitude), float(longitude)
+            positions[key] = (latitude, longitude)
+            cells.setdefault(self._cell(latitude, longitude), set()).add(key)
+
+        with self._lock:
+            self._cells = cells
+            self._positions = positions
+            self.is_warm = True
+            self.loaded_at = time.monotonic()
+
+    def clear(self):
+        """
+        Empties the index and marks it as cold.
+        """
+        with self._lock:
+            self._cells = {}
+            self._positions = {}
+            self.is_warm = False
+            self.loaded_at = None
+
+    def is_stale(self, max_age):
+        """
+        Checks whether the index is cold or was loaded too long ago.
+
+        Args:
+            max_age (float): Maximum age in seconds, or None to never expire.
+
+        Returns:
+            bool: True if the index should be reloaded, False otherwise.
+        """
+        if not self.is_warm:
+            return True
+        return max_age is not None and time.monotonic() - self.loaded_at > max_age
+
+    def update(self, key, latitude, longitude):
+        """
+        Inserts a point or moves it to a new position.
+
+        Args:
+            key: Identifier of the point.
+            latitude (float): New latitude.
+            longitude (float): New longitude.
+        """
+        latitude, longitude = float(latitude), float(longitude)
+        cell = self._cell(latitude, longitude)
+        with self._lock:
+            previous = self._positions.get(key)
+            if previous is not None:
+                previous_cell = self._cell(*previous)
+                if previous_cell != cell:
+                    self._discard(previous_cell, key)
+            self._positions[key] = (latitude, longitude)
+            self._cells.setdefault(cell, set()).add(key)
+
+    def remove(self, key):
+        """
+        Removes a point from the index if present.
+
+        Args:
+            key: Identifier of the point.
+        """
+        with self._lock:
+            previous = self._positions.pop(key, None)
+            if previous is not None:
+                self._discard(self._cell(*previous), key)
+
+    def _discard(self, cell, key):
+        members = self._cells.get(cell)
+        if members is not None:
+            members.discard(key)
+            if not members:
+                del self._cells[cell]
+
+    def position(self, key):
+        """
+        Returns the indexed position of a point.
+
+        Args:
+            key: Identifier of the point.
+
+        Returns:
+            tuple: (latitude, longitude), or None if the point is not indexed.
+        """
+        return self._positions.get(key)
+
+    def _ring(self, center, radius):
+        row, col = center
+        if radius == 0:
+            yield center
+            return
+        for d_col in range(-radius, radius + 1):
+            yield (row - radius, col + d_col)
+            yield (row + radius, col + d_col)
+        for d_row in range(-radius + 1, radius):
+            yield (row + d_row, col - radius)
+            yield (row + d_row, col + radius)
+
+    def _ring_min_km(self, latitude, radius):
+        # Lower bound on the distance to any cell of the given ring. Longitude
+        # degrees shrink towards the poles, so use the worst latitude covered.
+        if radius <= 1:
+            return 0.0
+        worst_latitude = min(89.0, abs(latitude) + radius * self.cell_degrees)
+        return (radius - 1) * self.cell_degrees * KM_PER_DEGREE * math.cos(math.radians(worst_latitude))
+
+    def _max_ring(self, latitude, max_km):
+        worst_latitude = min(89.0, abs(latitude) + max_km / KM_PER_DEGREE)
+        km_per_cell = self.cell_degrees * KM_PER_DEGREE * math.cos(math.radians(worst_latitude))
+        return int(math.ceil(max_km / km_per_cell)) + 1
+
+    def nearest(self, latitude, longitude, k, max_km, predicate=None):
+        """
+        Finds the k nearest points within a maximum distance.
+
+        Cells are visited ring by ring outwards from the query cell, the k
+        nearest points seen so far are kept in a bounded max-heap, and the
+        search stops as soon as no unvisited ring can hold a closer point.
+
+        Args:
+            latitude (float): Latitude of the query point.
+            longitude (float): Longitude of the query point.
+            k (int): Maximum number of points to return, or None for all of them.
+            max_km (float): Maximum distance in kilometers.
+            predicate (callable): Optional filter called with each candidate key.
+
+        Returns:
+            list: (distance, key) tuples sorted nearest first.
+        """
+        latitude, longitude = float(latitude), float(longitude)
+        center = self._cell(latitude, longitude)
+        max_ring = self._max_ring(latitude, max_km)
+        nearest = []  # (-distance, key), the farthest kept point on top
+
+        with self._lock:
+            for radius in range(max_ring + 1):
+                if k is not None and len(nearest) >= k and -nearest[0][0] <= self._ring_min_km(latitude, radius):
+                    break
+                for cell in self._ring(center, radius):
+                    for key in self._cells.get(cell, ()):
+                        if predicate is not None and not predicate(key):
+                            continue
+                        distance = haversine_km(latitude, longitude, *self._positions[key])
+                        if distance > max_km:
+                            continue
+                        if k is None or len(nearest) < k:
+                            heapq.heappush(nearest, (-distance, key))
+                        elif -distance > nearest[0][0]:
+                            heapq.heapreplace(nearest, (-distance, key))
+
+        return sorted((-distance, key) for distance, key in nearest)
+
+    def within(self, latitude, longitude, max_km, predicate=None):
+        """
+        Finds all points within a distance, nearest first.
+
+        Args:
+            latitude (float): Latitude of the query point.
+            longitude (float): Longitude of the query point.
+            max_km (float): Maximum distance in kilometers.
+            predicate (callable): Optional filter called with each candidate key.
+
+        Returns:
+            list: (distance, key) tuples sorted nearest first.
+        """
+        return self.nearest(latitude, longitude, None, max_km, predicate=predicate)
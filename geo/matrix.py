@@ -0,0 +1,24 @@
+import numpy as np
+from .grid import EARTH_RADIUS_KM
+
+
+def distance_matrix(origins, destinations):
+    """
+    Computes the great-circle distances between two sets of points.
+
+    Args:
+        origins (ndarray): Array of shape (n, 2) holding latitudes and longitudes.
+        destinations (ndarray): Array of shape (m, 2) holding latitudes and longitudes.
+
+    Returns:
+        ndarray: Array of shape (n, m) with the distances in kilometers.
+    """
+    origins = np.radians(np.asarray(origins, dtype=float).reshape(-1, 2))
+    destinations = np.radians(np.asarray(destinations, dtype=float).reshape(-1, 2))
+    lat1 = origins[:, 0][:, None]
+    lng1 = origins[:, 1][:, None]
+    lat2 = destinations[:, 0][None, :]
+    lng2 = destinations[:, 1][None, :]
+
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
@@ -1,3 +1,78 @@
-from django.test import TestCase
+import json
+from django.test import AsyncRequestFactory, TestCase
+from rest_framework_simplejwt.tokens import AccessToken
+from accounts.models import User
+from restaurant.models import Restaurant
+from rider.models import Rider
+from .models import Order
+from .tracking import order_hub
+from .views import OrderTrackingStreamView
 
-# Create your tests here.
+
+def parse_event(chunk):
+    # An SSE message is "event: <type>\ndata: <json>\n\n".
+    event, data = chunk.decode().strip().split('\n')
+    return event.removeprefix('event: '), json.loads(data.removeprefix('data: '))
+
+
+class OrderTrackingStreamTests(TestCase):
+    """
+    Tests for the Server-Sent Events stream of an order.
+    """
+
+    def setUp(self):
+        manager = User.objects.create_user(email='manager@example.com', password='password', role=User.RESTAURANT)
+        self.customer = User.objects.create_user(email='customer@example.com', password='password', role=User.USER)
+        restaurant = Restaurant.objects.create(
+            restaurant_manager=manager,
+            restaurant_name='Test Kitchen',
+            restaurant_phone='0000000000',
+            opening_time='09:00',
+            closing_time='23:00',
+            latitude=18.52,
+            longitude=73.85,
+        )
+        self.order = Order.objects.create(user=self.customer, restaurant=restaurant, is_placed=True)
+        self.rider = Rider.objects.create(
+            rider=User.objects.create_user(email='rider@example.com', password='password', role=User.RIDER),
+            order=self.order,
+            latitude=18.53,
+            longitude=73.86,
+            status=Rider.ASSIGNED,
+        )
+
+    async def open_stream(self, user):
+        request = AsyncRequestFactory().get(
+            f'/api/order/{self.order.pk}/track', headers={'Authorization': f'Bearer {AccessToken.for_user(user)}'}
+        )
+        return await OrderTrackingStreamView.as_view()(request, order_id=self.order.pk)
+
+    async def test_stream_sends_a_snapshot_then_status_events(self):
+        response = await self.open_stream(self.customer)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        chunks = aiter(response.streaming_content)
+
+        event, snapshot = parse_event(await anext(chunks))
+        self.assertEqual(event, 'snapshot')
+        self.assertEqual(snapshot['order_id'], self.order.pk)
+        self.assertFalse(snapshot['is_delivered'])
+        self.assertEqual(snapshot['rider'], {
+            'id': self.rider.pk, 'user_id': self.rider.rider_id, 'latitude': 18.53, 'longitude': 73.86,
+        })
+
+        order_hub.publish(self.order.pk, 'status', {'status': 'delivered', 'rider': self.rider.pk}, final=True)
+
+        event, data = parse_event(await anext(chunks))
+        self.assertEqual((event, data), ('status', {'status': 'delivered', 'rider': self.rider.pk}))
+        # The final event closes the stream and the subscription.
+        with self.assertRaises(StopAsyncIteration):
+            await anext(chunks)
+        self.assertNotIn(self.order.pk, order_hub._subscribers)
+
+    async def test_other_customers_cannot_track_the_order(self):
+        stranger = await User.objects.acreate(email='stranger@example.com', role=User.USER)
+
+        response = await self.open_stream(stranger)
+
+        self.assertEqual(response.status_code, 403)
+        self.assertNotIn(self.order.pk, order_hub._subscribers)
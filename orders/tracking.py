@@ -0,0 +1,117 @@
+import asyncio
+import json
+import threading
+from django.core.serializers.json import DjangoJSONEncoder
+
+# Events a subscriber can lag behind before the oldest ones are dropped.
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+def format_event(event, data):
+    """
+    Formats a Server-Sent Events message.
+
+    Args:
+        event (str): The event type.
+        data (dict): The event payload.
+
+    Returns:
+        str: The message, ready to be written to the stream.
+    """
+    return f"event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+
+
+class Subscription:
+    """
+    A single watcher of an order, bound to the event loop it reads from.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def put(self, item):
+        # Slow readers lose the oldest messages rather than stalling publishers.
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(item)
+
+    async def get(self):
+        """
+        Waits for the next message.
+
+        Returns:
+            tuple: (message, final), final being True for the last event of the order.
+        """
+        return await self.queue.get()
+
+
+class OrderEventHub:
+    """
+    In-process publish/subscribe hub for order tracking events.
+
+    Publishing formats the message once and hands it to every subscriber's
+    event loop, so the cost of an update does not depend on how the
+    watchers would otherwise poll. The hub only reaches watchers connected
+    to the same process as the publisher.
+    """
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, order_id):
+        """
+        Starts watching an order from the running event loop.
+
+        Args:
+            order_id (int): The ID of the order.
+
+        Returns:
+            Subscription: The subscription to read messages from.
+        """
+        subscription = Subscription(asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.setdefault(order_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, order_id, subscription):
+        """
+        Stops watching an order.
+
+        Args:
+            order_id (int): The ID of the order.
+            subscription (Subscription): The subscription returned by subscribe.
+        """
+        with self._lock:
+            subscribers = self._subscribers.get(order_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[order_id]
+
+    def publish(self, order_id, event, data, final=False):
+        """
+        Sends an event to every watcher of an order. Safe to call from any thread.
+
+        Args:
+            order_id (int): The ID of the order.
+            event (str): The event type.
+            data (dict): The event payload.
+            final (bool): Indicates that no further events will follow.
+        """
+        with self._lock:
+            subscribers = list(self._subscribers.get(order_id, ()))
+        if not subscribers:
+            return
+
+        item = (format_event(event, data), final)
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.put, item)
+            except RuntimeError:
+                # The watcher's event loop is closed.
+                self.unsubscribe(order_id, subscription)
+
+
+order_hub = OrderEventHub()
@@ -1,7 +1,8 @@
 from django.urls import path
-from .views import CreateOrderAPIView, UserOrderListView
+from .views import CreateOrderAPIView, UserOrderListView, OrderTrackingStreamView
 
 urlpatterns = [
     path('order/orders/list', UserOrderListView.as_view(), name='orders'),
     path('order/create-order', CreateOrderAPIView.as_view(), name='create-order'),
+    path('order/<int:order_id>/track', OrderTrackingStreamView.as_view(), name='track-order'),
 ]
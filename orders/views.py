@@ -1,10 +1,19 @@
+import asyncio
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views import View
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import AuthenticationFailed
 from rest_framework import status
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from accounts.models import User
 from .models import Order, OrderItem
 from .serializers import OrderSerializer, OrderItemSerializer
+from .tracking import format_event, order_hub
 from restaurant.models import Restaurant, Menu
+from rider.models import Rider
 
 class CreateOrderAPIView(APIView):
     """
@@ -99,3 +108,124 @@ class UserOrderListView(APIView):
             order_details_list.append(order_details)
 
         return Response(order_details_list, status=status.HTTP_200_OK)
+
+
+class OrderTrackingStreamView(View):
+    """
+    Server-Sent Events stream of an order's rider position and status.
+
+    Watchers receive a snapshot first, then the events published to the
+    order hub by the rider endpoints and the dispatch code, until the order
+    is delivered. The view is asynchronous and needs an ASGI server to keep
+    the connections open without holding a thread each.
+
+    Attributes:
+        keepalive_seconds (float): Idle time after which a comment line is sent.
+    """
+
+    keepalive_seconds = 15
+
+    async def get(self, request, order_id):
+        """
+        Opens the tracking stream of an order.
+
+        Args:
+            request (HttpRequest): HTTP request carrying a JWT bearer token.
+            order_id (int): The ID of the order.
+
+        Returns:
+            StreamingHttpResponse: The event stream, or an error response.
+        """
+        try:
+            authenticated = await sync_to_async(JWTAuthentication().authenticate)(request)
+        except AuthenticationFailed as exc:
+            return JsonResponse({'detail': str(exc.detail)}, status=status.HTTP_401_UNAUTHORIZED)
+        if authenticated is None:
+            return JsonResponse({'detail': 'Authentication credentials were not provided.'},
+                                status=status.HTTP_401_UNAUTHORIZED)
+
+        user = authenticated[0]
+        # Subscribe before reading the snapshot, so that no event published
+        # in between is lost.
+        subscription = order_hub.subscribe(order_id)
+        order, snapshot = await sync_to_async(self.get_snapshot)(order_id)
+        if order is None:
+            order_hub.unsubscribe(order_id, subscription)
+            return JsonResponse({'error': 'Order not found.'}, status=status.HTTP_404_NOT_FOUND)
+        if not self.can_track(user, order, snapshot):
+            order_hub.unsubscribe(order_id, subscription)
+            return JsonResponse({'error': 'You are not allowed to track this order.'},
+                                status=status.HTTP_403_FORBIDDEN)
+
+        response = StreamingHttpResponse(
+            self.stream(order_id, subscription, snapshot), content_type='text/event-stream'
+        )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    def get_snapshot(self, order_id):
+        """
+        Reads the current state of an order.
+
+        Args:
+            order_id (int): The ID of the order.
+
+        Returns:
+            tuple: (order, snapshot dict), or (None, None) if the order does not exist.
+        """
+        order = Order.objects.select_related('restaurant').filter(pk=order_id).first()
+        if order is None:
+            return None, None
+
+        rider = Rider.objects.filter(order=order).first()
+        snapshot = {
+            'order_id': order.pk,
+            'is_placed': order.is_placed,
+            'is_delivered': order.is_delivered,
+            'rider': None,
+        }
+        if rider is not None:
+            rider.apply_buffered_location()
+            snapshot['rider'] = {
+                'id': rider.pk,
+                'user_id': rider.rider_id,
+                'latitude': float(rider.latitude),
+                'longitude': float(rider.longitude),
+            }
+        return order, snapshot
+
+    def can_track(self, user, order, snapshot):
+        """
+        Checks whether a user may watch an order.
+
+        Args:
+            user (User): The authenticated user.
+            order (Order): The order.
+            snapshot (dict): The order's snapshot.
+
+        Returns:
+            bool: True for admins, the customer, the restaurant manager and the assigned rider.
+        """
+        if user.role == User.ADMIN or user.pk in (order.user_id, order.restaurant.restaurant_manager_id):
+            return True
+        return snapshot['rider'] is not None and snapshot['rider']['user_id'] == user.pk
+
+    async def stream(self, order_id, subscription, snapshot):
+        try:
+            yield format_event('snapshot', snapshot)
+            if snapshot['is_delivered']:
+                return
+
+            while True:
+                try:
+                    message, final = await asyncio.wait_for(subscription.get(), timeout=self.keepalive_seconds)
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+                    continue
+
+                yield message
+                if final:
+                    return
+        finally:
+            order_hub.unsubscribe(order_id, subscription)
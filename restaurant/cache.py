@@ -0,0 +1,101 @@
+import threading
+from collections import OrderedDict
+from django.core.cache import caches
+
+# Number of menus kept in each worker process in front of the shared cache.
+MENU_CACHE_LOCAL_SIZE = 1024
+
+# Seconds a menu stays in the shared cache. Entries never go stale, since a
+# new version uses a new key, so this only bounds the memory they take.
+MENU_CACHE_TIMEOUT = 24 * 3600
+
+
+class MenuCache:
+    """
+    Read-through cache of serialized restaurant menus.
+
+    Entries are keyed by the restaurant and its content version, which is
+    bumped whenever the restaurant's menu rows change, so a cached menu is
+    never stale and nothing has to be invalidated. A small LRU in each
+    worker process sits in front of Django's cache framework, which shares
+    the entries between processes.
+
+    Attributes:
+        local_size (int): Maximum number of menus kept in the process.
+        timeout (int): Seconds a menu stays in the shared cache.
+    """
+
+    def __init__(self, cache_alias='default', local_size=MENU_CACHE_LOCAL_SIZE, timeout=MENU_CACHE_TIMEOUT):
+        self.cache_alias = cache_alias
+        self.local_size = local_size
+        self.timeout = timeout
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0}
+
+    @staticmethod
+    def key(restaurant_id, version):
+        return f'restaurant-menu:{restaurant_id}:{version}'
+
+    def get(self, restaurant_id, version, loader):
+        """
+        Returns a restaurant's menu, loading it on a miss.
+
+        Args:
+            restaurant_id (int): The ID of the restaurant.
+            version (int): The restaurant's current content version.
+            loader (callable): Returns the serialized menu when it is not cached.
+
+        Returns:
+            list: The serialized menu.
+        """
+        with self._lock:
+            entry = self._local.get(restaurant_id)
+            if entry is not None and entry[0] == version:
+                self._local.move_to_end(restaurant_id)
+                self._stats['local_hits'] += 1
+                return entry[1]
+
+        cache = caches[self.cache_alias]
+        key = self.key(restaurant_id, version)
+        menu = cache.get(key)
+        if menu is None:
+            menu = loader()
+            cache.set(key, menu, self.timeout)
+            stat = 'misses'
+        else:
+            stat = 'shared_hits'
+
+        with self._lock:
+            self._stats[stat] += 1
+            # An older version of the menu is replaced in place.
+            self._local[restaurant_id] = (version, menu)
+            self._local.move_to_end(restaurant_id)
+            while len(self._local) > self.local_size:
+                self._local.popitem(last=False)
+        return menu
+
+    def stats(self):
+        """
+        Returns the hit and miss counters of this process.
+
+        Returns:
+            dict: Local and shared hits, misses, hit ratio and local size.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['local_entries'] = len(self._local)
+        lookups = stats['local_hits'] + stats['shared_hits'] + stats['misses']
+        stats['hit_ratio'] = round((lookups - stats['misses']) / lookups, 4) if lookups else None
+        return stats
+
+    def clear(self):
+        """
+        Empties the process-local tier and resets the counters.
+        """
+        with self._lock:
+            self._local.clear()
+            self._stats = dict.fromkeys(self._stats, 0)
+
+
+menu_cache = MenuCache()
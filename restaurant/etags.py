@@ -0,0 +1,66 @@
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def content_etag(kind, restaurant_id, version):
+    """
+    Builds the strong ETag of a restaurant resource from its content version.
+
+    Args:
+        kind (str): The resource, e.g. 'menu' or 'restaurant'.
+        restaurant_id (int): The ID of the restaurant.
+        version (int): The restaurant's content version.
+
+    Returns:
+        str: The quoted entity tag.
+    """
+    return f'"{kind}-{restaurant_id}-{version}"'
+
+
+def etag_matches(request, etag):
+    """
+    Checks whether the client already holds the current representation.
+
+    Args:
+        request (Request): HTTP request, with an optional If-None-Match header.
+        etag (str): The current entity tag.
+
+    Returns:
+        bool: True if the header lists the tag or is '*'.
+    """
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    # If-None-Match uses the weak comparison, so W/ prefixes are ignored.
+    tags = [tag.strip().removeprefix('W/') for tag in header.split(',')]
+    return '*' in tags or etag in tags
+
+
+def not_modified(etag):
+    """
+    Builds a 304 response for a representation the client already holds.
+
+    Args:
+        etag (str): The current entity tag.
+
+    Returns:
+        Response: The empty 304 response.
+    """
+    return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag, 'Cache-Control': 'no-cache'})
+
+
+def with_etag(response, etag):
+    """
+    Tags a response so that the client can revalidate it.
+
+    Args:
+        response (Response): The full response.
+        etag (str): The entity tag of its content.
+
+    Returns:
+        Response: The response, with ETag and Cache-Control headers.
+    """
+    response['ETag'] = etag
+    # Clients may store the response but must revalidate it before reuse.
+    response['Cache-Control'] = 'no-cache'
+    return response
@@ -0,0 +1,55 @@
+SECONDS_PER_DAY = 86400
+
+
+def seconds_of_day(value):
+    """
+    Converts a time of day to seconds since midnight.
+
+    Args:
+        value (time): The time of day.
+
+    Returns:
+        int: Seconds since midnight.
+    """
+    return value.hour * 3600 + value.minute * 60 + value.second
+
+
+def open_intervals(opening_time, closing_time):
+    """
+    Splits opening hours into intervals that do not cross midnight.
+
+    A restaurant is open from its opening time up to, but not including,
+    its closing time. Equal opening and closing times mean it never closes.
+
+    Args:
+        opening_time (time): The opening time.
+        closing_time (time): The closing time; earlier than the opening time
+            when the restaurant closes after midnight.
+
+    Returns:
+        list: Half-open [start, end) intervals in seconds since midnight.
+    """
+    start, end = seconds_of_day(opening_time), seconds_of_day(closing_time)
+    if start == end:
+        return [(0, SECONDS_PER_DAY)]
+    if start < end:
+        return [(start, end)]
+    if not end:
+        return [(start, SECONDS_PER_DAY)]
+    return [(start, SECONDS_PER_DAY), (0, end)]
+
+
+def is_open_at(opening_time, closing_time, local_time):
+    """
+    Checks whether opening hours cover a local time of day.
+
+    Args:
+        opening_time (time): The opening time.
+        closing_time (time): The closing time, as in open_intervals.
+        local_time (time): The time of day in the restaurant's time zone.
+
+    Returns:
+        bool: True if the restaurant is open.
+    """
+    second = seconds_of_day(local_time)
+    return any(start <= second < end for start, end in open_intervals(opening_time, closing_time))
@@ -0,0 +1,4 @@
+from geo import GridIndex
+
+# Process-local index of the restaurants' locations.
+restaurant_index = GridIndex()
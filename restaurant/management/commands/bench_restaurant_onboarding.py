@@ -0,0 +1,116 @@
+import random
+import time
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from accounts.models import User
+from restaurant.models import Cuisine, Menu
+from restaurant.serializers import RestaurantSerializer
+from rider.management.seeding import CITY_CENTER, random_point, seed_users
+
+CUISINES = (
+    'North Indian', 'South Indian', 'Chinese', 'Italian', 'Mexican', 'Thai', 'Japanese', 'Continental',
+    'Bakery', 'Desserts', 'Street Food', 'Biryani', 'Mughlai', 'Seafood', 'Beverages', 'Healthy Food',
+)
+
+
+class RowByRowRestaurantSerializer(RestaurantSerializer):
+    """
+    Restaurant serializer creating cuisines and menu items one query at a time, as before the bulk create.
+    """
+
+    def create(self, validated_data):
+        cuisines_data = validated_data.pop('cuisines', [])
+        menu_data = validated_data.pop('menu', [])
+
+        restaurant = self.Meta.model.objects.create(**validated_data)
+        for cuisine_data in cuisines_data:
+            cuisine = Cuisine.objects.filter(**cuisine_data).order_by('pk').first()
+            if cuisine is None:
+                cuisine = Cuisine.objects.create(**cuisine_data)
+            restaurant.cuisines.add(cuisine)
+        for menu_item_data in menu_data:
+            Menu.objects.create(restaurant=restaurant, **menu_item_data)
+        if menu_data:
+            restaurant.bump_content_version()
+        return restaurant
+
+
+class Command(BaseCommand):
+    """
+    Benchmarks onboarding restaurants with large menus through RestaurantSerializer.
+
+    Every restaurant is created from a nested payload of cuisines and menu
+    items, once with the row-by-row create and once with the bulk create,
+    and the time and queries of each onboarding are reported. Each variant
+    runs inside a transaction that is rolled back, so the command leaves
+    the database untouched.
+    """
+
+    help = 'Benchmarks onboarding restaurants with their cuisines and menus.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--restaurants', type=int, default=1000)
+        parser.add_argument('--items', type=int, default=200, help='Menu items per restaurant.')
+        parser.add_argument('--cuisines', type=int, default=3, help='Cuisines per restaurant.')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--skip-row-by-row', action='store_true', help='Only run the bulk create.')
+
+    def handle(self, *args, **options):
+        variants = [('bulk', RestaurantSerializer)]
+        if not options['skip_row_by_row']:
+            variants.insert(0, ('row by row', RowByRowRestaurantSerializer))
+
+        results = {}
+        for name, serializer_class in variants:
+            with transaction.atomic():
+                results[name] = self.run(name, serializer_class, options)
+                transaction.set_rollback(True)
+
+        if 'row by row' in results:
+            speedup = results['row by row'] / results['bulk'] if results['bulk'] else float('inf')
+            self.stdout.write(self.style.SUCCESS(f'Bulk create is {speedup:.1f}x faster than row by row.'))
+
+    def payloads(self, managers, options):
+        rng = random.Random(options['seed'])
+        for index, manager in enumerate(managers):
+            latitude, longitude = random_point(rng, CITY_CENTER, 15)
+            yield {
+                'restaurant_manager': manager.pk,
+                'restaurant_name': f'Restaurant {index}',
+                'restaurant_phone': '0000000000',
+                'opening_time': '09:00',
+                'closing_time': '23:00',
+                'latitude': latitude,
+                'longitude': longitude,
+                'cuisines': [{'name': name} for name in rng.sample(CUISINES, options['cuisines'])],
+                'menu': [{'item': f'Dish {item}', 'price': rng.randint(50, 800)} for item in range(options['items'])],
+            }
+
+    def run(self, name, serializer_class, options):
+        count = options['restaurants']
+        self.stdout.write(f'Onboarding {count} restaurants with {options["items"]} items each ({name})...')
+        managers = seed_users(count, f'bench-onboarding-{name.replace(" ", "-")}', User.RESTAURANT)
+
+        latencies, queries = [], []
+        started = time.perf_counter()
+        for data in self.payloads(managers, options):
+            serializer = serializer_class(data=data)
+            serializer.is_valid(raise_exception=True)
+            # The query log is bounded; keep it from filling up over the run.
+            connection.queries_log.clear()
+            with CaptureQueriesContext(connection) as captured:
+                onboarding_started = time.perf_counter()
+                serializer.save()
+                latencies.append((time.perf_counter() - onboarding_started) * 1000)
+            queries.append(len(captured))
+        elapsed = time.perf_counter() - started
+
+        latencies = np.array(latencies)
+        self.stdout.write(
+            f'[{name}] {elapsed:.2f} s total, {count / elapsed:.1f} restaurants/s, '
+            f'create p50 {np.percentile(latencies, 50):.2f} ms, p95 {np.percentile(latencies, 95):.2f} ms, '
+            f'{np.mean(queries):.1f} queries per restaurant\n'
+        )
+        return float(latencies.sum())
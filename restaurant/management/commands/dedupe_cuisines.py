@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand
+from django.db import models, transaction
+from restaurant.models import Cuisine, Restaurant
+from restaurant.suggestions import normalize_cuisine
+
+
+class Command(BaseCommand):
+    """
+    Merges the cuisines whose names only differ in case or spacing.
+
+    For every normalized name the oldest cuisine is kept. The restaurants
+    of its duplicates are linked to it instead, the duplicates are deleted
+    and the kept cuisines get their normalized name, which is unique.
+    Cuisines created before the normalized_name column have none, so the
+    command must run once after adding it. Everything happens in one
+    transaction.
+    """
+
+    help = 'Merges duplicate cuisines and fills their normalized names.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report the merges without writing them.')
+
+    def handle(self, *args, **options):
+        groups = {}
+        for cuisine in Cuisine.objects.order_by('pk').only('pk', 'name', 'normalized_name'):
+            groups.setdefault(normalize_cuisine(cuisine.name), []).append(cuisine)
+
+        duplicates = {}
+        for normalized_name, cuisines in groups.items():
+            for duplicate in cuisines[1:]:
+                duplicates[duplicate.pk] = cuisines[0].pk
+            if len(cuisines) > 1:
+                names = ', '.join(repr(cuisine.name) for cuisine in cuisines)
+                self.stdout.write(f'{normalized_name!r}: keeping #{cuisines[0].pk} of {names}')
+
+        through = Restaurant.cuisines.through
+        links = through.objects.filter(cuisine_id__in=duplicates).values_list('restaurant_id', 'cuisine_id')
+        rewired = {(restaurant_id, duplicates[cuisine_id]) for restaurant_id, cuisine_id in links}
+        self.stdout.write(f'{len(duplicates)} duplicate cuisines, {len(rewired)} restaurant links to move.')
+        if options['dry_run']:
+            return
+
+        kept = []
+        for normalized_name, cuisines in groups.items():
+            if cuisines[0].normalized_name != normalized_name:
+                cuisines[0].normalized_name = normalized_name
+                kept.append(cuisines[0])
+
+        with transaction.atomic():
+            through.objects.bulk_create(
+                [through(restaurant_id=restaurant_id, cuisine_id=cuisine_id) for restaurant_id, cuisine_id in rewired],
+                ignore_conflicts=True,
+            )
+            # Deleting the duplicates also deletes their links.
+            Cuisine.objects.filter(pk__in=duplicates).delete()
+            Cuisine.objects.bulk_update(kept, ['normalized_name'])
+            # The restaurants now list other cuisines.
+            Restaurant.objects.filter(pk__in={restaurant_id for restaurant_id, _ in rewired}).update(
+                content_version=models.F('content_version') + 1
+            )
+
+        Cuisine.objects.forget()
+        self.stdout.write(self.style.SUCCESS(
+            f'Merged {len(duplicates)} cuisines and normalized {len(kept)} names.'
+        ))
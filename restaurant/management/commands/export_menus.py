@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from restaurant.menu_io import FORMATS, export_rows
+from restaurant.models import Restaurant
+
+
+class Command(BaseCommand):
+    """
+    Exports restaurant menus as CSV or JSONL, in the format read by import_menus.
+    """
+
+    help = 'Streams restaurant menus to a CSV or JSONL file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', dest='file_format', choices=FORMATS, default='csv')
+        parser.add_argument('--output', help='File to write to instead of the standard output.')
+        parser.add_argument('--restaurant', type=int, action='append', dest='restaurants',
+                            help='Restaurant to export; may be repeated. Every restaurant by default.')
+
+    def handle(self, *args, **options):
+        restaurants = Restaurant.objects.all()
+        if options['restaurants']:
+            restaurants = restaurants.filter(pk__in=options['restaurants'])
+
+        if options['output']:
+            with open(options['output'], 'w', newline='') as output:
+                output.writelines(export_rows(restaurants, options['file_format']))
+        else:
+            for chunk in export_rows(restaurants, options['file_format']):
+                self.stdout.write(chunk, ending='')
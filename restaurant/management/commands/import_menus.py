@@ -0,0 +1,39 @@
+import json
+import sys
+from django.core.management.base import BaseCommand
+from restaurant.menu_io import FORMATS, IMPORT_BATCH_SIZE, MAX_REPORTED_ERRORS, MenuImporter
+
+
+class Command(BaseCommand):
+    """
+    Imports the menus of many restaurants from a CSV or JSONL file.
+
+    The file is read line by line and written in batches, one transaction
+    each, so it can be larger than the available memory. Items are matched
+    by restaurant and name: new items are created and existing ones
+    repriced. The report, with the first row errors, is printed as JSON.
+    """
+
+    help = 'Upserts menu items from a CSV or JSONL file, in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Menu file, or '-' for the standard input.")
+        parser.add_argument('--format', dest='file_format', choices=FORMATS,
+                            help='Format of the file; guessed from its extension by default.')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE, help='Rows written per transaction.')
+        parser.add_argument('--max-errors', type=int, default=MAX_REPORTED_ERRORS, help='Row errors listed in the report.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['file_format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        importer = MenuImporter(batch_size=options['batch_size'], max_errors=options['max_errors'])
+
+        if path == '-':
+            report = importer.run(sys.stdin.buffer, file_format)
+        else:
+            with open(path, 'rb') as menu_file:
+                report = importer.run(menu_file, file_format)
+
+        self.stdout.write(json.dumps(report, indent=2))
+        if report['error_count']:
+            self.stderr.write(self.style.WARNING(f"{report['error_count']} rows were rejected."))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from restaurant.status import StatusScheduler
+
+
+class Command(BaseCommand):
+    """
+    Keeps the open or closed status of the restaurants in line with their hours.
+
+    The command sleeps until the next restaurant opens or closes and flips
+    the statuses due at that instant in bulk, so restaurant_status can be
+    used to filter open restaurants. It runs until interrupted; with
+    --once, it only corrects the statuses that are wrong now and exits.
+    """
+
+    help = 'Opens and closes restaurants according to their opening hours.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Correct the statuses once and exit.')
+        parser.add_argument(
+            '--reload-seconds', type=float, default=300,
+            help='Seconds between two reloads of the opening hours.',
+        )
+
+    def handle(self, *args, **options):
+        scheduler = StatusScheduler(reload_seconds=options['reload_seconds'])
+        if options['once']:
+            corrected = scheduler.load()
+            self.stdout.write(self.style.SUCCESS(f'Corrected the status of {corrected} restaurants.'))
+            return
+
+        self.stdout.write('Scheduling restaurant statuses, press Ctrl+C to stop.')
+        try:
+            scheduler.run_forever(log=self.stdout.write)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,131 @@
+import threading
+import time
+from django.db import models, transaction
+from .suggestions import normalize_cuisine
+
+# Seconds after which the cuisine name cache is dropped, so that cuisines
+# merged or deleted by other processes are eventually forgotten.
+CUISINE_CACHE_MAX_AGE = 300
+
+
+class CuisineManager(models.Manager):
+    """
+    Manager resolving cuisine names through their normalized, unique form.
+
+    "Italian", "italian" and " ITALIAN " are one cuisine. The IDs of the
+    names already resolved are kept in a process-local cache, so looking up
+    a known cuisine does not query the database, and an unknown one is
+    looked up through the unique index on normalized_name. Resolving names
+    for a write checks the cached IDs with one query by primary key, since
+    dedupe_cuisines may have deleted them from another process.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._cache = {}
+        self._lock = threading.Lock()
+        self._loaded_at = time.monotonic()
+
+    def _cached(self, normalized_names):
+        with self._lock:
+            if time.monotonic() - self._loaded_at > CUISINE_CACHE_MAX_AGE:
+                self._cache.clear()
+                self._loaded_at = time.monotonic()
+            return {name: self._cache[name] for name in normalized_names if name in self._cache}
+
+    def _remember(self, cuisines):
+        def remember():
+            with self._lock:
+                self._cache.update(cuisines)
+
+        # Rows read or created by a transaction that rolls back must not be cached.
+        transaction.on_commit(remember, using=self.db)
+
+    def forget(self):
+        """
+        Empties the name cache of this process.
+        """
+        with self._lock:
+            self._cache.clear()
+            self._loaded_at = time.monotonic()
+
+    def lookup(self, names):
+        """
+        Finds the existing cuisines with the given names, in any case.
+
+        Args:
+            names (iterable): The cuisine names.
+
+        Returns:
+            dict: {normalized name: (cuisine ID, cuisine name)} of the names that exist.
+        """
+        normalized_names = {normalize_cuisine(name) for name in names}
+        found = self._cached(normalized_names)
+        missing = normalized_names - found.keys()
+        if missing:
+            rows = self.filter(normalized_name__in=missing).values_list('normalized_name', 'pk', 'name')
+            loaded = {normalized_name: (pk, name) for normalized_name, pk, name in rows}
+            self._remember(loaded)
+            found.update(loaded)
+        return found
+
+    def resolve(self, names):
+        """
+        Finds or creates the cuisines with the given names.
+
+        Args:
+            names (iterable): The cuisine names.
+
+        Returns:
+            dict: {name as given: cuisine ID}.
+        """
+        names = set(names)
+        cached = self._cached({normalize_cuisine(name) for name in names})
+        if cached:
+            # The IDs are about to be written, and other processes may have
+            # merged cuisines since they were cached: foreign keys are only
+            # checked at commit, too late to retry.
+            cached_ids = {pk for pk, _ in cached.values()}
+            if self.filter(pk__in=cached_ids).count() < len(cached_ids):
+                self.forget()
+        found = self.lookup(names)
+        missing = {}
+        for name in names:
+            normalized_name = normalize_cuisine(name)
+            if normalized_name not in found:
+                missing.setdefault(normalized_name, self.model(name=' '.join(name.split()), normalized_name=normalized_name))
+        if missing:
+            # Another process may create the same cuisines meanwhile.
+            self.bulk_create(missing.values(), ignore_conflicts=True)
+            rows = self.filter(normalized_name__in=missing).values_list('normalized_name', 'pk', 'name')
+            created = {normalized_name: (pk, name) for normalized_name, pk, name in rows}
+            self._remember(created)
+            found.update(created)
+        return {name: found[normalize_cuisine(name)][0] for name in names}
+
+    def get_or_create_normalized(self, name):
+        """
+        Returns the cuisine with a name, in any case, creating it if needed.
+
+        Args:
+            name (str): The cuisine name.
+
+        Returns:
+            Cuisine: The cuisine, with its stored name.
+        """
+        cuisine_id = self.resolve([name])[name]
+        _, stored_name = self.lookup([name])[normalize_cuisine(name)]
+        return self.model.from_db(self.db, ['id', 'name', 'normalized_name'], [cuisine_id, stored_name, normalize_cuisine(name)])
+
+
+class MenuManager(models.Manager):
+    """
+    Manager hiding the menu items removed from their menu.
+
+    A dish that was ordered is only marked as deleted when it is removed,
+    so that the order history keeps it. Order items still reach it through
+    the base manager, which does not hide it.
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().filter(is_deleted=False)
@@ -0,0 +1,253 @@
+import csv
+import json
+from django.db import models, transaction
+from rest_framework.exceptions import ValidationError
+from accounts.models import User
+from .models import Menu, Restaurant
+from .search import search_backend
+from .serializers import MenuImportRowSerializer
+
+CSV = 'csv'
+JSONL = 'jsonl'
+FORMATS = (CSV, JSONL)
+
+CONTENT_TYPES = {CSV: 'text/csv', JSONL: 'application/x-ndjson'}
+
+# Columns of an imported or exported menu file, in order.
+COLUMNS = ('restaurant_id', 'item', 'price')
+
+# Menu rows written per transaction by default.
+IMPORT_BATCH_SIZE = 1000
+
+# Row errors kept in an import report; further errors are only counted.
+MAX_REPORTED_ERRORS = 100
+
+# Menu rows written to an export stream per chunk.
+EXPORT_CHUNK_SIZE = 1000
+
+
+def read_lines(stream):
+    """
+    Reads a binary stream line by line, without loading it whole.
+
+    Args:
+        stream: A binary file-like object with readline(), such as an open
+            file or a Django request.
+
+    Yields:
+        str: The decoded lines, with their line endings and without a UTF-8 byte order mark.
+    """
+    first = True
+    for line in iter(stream.readline, b''):
+        text = line.decode('utf-8', errors='replace')
+        if first:
+            text = text.removeprefix('\ufeff')
+            first = False
+        yield text
+
+
+def read_rows(stream, file_format):
+    """
+    Parses a CSV or JSONL menu file incrementally.
+
+    Args:
+        stream: A binary file-like object with readline().
+        file_format (str): 'csv' (with a header row) or 'jsonl' (one object per line).
+
+    Yields:
+        tuple: (line number, row dict), the row being None when the line cannot be parsed.
+    """
+    lines = read_lines(stream)
+    if file_format == CSV:
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield line_number, row if isinstance(row, dict) else None
+
+
+class MenuImporter:
+    """
+    Upserts menu items read from a stream in fixed-size batches.
+
+    Rows are validated one by one and buffered until a batch is full. The
+    batch is then written in its own transaction: one query finds the
+    restaurants it may touch, one finds the existing items by restaurant
+    and name, and the new and repriced items are written with bulk_create
+    and bulk_update. Within a batch, the last row for an item wins. Only
+    the current batch and a bounded number of row errors are held in
+    memory, so memory use does not grow with the size of the file.
+
+    Attributes:
+        restaurants (QuerySet): The restaurants whose menus may be changed.
+        batch_size (int): Number of rows written per transaction.
+        max_errors (int): Number of row errors kept in the report.
+    """
+
+    def __init__(self, restaurants=None, batch_size=IMPORT_BATCH_SIZE, max_errors=MAX_REPORTED_ERRORS):
+        self.restaurants = restaurants if restaurants is not None else Restaurant.objects.all()
+        self.batch_size = batch_size
+        self.max_errors = max_errors
+        self.report = {'rows': 0, 'created': 0, 'updated': 0, 'unchanged': 0, 'error_count': 0, 'errors': []}
+        self._batch = {}
+        self._touched = set()
+        # One serializer validates every row, rather than building its fields per row.
+        self._row_serializer = MenuImportRowSerializer()
+
+    def error(self, line_number, errors):
+        self.report['error_count'] += 1
+        if len(self.report['errors']) < self.max_errors:
+            self.report['errors'].append({'line': line_number, 'errors': errors})
+
+    def run(self, stream, file_format):
+        """
+        Imports a whole menu file.
+
+        Args:
+            stream: A binary file-like object with readline().
+            file_format (str): 'csv' or 'jsonl'.
+
+        Returns:
+            dict: Counts of rows read, items created, updated and unchanged,
+            the number of invalid rows and the first of their errors.
+        """
+        for line_number, row in read_rows(stream, file_format):
+            self.report['rows'] += 1
+            if row is None:
+                self.error(line_number, {'non_field_errors': ['Invalid JSON object.']})
+                continue
+
+            try:
+                data = self._row_serializer.run_validation(row)
+            except ValidationError as exc:
+                self.error(line_number, exc.detail)
+                continue
+
+            key = (data['restaurant_id'], data['item'])
+            # Re-inserted so that the batch keeps the order of the last occurrences.
+            self._batch.pop(key, None)
+            self._batch[key] = (line_number, data['price'])
+            if len(self._batch) >= self.batch_size:
+                self.flush()
+
+        self.flush()
+        self.refresh_touched()
+        return self.report
+
+    def flush(self):
+        """
+        Writes the buffered rows.
+        """
+        batch, self._batch = self._batch, {}
+        if not batch:
+            return
+
+        with transaction.atomic():
+            allowed = set(self.restaurants.filter(pk__in={restaurant_id for restaurant_id, _ in batch})
+                          .values_list('pk', flat=True))
+            existing = {}
+            menu = Menu.objects.filter(restaurant_id__in=allowed, item__in={item for _, item in batch}).order_by('-pk')
+            for menu_item in menu:
+                # The oldest item of a name is the one the views update.
+                existing[(menu_item.restaurant_id, menu_item.item)] = menu_item
+
+            created, changed, touched = [], [], set()
+            for (restaurant_id, item), (line_number, price) in batch.items():
+                if restaurant_id not in allowed:
+                    self.error(line_number, {'restaurant_id': ['Unknown restaurant or not yours.']})
+                    continue
+                menu_item = existing.get((restaurant_id, item))
+                if menu_item is None:
+                    created.append(Menu(restaurant_id=restaurant_id, item=item, price=price))
+                elif menu_item.price != price:
+                    menu_item.price = price
+                    changed.append(menu_item)
+                else:
+                    self.report['unchanged'] += 1
+                    continue
+                touched.add(restaurant_id)
+
+            Menu.objects.bulk_create(created)
+            Menu.objects.bulk_update(changed, ['price'])
+            if touched:
+                Restaurant.objects.filter(pk__in=touched).update(content_version=models.F('content_version') + 1)
+
+        self.report['created'] += len(created)
+        self.report['updated'] += len(changed)
+        self._touched |= touched
+
+    def refresh_touched(self):
+        """
+        Reindexes the restaurants whose menu changed for the search.
+        """
+        backend = search_backend()
+        for restaurant in Restaurant.objects.filter(pk__in=self._touched).only('pk', 'restaurant_name').iterator():
+            backend.refresh(restaurant)
+
+
+def managed_restaurants(user):
+    """
+    Returns the restaurants whose menus a user may import or export.
+
+    Args:
+        user (User): The authenticated user.
+
+    Returns:
+        QuerySet: Every restaurant for admins, the user's own restaurant otherwise.
+    """
+    if user.role == User.ADMIN:
+        return Restaurant.objects.all()
+    return Restaurant.objects.filter(restaurant_manager=user)
+
+
+def export_rows(restaurants, file_format, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Streams the menus of restaurants as CSV or JSONL.
+
+    The rows are read with a server-side iterator and written in chunks,
+    so memory use does not grow with the size of the menus.
+
+    Args:
+        restaurants (QuerySet): The restaurants to export.
+        file_format (str): 'csv' or 'jsonl'.
+        chunk_size (int): Number of rows per yielded chunk.
+
+    Yields:
+        str: Chunks of the file, in the format read by MenuImporter.
+    """
+    rows = (Menu.objects.filter(restaurant__in=restaurants)
+            .order_by('restaurant_id', 'pk').values_list(*COLUMNS).iterator(chunk_size=chunk_size))
+
+    if file_format == CSV:
+        yield ','.join(COLUMNS) + '\r\n'
+        writer = csv.writer(_Buffer())
+        format_row = writer.writerow
+    else:
+        def format_row(row):
+            return json.dumps(dict(zip(COLUMNS, row))) + '\n'
+
+    chunk = []
+    for row in rows:
+        chunk.append(format_row(row))
+        if len(chunk) >= chunk_size:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+class _Buffer:
+    """
+    File-like object returning what is written, so csv.writer formats a single row.
+    """
+
+    def write(self, value):
+        return value
@@ -1,5 +1,13 @@
+from django.conf import settings
 from django.db import models
 from accounts.models import User
+from .index import restaurant_index
+from .managers import CuisineManager, MenuManager
+from .suggestions import normalize_cuisine
+
+# Seconds after which the restaurant index is reloaded from the database, so
+# that changes made by other worker processes are eventually picked up.
+RESTAURANT_INDEX_MAX_AGE = 300
 
 class Cuisine(models.Model):
     """
@@ -7,9 +15,21 @@ class Cuisine(models.Model):
 
     Attributes:
         name (str): The name of the cuisine.
+        normalized_name (str): The case-folded name, unique across cuisines.
     """
 
     name = models.CharField(max_length=100)
+    # Null until the dedupe_cuisines command has merged the rows created before this column.
+    normalized_name = models.CharField(max_length=100, unique=True, null=True, editable=False)
+
+    objects = CuisineManager()
+
+    def save(self, *args, **kwargs):
+        """
+        Saves the cuisine, keeping its normalized name in sync with its name.
+        """
+        self.normalized_name = normalize_cuisine(self.name)
+        super().save(*args, **kwargs)
 
     def __str__(self):
         """
@@ -32,12 +52,14 @@ class Restaurant(models.Model):
         cuisines (list): The cuisines offered by the restaurant.
         opening_time (Time): The opening time of the restaurant.
         closing_time (Time): The closing time of the restaurant.
+        time_zone (str): The IANA time zone of the opening hours.
         restaurant_address (str): The address of the restaurant.
         restaurant_state (str): The state where the restaurant is located.
         restaurant_city (str): The city where the restaurant is located.
         restaurant_pin_code (str): The pin code of the restaurant's location.
         latitude (float): The latitude of the restaurant's location.
         longitude (float): The longitude of the restaurant's location.
+        content_version (int): Counter bumped whenever the restaurant's details, cuisines or menu change.
     """
 
     OPENED = 1
@@ -51,6 +73,11 @@ class Restaurant(models.Model):
     class Meta:
         verbose_name = 'restaurant'
         verbose_name_plural = 'restaurants'
+        indexes = [
+            models.Index(fields=['latitude', 'longitude'], name='restaurant_location_idx'),
+            # Open-now lookups filter on the status kept by the status scheduler.
+            models.Index(fields=['restaurant_status'], name='restaurant_status_idx'),
+        ]
 
     restaurant_manager = models.OneToOneField(User, on_delete=models.CASCADE)
     restaurant_name = models.CharField(max_length=30, blank=False)
@@ -59,6 +86,7 @@ class Restaurant(models.Model):
     cuisines = models.ManyToManyField(Cuisine, blank=True)
     opening_time = models.TimeField()
     closing_time = models.TimeField()
+    time_zone = models.CharField(max_length=63, default=settings.TIME_ZONE)
 
     restaurant_address = models.CharField(max_length=250, blank=True, null=True)
     restaurant_state = models.CharField(max_length=15, blank=True, null=True)
@@ -68,6 +96,8 @@ class Restaurant(models.Model):
     latitude = models.DecimalField(max_digits=9, decimal_places=6)
     longitude = models.DecimalField(max_digits=9, decimal_places=6)
 
+    content_version = models.PositiveIntegerField(default=0, editable=False)
+
     def __str__(self):
         """
         Returns a string representation of the restaurant.
@@ -77,6 +107,81 @@ class Restaurant(models.Model):
         """
         return self.restaurant_name
 
+    @classmethod
+    def warm_location_index(cls):
+        """
+        Loads the locations of all restaurants into the restaurant index.
+        """
+        restaurant_index.load(cls.objects.values_list('pk', 'latitude', 'longitude'))
+
+    @classmethod
+    def nearest(cls, latitude, longitude, k, max_km, predicate=None):
+        """
+        Finds the k nearest restaurants within a maximum distance.
+
+        Args:
+            latitude (float): The latitude of the customer.
+            longitude (float): The longitude of the customer.
+            k (int): Maximum number of restaurants to return.
+            max_km (float): Maximum distance in kilometers.
+            predicate (callable): Optional filter called with each candidate restaurant ID.
+
+        Returns:
+            list: (distance, restaurant_id) tuples sorted nearest first.
+        """
+        if restaurant_index.is_stale(RESTAURANT_INDEX_MAX_AGE):
+            cls.warm_location_index()
+        return restaurant_index.nearest(latitude, longitude, k, max_km, predicate=predicate)
+
+    @classmethod
+    def nearest_open(cls, latitude, longitude, k, max_km, predicate=None):
+        """
+        Finds the k nearest open restaurants within a maximum distance.
+
+        The statuses are kept in the database by the status scheduler, so
+        the nearest candidates from the index are checked with one query on
+        the indexed status. More candidates are fetched only when too many
+        of them are closed.
+
+        Args:
+            latitude (float): The latitude of the customer.
+            longitude (float): The longitude of the customer.
+            k (int): Maximum number of restaurants to return.
+            max_km (float): Maximum distance in kilometers.
+            predicate (callable): Optional filter called with each candidate restaurant ID.
+
+        Returns:
+            list: (distance, restaurant_id) tuples sorted nearest first.
+        """
+        fetch = k
+        while True:
+            candidates = cls.nearest(latitude, longitude, fetch, max_km, predicate=predicate)
+            open_ids = set(
+                cls.objects.filter(pk__in=[restaurant_id for _, restaurant_id in candidates], restaurant_status=cls.OPENED)
+                .values_list('pk', flat=True)
+            )
+            nearest_open = [entry for entry in candidates if entry[1] in open_ids]
+            if len(nearest_open) >= k or len(candidates) < fetch:
+                return nearest_open[:k]
+            fetch *= 4
+
+    def bump_content_version(self):
+        """
+        Marks the restaurant as changed, so that cached copies and ETags are no longer used.
+
+        The counter is incremented in the database, so concurrent bumps are
+        never lost.
+        """
+        Restaurant.objects.filter(pk=self.pk).update(content_version=models.F('content_version') + 1)
+        self.refresh_from_db(fields=['content_version'])
+
+    def sync_location_index(self):
+        """
+        Reflects the restaurant's location in the restaurant index.
+        """
+        if restaurant_index.is_warm:
+            restaurant_index.update(self.pk, self.latitude, self.longitude)
+
 class Menu(models.Model):
     """
     Model for a menu item.
@@ -85,11 +190,16 @@ class Menu(models.Model):
         restaurant (Restaurant): The restaurant to which this menu item belongs.
         item (str): The name of the menu item.
         price (int): The price of the menu item.
+        is_deleted (bool): Indicates if the item was removed from the menu
+            after being ordered; such items are hidden by the default manager.
     """
 
     restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE)
     item = models.CharField(max_length=30)
     price = models.PositiveSmallIntegerField()
+    is_deleted = models.BooleanField(default=False, editable=False)
+
+    objects = MenuManager()
 
     def __str__(self):
         """
@@ -0,0 +1,553 @@
+import math
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+from collections import defaultdict
+import numpy as np
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, transaction
+
+# Seconds after which the in-memory search index is rebuilt from the
+# database, so that changes made by other worker processes are eventually
+# picked up and the incremental updates are compacted.
+SEARCH_INDEX_MAX_AGE = 300
+
+# Weight of a term occurrence in each field of a restaurant.
+FIELD_WEIGHTS = {'name': 3.0, 'cuisine': 2.0, 'menu': 1.0}
+
+# BM25 parameters.
+K1 = 1.2
+B = 0.75
+
+# Score multipliers of the terms a query word is expanded to.
+EXACT_WEIGHT = 1.0
+PREFIX_WEIGHT = 0.8
+FUZZY_WEIGHT = 0.6
+
+MAX_PREFIX_TERMS = 50
+MAX_FUZZY_TERMS = 10
+
+MEMORY = 'memory'
+FTS5 = 'fts5'
+
+_WORD = re.compile(r'\w+')
+
+
+def tokenize(text):
+    """
+    Splits text into normalized words.
+
+    Args:
+        text (str): The text to split.
+
+    Returns:
+        list: The words, case-folded and without diacritics.
+    """
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return _WORD.findall(text.casefold())
+
+
+def trigrams(term):
+    """
+    Returns the trigrams of a term, padded so that short terms have some.
+
+    The term is padded with a single space on each side: a second leading
+    space would add a trigram made of the first letter alone, which is
+    shared by a large part of the vocabulary and would make every fuzzy
+    lookup walk it.
+
+    Args:
+        term (str): The term.
+
+    Returns:
+        set: The term's trigrams.
+    """
+    padded = f' {term} '
+    return {padded[index:index + 3] for index in range(len(padded) - 2)}
+
+
+def edit_distance(first, second, limit):
+    """
+    Computes the optimal string alignment distance, giving up past a limit.
+
+    Args:
+        first (str): The first string.
+        second (str): The second string.
+        limit (int): The largest distance of interest.
+
+    Returns:
+        int: The distance, or limit + 1 if it exceeds the limit.
+    """
+    if abs(len(first) - len(second)) > limit:
+        return limit + 1
+    previous_previous = None
+    previous = list(range(len(second) + 1))
+    for i in range(1, len(first) + 1):
+        current = [i] + [0] * len(second)
+        for j in range(1, len(second) + 1):
+            cost = first[i - 1] != second[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (i > 1 and j > 1 and first[i - 1] == second[j - 2] and first[i - 2] == second[j - 1]):
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous_previous, previous = previous, current
+    return previous[-1]
+
+
+def single_edits(word, alphabet):
+    """
+    Returns the strings one edit away from a word.
+
+    Args:
+        word (str): The word.
+        alphabet (iterable): The characters that may be inserted or substituted.
+
+    Returns:
+        set: The strings one deletion, insertion, substitution or adjacent
+        transposition away from the word.
+    """
+    splits = [(word[:index], word[index:]) for index in range(len(word) + 1)]
+    edits = {left + right[1:] for left, right in splits if right}
+    edits.update(left + right[1] + right[0] + right[2:] for left, right in splits if len(right) > 1)
+    for char in alphabet:
+        edits.update(left + char + right[1:] for left, right in splits if right)
+        edits.update(left + char + right for left, right in splits)
+    edits.discard(word)
+    return edits
+
+
+def restaurant_fields(restaurant_name, cuisines, items):
+    """
+    Weighs the words of a restaurant's searchable fields.
+
+    Args:
+        restaurant_name (str): The restaurant's name.
+        cuisines (iterable): The names of the restaurant's cuisines.
+        items (iterable): The names of the restaurant's menu items.
+
+    Returns:
+        tuple: ({term: weighted frequency}, weighted length) of the restaurant.
+    """
+    frequencies = defaultdict(float)
+    for field, texts in (('name', [restaurant_name]), ('cuisine', cuisines), ('menu', items)):
+        weight = FIELD_WEIGHTS[field]
+        for text in texts:
+            for term in tokenize(text):
+                frequencies[term] += weight
+    return frequencies, sum(frequencies.values())
+
+
+class RestaurantSearchIndex:
+    """
+    In-process full-text index of restaurants, their cuisines and menu items.
+
+    Each restaurant is one document whose words are weighted by field
+    (name, cuisine, menu item) and ranked with BM25. Query words are
+    expanded to the indexed terms they are a prefix of and, through a
+    trigram index over the vocabulary, to the terms within one or two
+    typos, so "biriyani" and "piz" still find "biryani" and "pizza".
+
+    The postings of a full load are stored as NumPy arrays so that scoring
+    a term costs a few vector operations however many restaurants contain
+    it. Restaurants refreshed afterwards are masked out of those arrays and
+    kept in small per-term overlays until the next full load compacts them.
+
+    Attributes:
+        loaded_at (float): Monotonic time of the last full load, or None while cold.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.loaded_at = None
+        self._reset()
+
+    def _reset(self):
+        self._slot_of = {}
+        self._pks = []
+        self._lengths = np.zeros(0, dtype=np.float32)
+        self._live = np.zeros(0, dtype=bool)
+        self._base = {}
+        self._overlay = defaultdict(dict)
+        self._terms_of = {}
+        self._stale = set()
+        self._stale_slots = np.zeros(0, dtype=np.int32)
+        self._vocabulary = set()
+        self._sorted_vocabulary = []
+        self._trigram_terms = defaultdict(set)
+        self._trigram_counts = {}
+        self._alphabet = set()
+        self._total_length = 0.0
+
+    def is_stale(self, max_age=SEARCH_INDEX_MAX_AGE):
+        """
+        Checks whether the index is cold or was loaded too long ago.
+
+        Args:
+            max_age (float): Maximum age in seconds, or None to never expire.
+
+        Returns:
+            bool: True if the index should be reloaded, False otherwise.
+        """
+        if self.loaded_at is None:
+            return True
+        return max_age is not None and time.monotonic() - self.loaded_at > max_age
+
+    def _slot(self, pk):
+        slot = self._slot_of.get(pk)
+        if slot is None:
+            slot = self._slot_of[pk] = len(self._pks)
+            self._pks.append(pk)
+            if slot >= len(self._lengths):
+                capacity = max(1024, 2 * len(self._lengths))
+                self._lengths = np.resize(self._lengths, capacity)
+                self._live = np.resize(self._live, capacity)
+                self._lengths[slot:] = 0
+                self._live[slot:] = False
+        return slot
+
+    def _add_terms(self, terms):
+        new_terms = [term for term in terms if term not in self._vocabulary]
+        if not new_terms:
+            return
+        self._vocabulary.update(new_terms)
+        for term in new_terms:
+            self._alphabet.update(term)
+            term_trigrams = trigrams(term)
+            self._trigram_counts[term] = len(term_trigrams)
+            for trigram in term_trigrams:
+                self._trigram_terms[trigram].add(term)
+        self._sorted_vocabulary = None
+
+    def load(self):
+        """
+        Rebuilds the whole index from the database.
+        """
+        from .models import Menu, Restaurant
+
+        documents = {}
+        for pk, restaurant_name in Restaurant.objects.values_list('pk', 'restaurant_name').iterator(chunk_size=10000):
+            documents[pk] = [restaurant_name, [], []]
+        cuisines = Restaurant.cuisines.through.objects.values_list('restaurant_id', 'cuisine__name')
+        for restaurant_id, name in cuisines.iterator(chunk_size=10000):
+            if restaurant_id in documents:
+                documents[restaurant_id][1].append(name)
+        for restaurant_id, item in Menu.objects.values_list('restaurant_id', 'item').iterator(chunk_size=10000):
+            if restaurant_id in documents:
+                documents[restaurant_id][2].append(item)
+
+        with self._lock:
+            self._reset()
+            postings = defaultdict(lambda: ([], []))
+            for pk, (restaurant_name, cuisine_names, items) in documents.items():
+                frequencies, length = restaurant_fields(restaurant_name, cuisine_names, items)
+                slot = self._slot(pk)
+                self._lengths[slot] = length
+                self._live[slot] = True
+                self._total_length += length
+                self._terms_of[slot] = tuple(frequencies)
+                for term, frequency in frequencies.items():
+                    slots, values = postings[term]
+                    slots.append(slot)
+                    values.append(frequency)
+
+            self._base = {
+                term: (np.array(slots, dtype=np.int32), np.array(values, dtype=np.float32))
+                for term, (slots, values) in postings.items()
+            }
+            self._add_terms(self._base)
+            self.loaded_at = time.monotonic()
+
+    def refresh(self, restaurant):
+        """
+        Reindexes one restaurant after its name, cuisines or menu changed.
+
+        Args:
+            restaurant (Restaurant): The restaurant.
+        """
+        if self.loaded_at is None:
+            return
+
+        cuisine_names = list(restaurant.cuisines.values_list('name', flat=True))
+        items = list(restaurant.menu_set.values_list('item', flat=True))
+        frequencies, length = restaurant_fields(restaurant.restaurant_name, cuisine_names, items)
+
+        with self._lock:
+            slot = self._slot(restaurant.pk)
+            if self._live[slot]:
+                self._total_length -= float(self._lengths[slot])
+            for term in self._terms_of.get(slot, ()):
+                self._overlay[term].pop(slot, None)
+
+            if slot not in self._stale:
+                self._stale.add(slot)
+                self._stale_slots = np.array(sorted(self._stale), dtype=np.int32)
+
+            for term, frequency in frequencies.items():
+                self._overlay[term][slot] = frequency
+            self._terms_of[slot] = tuple(frequencies)
+            self._lengths[slot] = length
+            self._live[slot] = True
+            self._total_length += length
+            self._add_terms(frequencies)
+
+    def expand(self, word):
+        """
+        Finds the indexed terms a query word may stand for.
+
+        Args:
+            word (str): A normalized query word.
+
+        Returns:
+            dict: {term: weight} of the matching terms.
+        """
+        expansions = {}
+        if word in self._vocabulary:
+            expansions[word] = EXACT_WEIGHT
+
+        if self._sorted_vocabulary is None:
+            self._sorted_vocabulary = sorted(self._vocabulary)
+        position = bisect_left(self._sorted_vocabulary, word)
+        for term in self._sorted_vocabulary[position:position + MAX_PREFIX_TERMS + 1]:
+            if not term.startswith(word):
+                break
+            expansions.setdefault(term, PREFIX_WEIGHT)
+
+        if 4 <= len(word) <= 6:
+            # Short words share too few trigrams with their typos for the
+            # prefilter, so their single edits are looked up directly.
+            fuzzy = sorted(
+                term for term in single_edits(word, self._alphabet)
+                if term in self._vocabulary and term not in expansions
+            )
+            for term in fuzzy[:MAX_FUZZY_TERMS]:
+                expansions[term] = FUZZY_WEIGHT
+        elif len(word) > 6:
+            limit = 2
+            word_trigrams = trigrams(word)
+            shared = defaultdict(int)
+            for trigram in word_trigrams:
+                for term in self._trigram_terms.get(trigram, ()):
+                    shared[term] += 1
+            # Dice coefficient over trigrams as a cheap prefilter of the edit distance.
+            candidates = sorted(
+                (2 * count / (len(word_trigrams) + self._trigram_counts[term]), term) for term, count in shared.items()
+                if abs(len(term) - len(word)) <= limit and term not in expansions
+            )
+            fuzzy = 0
+            for similarity, term in reversed(candidates):
+                if similarity < 0.3 or fuzzy >= MAX_FUZZY_TERMS:
+                    break
+                if edit_distance(word, term, limit) <= limit:
+                    expansions[term] = FUZZY_WEIGHT
+                    fuzzy += 1
+        return expansions
+
+    def _postings(self, term):
+        slots, values = self._base.get(term, (None, None))
+        if slots is not None and len(self._stale_slots):
+            keep = ~np.isin(slots, self._stale_slots, assume_unique=True)
+            slots, values = slots[keep], values[keep]
+        overlay = self._overlay.get(term)
+        if overlay:
+            overlay_slots = np.fromiter(overlay.keys(), dtype=np.int32, count=len(overlay))
+            overlay_values = np.fromiter(overlay.values(), dtype=np.float32, count=len(overlay))
+            if slots is None:
+                return overlay_slots, overlay_values
+            return np.concatenate([slots, overlay_slots]), np.concatenate([values, overlay_values])
+        return slots, values
+
+    def search(self, query, limit=20):
+        """
+        Ranks the restaurants matching a text query.
+
+        Each query word contributes the best BM25 score among the terms it
+        expands to, and the total is scaled by the share of the query words
+        the restaurant matched.
+
+        Args:
+            query (str): The text typed by the customer.
+            limit (int): Maximum number of restaurants to return.
+
+        Returns:
+            tuple: ([(score, restaurant_id)] best first, set of the matched terms).
+        """
+        if self.is_stale():
+            self.load()
+
+        words = list(dict.fromkeys(tokenize(query)))
+        if not words:
+            return [], set()
+
+        with self._lock:
+            documents = len(self._slot_of)
+            if not documents:
+                return [], set()
+            average_length = self._total_length / documents or 1.0
+            total = np.zeros(len(self._pks), dtype=np.float32)
+            matched = np.zeros(len(self._pks), dtype=np.float32)
+            matched_terms = set()
+
+            for word in words:
+                best = np.zeros(len(self._pks), dtype=np.float32)
+                for term, weight in self.expand(word).items():
+                    slots, frequencies = self._postings(term)
+                    if slots is None or not len(slots):
+                        continue
+                    matched_terms.add(term)
+                    idf = math.log(1 + (documents - len(slots) + 0.5) / (len(slots) + 0.5))
+                    norm = K1 * (1 - B + B * self._lengths[slots] / average_length)
+                    scores = weight * idf * frequencies * (K1 + 1) / (frequencies + norm)
+                    best[slots] = np.maximum(best[slots], scores)
+                total += best
+                matched += best > 0
+
+            scores = total * (matched / len(words))
+            candidates = np.flatnonzero(scores)
+            if len(candidates) > limit:
+                candidates = candidates[np.argpartition(-scores[candidates], limit - 1)[:limit]]
+            ranked = sorted(((float(scores[slot]), self._pks[slot]) for slot in candidates), key=lambda hit: -hit[0])
+        return ranked, matched_terms
+
+    def item_matcher(self, matched_terms):
+        """
+        Builds a filter of the menu items that contributed to a search.
+
+        Args:
+            matched_terms (set): The terms returned by search().
+
+        Returns:
+            callable: Returns True for the item names containing a matched term.
+        """
+        return lambda text: any(term in matched_terms for term in tokenize(text))
+
+
+class Fts5Search:
+    """
+    SQLite FTS5 backend of the restaurant search.
+
+    Restaurants are stored in an FTS5 virtual table with one column per
+    field and ranked with FTS5's bm25(), weighted like the in-memory index.
+    Every query word is matched as a prefix; unlike the in-memory index,
+    misspelled words are not corrected. The table lives outside the Django
+    models and is filled by the rebuild_search_index command.
+    """
+
+    table = 'restaurant_search'
+
+    def __init__(self):
+        self._table_ready = False
+
+    def _check(self):
+        if connection.vendor != 'sqlite':
+            raise ImproperlyConfigured('The fts5 restaurant search backend requires SQLite.')
+
+    def ensure_table(self):
+        """
+        Creates the FTS5 table if it does not exist yet.
+
+        The statement runs once per process; afterwards the table is known to exist.
+        """
+        if self._table_ready:
+            return
+        self._check()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING fts5("
+                f"restaurant_id UNINDEXED, name, cuisines, menu, tokenize='unicode61 remove_diacritics 2')"
+            )
+        self._table_ready = True
+
+    def _rows(self, restaurants):
+        for restaurant in restaurants:
+            cuisines = ' '.join(cuisine.name for cuisine in restaurant.cuisines.all())
+            menu = ' '.join(item.item for item in restaurant.menu_set.all())
+            yield restaurant.pk, restaurant.restaurant_name, cuisines, menu
+
+    def load(self):
+        """
+        Rebuilds the FTS5 table from the database.
+        """
+        from .models import Restaurant
+
+        self.ensure_table()
+        restaurants = Restaurant.objects.prefetch_related('cuisines', 'menu_set').only('pk', 'restaurant_name')
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table}")
+            cursor.executemany(
+                f"INSERT INTO {self.table} (restaurant_id, name, cuisines, menu) VALUES (%s, %s, %s, %s)",
+                self._rows(restaurants.iterator(chunk_size=2000)),
+            )
+
+    def refresh(self, restaurant):
+        """
+        Reindexes one restaurant after its name, cuisines or menu changed.
+
+        Args:
+            restaurant (Restaurant): The restaurant.
+        """
+        self.ensure_table()
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE restaurant_id = %s", [restaurant.pk])
+            cursor.executemany(
+                f"INSERT INTO {self.table} (restaurant_id, name, cuisines, menu) VALUES (%s, %s, %s, %s)",
+                self._rows([restaurant]),
+            )
+
+    def search(self, query, limit=20):
+        """
+        Ranks the restaurants matching a text query.
+
+        Args:
+            query (str): The text typed by the customer.
+            limit (int): Maximum number of restaurants to return.
+
+        Returns:
+            tuple: ([(score, restaurant_id)] best first, set of the query words).
+        """
+        words = list(dict.fromkeys(tokenize(query)))
+        if not words:
+            return [], set()
+
+        self.ensure_table()
+        match = ' OR '.join(f'"{word}"*' for word in words)
+        weights = ', '.join(str(FIELD_WEIGHTS[field]) for field in ('name', 'cuisine', 'menu'))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT restaurant_id, -bm25({self.table}, 0, {weights}) AS score FROM {self.table} "
+                f"WHERE {self.table} MATCH %s ORDER BY score DESC LIMIT %s",
+                [match, limit],
+            )
+            return [(score, restaurant_id) for restaurant_id, score in cursor.fetchall()], set(words)
+
+    def item_matcher(self, words):
+        """
+        Builds a filter of the menu items that contributed to a search.
+
+        Args:
+            words (set): The query words returned by search().
+
+        Returns:
+            callable: Returns True for the item names with a word starting with a query word.
+        """
+        return lambda text: any(term.startswith(word) for term in tokenize(text) for word in words)
+
+
+search_index = RestaurantSearchIndex()
+fts5_search = Fts5Search()
+
+
+def search_backend():
+    """
+    Returns the search backend selected by the RESTAURANT_SEARCH_BACKEND setting.
+
+    Returns:
+        RestaurantSearchIndex or Fts5Search: The backend.
+    """
+    if getattr(settings, 'RESTAURANT_SEARCH_BACKEND', MEMORY) == FTS5:
+        return fts5_search
+    return search_index
@@ -1,7 +1,15 @@
+from zoneinfo import available_timezones
+from django.db import transaction
+from django.utils import timezone
 from rest_framework import serializers
 from .models import Restaurant, Cuisine, Menu
+from .status import status_at
 from rider.serializers import NearestRiderSerializer
 
+# Listing the time zones scans the tz database, so it is done once.
+TIME_ZONES = frozenset(available_timezones())
+
+
 class CuisineSerializer(serializers.ModelSerializer):
     """Serializer for Cuisine model."""
 
@@ -47,7 +55,7 @@ class MenuSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Menu
-        fields = '__all__'
+        exclude = ('is_deleted',)
 
 
 class RestaurantSerializer(serializers.ModelSerializer):
@@ -61,16 +69,40 @@ class RestaurantSerializer(serializers.ModelSerializer):
     """
     
     cuisines = CuisineSerializer(many=True, required=False)
-    menu = MenuSerializer(many=True, required=False)
+    # Nested items belong to the restaurant being written, so they do not name it.
+    menu = MenuSerializer(many=True, required=False, included_fields=['item', 'price'])
+
+    # Fields a manager can change; the manager and the status are kept.
+    updatable_fields = (
+        'restaurant_name', 'restaurant_phone', 'opening_time', 'closing_time', 'restaurant_address',
+        'restaurant_state', 'restaurant_city', 'restaurant_pin_code', 'latitude', 'longitude', 'time_zone',
+    )
 
     class Meta:
         model = Restaurant
         fields = '__all__'
 
+    def validate_time_zone(self, value):
+        """
+        Checks that the time zone is a known IANA name.
+
+        Args:
+            value (str): The time zone name.
+
+        Returns:
+            str: The time zone name.
+        """
+        if value not in TIME_ZONES:
+            raise serializers.ValidationError('Unknown time zone.')
+        return value
+
     def create(self, validated_data):
         """
         Create a new restaurant instance.
 
+        The cuisines are resolved and attached and the menu is inserted with
+        a constant number of queries, in one transaction.
+
         Args:
             validated_data (dict): Validated data for creating the restaurant.
 
@@ -82,16 +114,30 @@ class RestaurantSerializer(serializers.ModelSerializer):
         cuisines_data = validated_data.pop('cuisines', [])
         menu_data = validated_data.pop('menu', [])
 
-        restaurant = Restaurant.objects.create(**validated_data)
-
-        # Handle cuisines if provided
-        for cuisine_data in cuisines_data:
-            cuisine, created = Cuisine.objects.get_or_create(**cuisine_data)
-            restaurant.cuisines.add(cuisine)
-
-        # Handle menu items if provided
-        for menu_item_data in menu_data:
-            Menu.objects.create(restaurant=restaurant, **menu_item_data)
+        if 'restaurant_status' not in validated_data:
+            validated_data['restaurant_status'] = status_at(
+                validated_data['opening_time'],
+                validated_data['closing_time'],
+                validated_data.get('time_zone', Restaurant._meta.get_field('time_zone').default),
+                timezone.now(),
+            )
+
+        with transaction.atomic():
+            restaurant = Restaurant.objects.create(**validated_data)
+
+            if cuisines_data:
+                # Names differing only in case resolve to the same cuisine.
+                cuisine_ids = set(Cuisine.objects.resolve(cuisine_data['name'] for cuisine_data in cuisines_data).values())
+                through = Restaurant.cuisines.through
+                through.objects.bulk_create([
+                    through(restaurant_id=restaurant.pk, cuisine_id=cuisine_id) for cuisine_id in cuisine_ids
+                ])
+
+            if menu_data:
+                # Same rule as on update: the last of several items with the same name wins.
+                wanted = {menu_item_data['item']: menu_item_data for menu_item_data in menu_data}
+                Menu.objects.bulk_create([Menu(restaurant=restaurant, **menu_item_data) for menu_item_data in wanted.values()])
+                restaurant.bump_content_version()
 
         return restaurant
     
@@ -99,6 +145,12 @@ class RestaurantSerializer(serializers.ModelSerializer):
         """
         Update an existing restaurant instance.
 
+        Cuisines and menu items are only changed when they are sent, and then
+        replaced by the sent ones through a diff against the existing rows:
+        menu items are matched by name, so unchanged items keep their primary
+        key. The number of queries does not depend on the number of cuisines
+        or menu items, and the whole update is one transaction.
+
         Args:
             instance (Restaurant): The existing restaurant instance to update.
             validated_data (dict): Validated data for updating the restaurant.
@@ -107,35 +159,93 @@ class RestaurantSerializer(serializers.ModelSerializer):
             Restaurant: The updated restaurant instance.
 
         """
-        
-        instance.restaurant_name = validated_data.get('restaurant_name', instance.restaurant_name)
-        instance.restaurant_phone = validated_data.get('restaurant_phone', instance.restaurant_phone)
-        instance.opening_time = validated_data.get('opening_time', instance.opening_time)
-        instance.closing_time = validated_data.get('closing_time', instance.closing_time)
-        instance.restaurant_address = validated_data.get('restaurant_address', instance.restaurant_address)
-        instance.restaurant_state = validated_data.get('restaurant_state', instance.restaurant_state)
-        instance.restaurant_city = validated_data.get('restaurant_city', instance.restaurant_city)
-        instance.restaurant_pin_code = validated_data.get('restaurant_pin_code', instance.restaurant_pin_code)
-        instance.latitude = validated_data.get('latitude', instance.latitude)
-        instance.longitude = validated_data.get('longitude', instance.longitude)
-
-        cuisines_data = validated_data.get('cuisines', [])
-        menu_data = validated_data.get('menu', [])
-        
-        # Handle cuisines update and addition
-        instance.cuisines.clear()
-        for cuisine_data in cuisines_data:
-            cuisine, created = Cuisine.objects.get_or_create(**cuisine_data)
-            instance.cuisines.add(cuisine)
-
-        # Handle menu items update
-        Menu.objects.filter(restaurant=instance).delete()
-        for menu_item_data in menu_data:
-            Menu.objects.create(restaurant=instance, **menu_item_data)
-
-        instance.save()
+
+        cuisines_data = validated_data.pop('cuisines', None)
+        menu_data = validated_data.pop('menu', None)
+
+        with transaction.atomic():
+            changed = [field for field in self.updatable_fields if field in validated_data]
+            for field in changed:
+                setattr(instance, field, validated_data[field])
+            if validated_data.keys() & {'opening_time', 'closing_time', 'time_zone'}:
+                # The status scheduler only looks at the hours every few minutes.
+                instance.restaurant_status = status_at(
+                    instance.opening_time, instance.closing_time, instance.time_zone, timezone.now()
+                )
+                changed.append('restaurant_status')
+            # Only the sent fields are written: content_version is bumped in the
+            # database, and writing back the value read earlier would undo
+            # concurrent bumps.
+            instance.save(update_fields=changed)
+
+            if cuisines_data is not None:
+                self._sync_cuisines(instance, cuisines_data)
+            if menu_data is not None:
+                self._sync_menu(instance, menu_data)
+
+            instance.bump_content_version()
         return instance
 
+    def _sync_cuisines(self, instance, cuisines_data):
+        """
+        Replaces the cuisines of a restaurant, only writing the differences.
+
+        Args:
+            instance (Restaurant): The restaurant.
+            cuisines_data (list): The validated cuisines to keep.
+        """
+        wanted = set(Cuisine.objects.resolve(cuisine_data['name'] for cuisine_data in cuisines_data).values())
+        through = Restaurant.cuisines.through
+        current = set(through.objects.filter(restaurant=instance).values_list('cuisine_id', flat=True))
+
+        if current - wanted:
+            through.objects.filter(restaurant=instance, cuisine_id__in=current - wanted).delete()
+        through.objects.bulk_create([
+            through(restaurant_id=instance.pk, cuisine_id=cuisine_id) for cuisine_id in wanted - current
+        ])
+
+    def _sync_menu(self, instance, menu_data):
+        """
+        Replaces the menu of a restaurant, only writing the differences.
+
+        Args:
+            instance (Restaurant): The restaurant.
+            menu_data (list): The validated menu items to keep; the last of
+                several items with the same name wins.
+        """
+        wanted = {menu_item_data['item']: menu_item_data for menu_item_data in menu_data}
+
+        existing, removed = {}, []
+        for menu_item in Menu.objects.filter(restaurant=instance).order_by('pk'):
+            if menu_item.item in wanted and menu_item.item not in existing:
+                existing[menu_item.item] = menu_item
+            else:
+                removed.append(menu_item.pk)
+
+        changed = []
+        for name, menu_item in existing.items():
+            price = wanted[name]['price']
+            if menu_item.price != price:
+                menu_item.price = price
+                changed.append(menu_item)
+
+        if removed:
+            removed_items = Menu.objects.filter(pk__in=removed)
+            # Ordered dishes are kept for the order history and only hidden.
+            removed_items.filter(orderitem__isnull=False).update(is_deleted=True)
+            # Nothing references the other ones, so they are deleted in one
+            # statement instead of through the collector's batches.
+            removed_items.filter(orderitem__isnull=True)._raw_delete(removed_items.db)
+        Menu.objects.bulk_update(changed, ['price'])
+        Menu.objects.bulk_create([
+            Menu(restaurant=instance, **menu_item_data)
+            for name, menu_item_data in wanted.items() if name not in existing
+        ])
+
+
+# Fields a restaurant suggestion can return; all of them by default.
+SUGGESTION_FIELDS = ('id', 'restaurant_name', 'latitude', 'longitude', 'restaurant_status', 'cuisines')
+
 
 class RestaurantSuggestionSerializer(serializers.Serializer):
     """
@@ -148,10 +258,144 @@ class RestaurantSuggestionSerializer(serializers.Serializer):
     Attributes:
         kind_of_food (str): The kind of food desired.
         desired_time (datetime.time): The desired time for the suggestion.
+        after (int): Optional ID of the last restaurant of the previous page.
+        limit (int): The maximum number of restaurants to return.
+        fields (list): Optional comma-separated subset of SUGGESTION_FIELDS to return.
 
     """
 
     kind_of_food = serializers.CharField()
     desired_time = serializers.TimeField()
+    after = serializers.IntegerField(min_value=0, required=False)
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=20)
+    fields = serializers.CharField(required=False)
+
+    def validate_fields(self, value):
+        """
+        Splits the requested fields and checks that they can be returned.
+
+        Args:
+            value (str): Comma-separated field names.
+
+        Returns:
+            list: The field names, in the order of SUGGESTION_FIELDS.
+        """
+        requested = {name.strip() for name in value.split(',') if name.strip()}
+        unknown = requested.difference(SUGGESTION_FIELDS)
+        if unknown:
+            raise serializers.ValidationError(f'Unknown fields: {", ".join(sorted(unknown))}.')
+        if not requested:
+            raise serializers.ValidationError('At least one field is required.')
+        return [name for name in SUGGESTION_FIELDS if name in requested]
+
+
+# Deepest page of the nearby search; every page ranks all the restaurants before it.
+MAX_NEARBY_PAGE = 50
+
+
+class NearbyRestaurantQuerySerializer(serializers.Serializer):
+    """
+    Serializer for the query parameters of the nearby restaurant search.
+
+    Attributes:
+        latitude (float): The latitude of the customer.
+        longitude (float): The longitude of the customer.
+        radius_km (float): The search radius in kilometers.
+        cuisine (str): Optional cuisine the restaurants must serve.
+        open_now (bool): Only return restaurants open at the current time.
+        page (int): The page number, from 1 to MAX_NEARBY_PAGE.
+        page_size (int): The number of restaurants per page.
+    """
+
+    latitude = serializers.FloatField(min_value=-90, max_value=90)
+    longitude = serializers.FloatField(min_value=-180, max_value=180)
+    radius_km = serializers.FloatField(min_value=0, max_value=50, default=5)
+    cuisine = serializers.CharField(required=False)
+    open_now = serializers.BooleanField(default=False)
+    page = serializers.IntegerField(min_value=1, max_value=MAX_NEARBY_PAGE, default=1)
+    page_size = serializers.IntegerField(min_value=1, max_value=100, default=20)
+
 
+class NearbyRestaurantSerializer(serializers.ModelSerializer):
+    """
+    Serializer for a restaurant found by the nearby search.
+
+    Attributes:
+        distance_km (float): The distance from the customer in kilometers.
+        Meta (class): Metadata options for the serializer.
+    """
+
+    distance_km = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Restaurant
+        fields = [
+            'id', 'restaurant_name', 'restaurant_phone', 'restaurant_status', 'opening_time', 'closing_time',
+            'restaurant_address', 'restaurant_city', 'latitude', 'longitude', 'distance_km',
+        ]
+
+    def get_distance_km(self, obj):
+        """
+        Returns the distance of the restaurant from the customer.
+
+        Args:
+            obj (Restaurant): The Restaurant object.
+
+        Returns:
+            float: The distance in kilometers.
+        """
+        return round(obj.distance, 3)
+
+
+class RestaurantSearchQuerySerializer(serializers.Serializer):
+    """
+    Serializer for the query parameters of the restaurant search.
+
+    Attributes:
+        q (str): The text typed by the customer.
+        limit (int): The maximum number of restaurants to return.
+    """
+
+    q = serializers.CharField(max_length=200)
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=20)
+
+
+class MenuImportRowSerializer(serializers.Serializer):
+    """
+    Serializer for a row of an imported menu file.
+
+    Attributes:
+        restaurant_id (int): The ID of the restaurant the item belongs to.
+        item (str): The name of the menu item.
+        price (int): The price of the menu item.
+    """
+
+    restaurant_id = serializers.IntegerField(min_value=1)
+    item = serializers.CharField(max_length=30)
+    price = serializers.IntegerField(min_value=0, max_value=32767)
+
+
+class MenuImportQuerySerializer(serializers.Serializer):
+    """
+    Serializer for the query parameters of a menu import.
+
+    Attributes:
+        file_format (str): The format of the request body, 'csv' or 'jsonl'.
+        batch_size (int): The number of rows written per transaction.
+    """
+
+    file_format = serializers.ChoiceField(choices=['csv', 'jsonl'], default='csv')
+    batch_size = serializers.IntegerField(min_value=1, max_value=10000, default=1000)
+
+
+class MenuExportQuerySerializer(serializers.Serializer):
+    """
+    Serializer for the query parameters of a menu export.
+
+    Attributes:
+        file_format (str): The format of the export, 'csv' or 'jsonl'.
+        restaurant_id (int): Optional restaurant to export the menu of.
+    """
 
+    file_format = serializers.ChoiceField(choices=['csv', 'jsonl'], default='csv')
+    restaurant_id = serializers.IntegerField(min_value=1, required=False)
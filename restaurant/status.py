@@ -0,0 +1,192 @@
+import heapq
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from django.db import models
+from .hours import is_open_at
+from .models import Restaurant
+
+# Days searched ahead for the next opening or closing of a restaurant.
+BOUNDARY_SEARCH_DAYS = 3
+
+
+def zone(name):
+    """
+    Returns a time zone by name, falling back to UTC for unknown names.
+
+    Args:
+        name (str): The IANA time zone name.
+
+    Returns:
+        ZoneInfo: The time zone.
+    """
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return ZoneInfo('UTC')
+
+
+def status_at(opening_time, closing_time, time_zone, now):
+    """
+    Computes the status of a restaurant at an instant.
+
+    Args:
+        opening_time (time): The opening time.
+        closing_time (time): The closing time.
+        time_zone (str): The restaurant's time zone.
+        now (datetime): The aware instant.
+
+    Returns:
+        int: Restaurant.OPENED or Restaurant.CLOSED.
+    """
+    local_time = now.astimezone(zone(time_zone)).time().replace(tzinfo=None)
+    return Restaurant.OPENED if is_open_at(opening_time, closing_time, local_time) else Restaurant.CLOSED
+
+
+def next_boundary(opening_time, closing_time, time_zone, now):
+    """
+    Finds the next time a restaurant opens or closes.
+
+    The boundaries are placed on the restaurant's local calendar, so they
+    follow daylight saving time changes.
+
+    Args:
+        opening_time (time): The opening time.
+        closing_time (time): The closing time.
+        time_zone (str): The restaurant's time zone.
+        now (datetime): The aware instant to search from.
+
+    Returns:
+        tuple: (aware UTC datetime, status from then on), or None for a
+        restaurant open around the clock.
+    """
+    if opening_time == closing_time:
+        return None
+
+    tz = zone(time_zone)
+    today = now.astimezone(tz).date()
+    boundaries = []
+    for offset in range(-1, BOUNDARY_SEARCH_DAYS):
+        day = today + timedelta(days=offset)
+        for boundary_time, new_status in ((opening_time, Restaurant.OPENED), (closing_time, Restaurant.CLOSED)):
+            at = datetime.combine(day, boundary_time, tzinfo=tz).astimezone(dt_timezone.utc)
+            if at > now:
+                boundaries.append((at, new_status))
+    return min(boundaries)
+
+
+class StatusScheduler:
+    """
+    Keeps restaurant_status in line with the opening hours.
+
+    Instead of checking every restaurant every minute, the scheduler keeps
+    a heap of each restaurant's next opening or closing instant. It sleeps
+    until the earliest one, flips the status of every restaurant due at
+    that instant with one bulk update per status, and pushes their
+    following boundary. The hours are reloaded periodically to pick up
+    restaurants that were added or changed meanwhile.
+
+    Attributes:
+        reload_seconds (float): Seconds between two reloads of the hours.
+    """
+
+    def __init__(self, reload_seconds=300, clock=None, sleep=time.sleep):
+        self.reload_seconds = reload_seconds
+        self.clock = clock or (lambda: datetime.now(dt_timezone.utc))
+        self.sleep = sleep
+        self._heap = []
+        self._hours = {}
+
+    def load(self):
+        """
+        Reads every restaurant's hours, fixes the statuses that are wrong now
+        and schedules the next boundaries.
+
+        Returns:
+            int: Number of restaurants whose status was corrected.
+        """
+        now = self.clock()
+        self._heap, self._hours = [], {}
+        wrong = {Restaurant.OPENED: [], Restaurant.CLOSED: []}
+        rows = Restaurant.objects.values_list('pk', 'opening_time', 'closing_time', 'time_zone', 'restaurant_status')
+        for pk, opening_time, closing_time, time_zone, current in rows.iterator(chunk_size=5000):
+            hours = self._hours[pk] = (opening_time, closing_time, time_zone)
+            expected = status_at(*hours, now)
+            if expected != current:
+                wrong[expected].append(pk)
+            self._schedule(pk, now)
+        heapq.heapify(self._heap)
+        return self.apply(wrong)
+
+    def _schedule(self, pk, now):
+        boundary = next_boundary(*self._hours[pk], now)
+        if boundary is not None:
+            at, new_status = boundary
+            self._heap.append((at, pk, new_status))
+
+    def apply(self, changes):
+        """
+        Writes status changes, one bulk update per status.
+
+        Args:
+            changes (dict): {status: restaurant IDs to move to it}.
+
+        Returns:
+            int: Number of restaurants updated.
+        """
+        updated = 0
+        for new_status, restaurant_ids in changes.items():
+            if restaurant_ids:
+                # The version is part of the restaurant's ETag.
+                updated += Restaurant.objects.filter(pk__in=restaurant_ids).exclude(restaurant_status=new_status).update(
+                    restaurant_status=new_status, content_version=models.F('content_version') + 1
+                )
+        return updated
+
+    def run_due(self):
+        """
+        Applies every boundary that has passed and schedules the next ones.
+
+        Returns:
+            int: Number of restaurants updated.
+        """
+        now = self.clock()
+        changes = {Restaurant.OPENED: [], Restaurant.CLOSED: []}
+        while self._heap and self._heap[0][0] <= now:
+            _, pk, new_status = heapq.heappop(self._heap)
+            changes[new_status].append(pk)
+            boundary = next_boundary(*self._hours[pk], now)
+            if boundary is not None:
+                heapq.heappush(self._heap, (boundary[0], pk, boundary[1]))
+        return self.apply(changes)
+
+    def seconds_until_next(self):
+        """
+        Returns the time to sleep before the next boundary.
+
+        Returns:
+            float: Seconds until the earliest scheduled boundary, or None if none is scheduled.
+        """
+        if not self._heap:
+            return None
+        return max(0.0, (self._heap[0][0] - self.clock()).total_seconds())
+
+    def run_forever(self, log=None):
+        """
+        Runs the scheduler until interrupted.
+
+        Args:
+            log (callable): Optional function called with a message after each change.
+        """
+        while True:
+            corrected = self.load()
+            if corrected and log:
+                log(f'Corrected the status of {corrected} restaurants.')
+            reload_at = time.monotonic() + self.reload_seconds
+            while time.monotonic() < reload_at:
+                wait = self.seconds_until_next()
+                remaining = reload_at - time.monotonic()
+                self.sleep(max(0.0, min(wait if wait is not None else remaining, remaining)))
+                updated = self.run_due()
+                if updated and log:
+                    log(f'Flipped the status of {updated} restaurants.')
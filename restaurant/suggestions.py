@@ -0,0 +1,200 @@
+import threading
+import time
+from bisect import bisect_right
+from .hours import open_intervals, seconds_of_day
+
+# Seconds after which the suggestion index is reloaded from the database, so
+# that changes made by other worker processes are eventually picked up.
+SUGGESTION_INDEX_MAX_AGE = 300
+
+
+def normalize_cuisine(name):
+    """
+    Normalizes a cuisine name for lookups.
+
+    Args:
+        name (str): The cuisine name.
+
+    Returns:
+        str: The name case-folded, with runs of whitespace collapsed.
+    """
+    return ' '.join(name.split()).casefold()
+
+
+class CuisineSchedule:
+    """
+    Opening intervals of the restaurants serving one cuisine.
+
+    The day is cut at every interval boundary into segments during which
+    the same restaurants are open, so finding the restaurants open at a
+    given time is a bisect over the sorted segment starts. The segments are
+    rebuilt lazily after a change.
+    """
+
+    def __init__(self):
+        self.intervals = {}
+        self._starts = None
+        self._open = None
+
+    def set(self, restaurant_id, intervals):
+        self.intervals[restaurant_id] = intervals
+        self._starts = None
+
+    def discard(self, restaurant_id):
+        if self.intervals.pop(restaurant_id, None) is not None:
+            self._starts = None
+
+    def _build(self):
+        events = {}
+        for restaurant_id, intervals in self.intervals.items():
+            for start, end in intervals:
+                events.setdefault(start, []).append((restaurant_id, 1))
+                events.setdefault(end, []).append((restaurant_id, -1))
+
+        starts, segments, open_count = [], [], {}
+        for point in sorted(events):
+            for restaurant_id, delta in events[point]:
+                count = open_count.get(restaurant_id, 0) + delta
+                if count:
+                    open_count[restaurant_id] = count
+                else:
+                    open_count.pop(restaurant_id, None)
+            starts.append(point)
+            segments.append(tuple(sorted(open_count)))
+        self._starts, self._open = starts, segments
+
+    def open_at(self, second):
+        """
+        Returns the restaurants open at a time of day.
+
+        Args:
+            second (int): Seconds since midnight.
+
+        Returns:
+            tuple: IDs of the open restaurants, sorted.
+        """
+        if self._starts is None:
+            self._build()
+        position = bisect_right(self._starts, second) - 1
+        return self._open[position] if position >= 0 else ()
+
+
+class SuggestionIndex:
+    """
+    In-process inverted index from normalized cuisine to open restaurants.
+
+    Answers "restaurants serving this cuisine open at this time" with a
+    dict lookup and a bisect instead of a join over the cuisines. Opening
+    hours that wrap past midnight are split in two intervals. Views that
+    change a restaurant's hours or cuisines refresh that restaurant, and
+    the whole index is reloaded every SUGGESTION_INDEX_MAX_AGE seconds to
+    pick up changes made by other processes.
+
+    Attributes:
+        loaded_at (float): Monotonic time of the last full load, or None while cold.
+    """
+
+    def __init__(self):
+        self._schedules = {}
+        self._cuisines_of = {}
+        self._lock = threading.Lock()
+        self.loaded_at = None
+
+    def is_stale(self, max_age=SUGGESTION_INDEX_MAX_AGE):
+        """
+        Checks whether the index is cold or was loaded too long ago.
+
+        Args:
+            max_age (float): Maximum age in seconds, or None to never expire.
+
+        Returns:
+            bool: True if the index should be reloaded, False otherwise.
+        """
+        if self.loaded_at is None:
+            return True
+        return max_age is not None and time.monotonic() - self.loaded_at > max_age
+
+    def load(self):
+        """
+        Rebuilds the whole index from the database.
+        """
+        from .models import Restaurant
+
+        hours = Restaurant.objects.values_list('pk', 'opening_time', 'closing_time')
+        cuisines = Restaurant.cuisines.through.objects.values_list('restaurant_id', 'cuisine__name')
+
+        cuisines_of = {}
+        for restaurant_id, name in cuisines:
+            cuisines_of.setdefault(restaurant_id, set()).add(normalize_cuisine(name))
+
+        schedules = {}
+        for restaurant_id, opening_time, closing_time in hours:
+            intervals = open_intervals(opening_time, closing_time)
+            for cuisine in cuisines_of.get(restaurant_id, ()):
+                schedules.setdefault(cuisine, CuisineSchedule()).set(restaurant_id, intervals)
+
+        with self._lock:
+            self._schedules = schedules
+            self._cuisines_of = cuisines_of
+            self.loaded_at = time.monotonic()
+
+    def refresh(self, restaurant):
+        """
+        Reindexes one restaurant after its hours or cuisines changed.
+
+        Args:
+            restaurant (Restaurant): The restaurant, with its current hours.
+        """
+        if self.loaded_at is None:
+            return
+
+        cuisines = {normalize_cuisine(name) for name in restaurant.cuisines.values_list('name', flat=True)}
+        intervals = open_intervals(restaurant.opening_time, restaurant.closing_time)
+        with self._lock:
+            for cuisine in self._cuisines_of.get(restaurant.pk, set()) - cuisines:
+                schedule = self._schedules.get(cuisine)
+                if schedule is not None:
+                    schedule.discard(restaurant.pk)
+            for cuisine in cuisines:
+                self._schedules.setdefault(cuisine, CuisineSchedule()).set(restaurant.pk, intervals)
+            self._cuisines_of[restaurant.pk] = cuisines
+
+    def lookup(self, cuisine, desired_time):
+        """
+        Finds the restaurants serving a cuisine that are open at a time.
+
+        Args:
+            cuisine (str): The cuisine name, in any case.
+            desired_time (time): The time of day.
+
+        Returns:
+            tuple: IDs of the matching restaurants, sorted.
+        """
+        if self.is_stale():
+            self.load()
+
+        with self._lock:
+            schedule = self._schedules.get(normalize_cuisine(cuisine))
+            if schedule is None:
+                return ()
+            return schedule.open_at(seconds_of_day(desired_time))
+
+    def serving(self, cuisine):
+        """
+        Finds the restaurants serving a cuisine, whatever their hours.
+
+        Args:
+            cuisine (str): The cuisine name, in any case.
+
+        Returns:
+            set: IDs of the restaurants.
+        """
+        if self.is_stale():
+            self.load()
+
+        with self._lock:
+            schedule = self._schedules.get(normalize_cuisine(cuisine))
+            return set(schedule.intervals) if schedule is not None else set()
+
+
+suggestion_index = SuggestionIndex()
@@ -1,3 +1,707 @@
-from django.test import TestCase
+import math
+from datetime import datetime, time, timedelta, timezone
+from unittest import mock
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from accounts.models import User
+from orders.models import Order, OrderItem
+from rider.index import rider_index
+from rider.models import Rider
+from .models import Cuisine, Menu, Restaurant
+from .serializers import RestaurantSerializer
+from .hours import is_open_at, open_intervals, seconds_of_day
+from .cache import menu_cache
+from .search import Fts5Search, RestaurantSearchIndex
+from .status import StatusScheduler, next_boundary
+from .suggestions import CuisineSchedule, suggestion_index
 
-# Create your tests here.
+
+class RestaurantSerializerUpdateTests(TestCase):
+    """
+    Tests for the diff-based update of a restaurant's cuisines and menu.
+    """
+
+    def setUp(self):
+        Cuisine.objects.create(name='Thai')
+
+    def create_restaurant(self, email, menu_size):
+        manager = User.objects.create_user(email=email, password='password', role=User.RESTAURANT)
+        restaurant = Restaurant.objects.create(
+            restaurant_manager=manager,
+            restaurant_name='Test Kitchen',
+            restaurant_phone='0000000000',
+            opening_time='09:00',
+            closing_time='23:00',
+            latitude=18.52,
+            longitude=73.85,
+        )
+        restaurant.cuisines.add(*Cuisine.objects.resolve(['Indian', 'Chinese']).values())
+        Menu.objects.bulk_create([
+            Menu(restaurant=restaurant, item=f'Item {index}', price=100) for index in range(menu_size)
+        ])
+        return restaurant
+
+    def edit_payload(self, menu_size):
+        # Keeps half the items, reprices half of those and adds as many new items.
+        kept = [{'item': f'Item {index}', 'price': 100 + index % 2} for index in range(menu_size // 2)]
+        added = [{'item': f'New item {index}', 'price': 50} for index in range(menu_size // 2)]
+        return {'cuisines': [{'name': 'Indian'}, {'name': 'Thai'}], 'menu': kept + added}
+
+    def update(self, restaurant, data):
+        serializer = RestaurantSerializer(restaurant, data=data, partial=True)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        with CaptureQueriesContext(connection) as queries:
+            serializer.save()
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_the_menu(self):
+        small = self.create_restaurant('small@example.com', 10)
+        large = self.create_restaurant('large@example.com', 300)
+
+        small_queries = self.update(small, self.edit_payload(10))
+        large_queries = self.update(large, self.edit_payload(300))
+
+        self.assertEqual(large_queries, small_queries)
+
+    def test_update_applies_the_diff(self):
+        restaurant = self.create_restaurant('diff@example.com', 4)
+        kept_pk = Menu.objects.get(restaurant=restaurant, item='Item 1').pk
+
+        self.update(restaurant, self.edit_payload(4))
+
+        menu = dict(Menu.objects.filter(restaurant=restaurant).values_list('item', 'price'))
+        self.assertEqual(menu, {'Item 0': 100, 'Item 1': 101, 'New item 0': 50, 'New item 1': 50})
+        self.assertEqual(Menu.objects.get(restaurant=restaurant, item='Item 1').pk, kept_pk)
+        self.assertEqual(set(restaurant.cuisines.values_list('name', flat=True)), {'Indian', 'Thai'})
+
+    def test_removed_dish_that_was_ordered_is_kept_for_the_order(self):
+        restaurant = self.create_restaurant('ordered@example.com', 2)
+        customer = User.objects.create_user(email='customer@example.com', password='password', role=User.USER)
+        order = Order.objects.create(user=customer, restaurant=restaurant)
+        ordered = Menu.objects.get(restaurant=restaurant, item='Item 0')
+        OrderItem.objects.create(order=order, menu_item=ordered, quantity=2)
+
+        self.update(restaurant, {'menu': [{'item': 'Item 2', 'price': 80}]})
+
+        self.assertEqual(list(restaurant.menu_set.values_list('item', flat=True)), ['Item 2'])
+        self.assertEqual(order.items.get().menu_item, ordered)
+        self.assertEqual(order.total_value, 200)
+        self.assertFalse(Menu._base_manager.filter(item='Item 1').exists())
+
+    def test_partial_update_keeps_cuisines_and_menu(self):
+        restaurant = self.create_restaurant('partial@example.com', 3)
+
+        self.update(restaurant, {'restaurant_name': 'Renamed'})
+
+        restaurant.refresh_from_db()
+        self.assertEqual(restaurant.restaurant_name, 'Renamed')
+        self.assertEqual(restaurant.menu_set.count(), 3)
+        self.assertEqual(restaurant.cuisines.count(), 2)
+
+    def test_update_keeps_concurrent_version_bumps(self):
+        restaurant = self.create_restaurant('version@example.com', 1)
+        # Another request bumps the version after this one read the restaurant.
+        Restaurant.objects.filter(pk=restaurant.pk).update(content_version=5)
+
+        self.update(restaurant, {'restaurant_name': 'Renamed'})
+
+        self.assertEqual(Restaurant.objects.get(pk=restaurant.pk).content_version, 6)
+
+
+class RestaurantSerializerCreateTests(TestCase):
+    """
+    Tests for creating a restaurant with its cuisines and menu in bulk.
+    """
+
+    def create(self, email, menu_size):
+        manager = User.objects.create_user(email=email, password='password', role=User.RESTAURANT)
+        data = {
+            'restaurant_manager': manager.pk,
+            'restaurant_name': 'Test Kitchen',
+            'restaurant_phone': '0000000000',
+            'opening_time': '09:00',
+            'closing_time': '23:00',
+            'latitude': 18.52,
+            'longitude': 73.85,
+            'cuisines': [{'name': 'Indian'}, {'name': 'Thai'}],
+            'menu': [{'item': f'Item {index}', 'price': 100 + index} for index in range(menu_size)],
+        }
+        serializer = RestaurantSerializer(data=data)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        with CaptureQueriesContext(connection) as queries:
+            restaurant = serializer.save()
+        return restaurant, len(queries)
+
+    def test_query_count_does_not_grow_with_the_menu(self):
+        # The first create also adds the missing cuisines and fills the cuisine cache.
+        self.create('warm@example.com', 1)
+        _, small_queries = self.create('small@example.com', 5)
+        large, large_queries = self.create('large@example.com', 300)
+
+        # Only the database's limit on query parameters splits the menu
+        # insert: in one query on PostgreSQL, 249 rows per query on SQLite.
+        menu_fields = [field for field in Menu._meta.concrete_fields if not field.primary_key]
+        insert_batches = math.ceil(300 / connection.ops.bulk_batch_size(menu_fields, [None] * 300))
+        self.assertEqual(large_queries, small_queries + insert_batches - 1)
+        self.assertEqual(large.menu_set.count(), 300)
+        self.assertEqual(set(large.cuisines.values_list('name', flat=True)), {'Indian', 'Thai'})
+
+    def test_last_duplicate_item_wins(self):
+        manager = User.objects.create_user(email='dup@example.com', password='password', role=User.RESTAURANT)
+        serializer = RestaurantSerializer(data={
+            'restaurant_manager': manager.pk,
+            'restaurant_name': 'Test Kitchen',
+            'restaurant_phone': '0000000000',
+            'opening_time': '09:00',
+            'closing_time': '23:00',
+            'latitude': 18.52,
+            'longitude': 73.85,
+            'menu': [{'item': 'Dosa', 'price': 80}, {'item': 'Dosa', 'price': 90}],
+        })
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+
+        restaurant = serializer.save()
+
+        self.assertEqual(list(restaurant.menu_set.values_list('item', 'price')), [('Dosa', 90)])
+
+
+class StatusTests(TestCase):
+    """
+    Tests for the opening hours arithmetic and the status scheduler.
+    """
+
+    def test_overnight_hours(self):
+        self.assertTrue(is_open_at(time(22), time(2), time(23, 30)))
+        self.assertTrue(is_open_at(time(22), time(2), time(1, 59)))
+        self.assertFalse(is_open_at(time(22), time(2), time(2)))
+        self.assertFalse(is_open_at(time(22), time(2), time(12)))
+        self.assertTrue(is_open_at(time(9), time(9), time(3)))
+
+    def test_next_boundary_of_overnight_hours_in_local_time(self):
+        # 17:30 in Kolkata: the restaurant opens at 22:00 local, 16:30 UTC.
+        now = datetime(2024, 3, 30, 12, 0, tzinfo=timezone.utc)
+        self.assertEqual(
+            next_boundary(time(22), time(6), 'Asia/Kolkata', now),
+            (datetime(2024, 3, 30, 16, 30, tzinfo=timezone.utc), Restaurant.OPENED),
+        )
+        # At 23:00 local, the next boundary is the closing on the next day.
+        now = datetime(2024, 3, 30, 17, 30, tzinfo=timezone.utc)
+        self.assertEqual(
+            next_boundary(time(22), time(6), 'Asia/Kolkata', now),
+            (datetime(2024, 3, 31, 0, 30, tzinfo=timezone.utc), Restaurant.CLOSED),
+        )
+
+    def test_next_boundary_across_daylight_saving_changes(self):
+        # Berlin skips from 02:00 to 03:00 on 31 March 2024: 02:30 does not
+        # exist and the restaurant opens when the clocks jump.
+        now = datetime(2024, 3, 30, 23, 0, tzinfo=timezone.utc)
+        self.assertEqual(
+            next_boundary(time(2, 30), time(12), 'Europe/Berlin', now),
+            (datetime(2024, 3, 31, 1, 30, tzinfo=timezone.utc), Restaurant.OPENED),
+        )
+        # After the change, 12:00 local is 10:00 UTC instead of 11:00.
+        now = datetime(2024, 3, 31, 6, 0, tzinfo=timezone.utc)
+        self.assertEqual(
+            next_boundary(time(2, 30), time(12), 'Europe/Berlin', now),
+            (datetime(2024, 3, 31, 10, 0, tzinfo=timezone.utc), Restaurant.CLOSED),
+        )
+
+    def test_restaurant_open_around_the_clock_has_no_boundary(self):
+        self.assertIsNone(next_boundary(time(0), time(0), 'UTC', datetime(2024, 1, 1, tzinfo=timezone.utc)))
+
+    def create_restaurants(self, count, opening_time, closing_time, restaurant_status):
+        restaurants = []
+        for index in range(count):
+            manager = User.objects.create_user(
+                email=f'{opening_time:%H%M}-{index}@example.com', password='password', role=User.RESTAURANT
+            )
+            restaurants.append(Restaurant.objects.create(
+                restaurant_manager=manager,
+                restaurant_name=f'Kitchen {index}',
+                restaurant_phone='0000000000',
+                opening_time=opening_time,
+                closing_time=closing_time,
+                restaurant_status=restaurant_status,
+                latitude=18.52,
+                longitude=73.85,
+            ))
+        return restaurants
+
+    def statuses(self):
+        return dict(Restaurant.objects.values_list('pk', 'restaurant_status'))
+
+    def test_scheduler_corrects_and_flips_statuses_in_bulk(self):
+        clock = [datetime(2024, 1, 1, 8, 0, tzinfo=timezone.utc)]
+        day = self.create_restaurants(3, time(9), time(17), Restaurant.OPENED)
+        night = self.create_restaurants(2, time(20), time(9), Restaurant.OPENED)
+        scheduler = StatusScheduler(clock=lambda: clock[0])
+
+        self.assertEqual(scheduler.load(), 3)
+        self.assertEqual(scheduler.seconds_until_next(), 3600)
+        self.assertEqual(scheduler.run_due(), 0)
+
+        clock[0] = datetime(2024, 1, 1, 9, 0, tzinfo=timezone.utc)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(scheduler.run_due(), 5)
+        self.assertEqual(len(queries), 2)
+        statuses = self.statuses()
+        self.assertTrue(all(statuses[restaurant.pk] == Restaurant.OPENED for restaurant in day))
+        self.assertTrue(all(statuses[restaurant.pk] == Restaurant.CLOSED for restaurant in night))
+        # Closed on load then opened: every change of status changes the ETag.
+        self.assertEqual(Restaurant.objects.get(pk=day[0].pk).content_version, 2)
+        self.assertEqual(scheduler.seconds_until_next(), 8 * 3600)
+
+    def test_run_forever_sleeps_until_each_boundary(self):
+        clock = [datetime(2024, 1, 1, 8, 0, tzinfo=timezone.utc)]
+        self.create_restaurants(1, time(9), time(17), Restaurant.CLOSED)
+        sleeps = []
+
+        def sleep(seconds):
+            if len(sleeps) == 2:
+                raise KeyboardInterrupt
+            sleeps.append(seconds)
+            clock[0] += timedelta(seconds=seconds)
+
+        scheduler = StatusScheduler(reload_seconds=86400, clock=lambda: clock[0], sleep=sleep)
+        with self.assertRaises(KeyboardInterrupt):
+            scheduler.run_forever()
+
+        self.assertEqual(sleeps, [3600, 8 * 3600])
+        self.assertEqual(list(self.statuses().values()), [Restaurant.CLOSED])
+
+
+class NearbyRestaurantTests(TestCase):
+    """
+    Tests for the paginated nearby restaurant search.
+    """
+
+    def setUp(self):
+        for index, (latitude, restaurant_status) in enumerate(
+            [(18.521, Restaurant.OPENED), (18.53, Restaurant.CLOSED), (18.54, Restaurant.OPENED)]
+        ):
+            manager = User.objects.create_user(email=f'manager{index}@example.com', password='password',
+                                               role=User.RESTAURANT)
+            Restaurant.objects.create(
+                restaurant_manager=manager,
+                restaurant_name=f'Kitchen {index}',
+                restaurant_phone='0000000000',
+                opening_time='00:00',
+                closing_time='00:00',
+                latitude=latitude,
+                longitude=73.85,
+                restaurant_status=restaurant_status,
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(email='customer@example.com', password='password',
+                                                                role=User.USER))
+
+    def search(self, **params):
+        return self.client.get('/api/restaurant/nearby', {'latitude': 18.52, 'longitude': 73.85, **params})
+
+    def test_pages_are_ranked_by_distance(self):
+        first = self.search(page_size=2)
+        second = self.search(page_size=2, page=2)
+
+        self.assertEqual([row['restaurant_name'] for row in first.data['results']], ['Kitchen 0', 'Kitchen 1'])
+        self.assertEqual(first.data['next_page'], 2)
+        self.assertEqual([row['restaurant_name'] for row in second.data['results']], ['Kitchen 2'])
+        self.assertIsNone(second.data['next_page'])
+
+    def test_open_now_skips_closed_restaurants(self):
+        response = self.search(open_now='true')
+
+        self.assertEqual([row['restaurant_name'] for row in response.data['results']], ['Kitchen 0', 'Kitchen 2'])
+
+    def test_page_is_capped(self):
+        self.assertEqual(self.search(page=50).status_code, 200)
+        self.assertEqual(self.search(page=51).status_code, 400)
+
+
+class NearestRiderTests(TestCase):
+    """
+    Tests for assigning an order to the nearest rider.
+    """
+
+    def setUp(self):
+        rider_index.clear()
+        self.addCleanup(rider_index.clear)
+        self.manager = User.objects.create_user(email='manager@example.com', password='password',
+                                                role=User.RESTAURANT)
+        customer = User.objects.create_user(email='customer@example.com', password='password', role=User.USER)
+        self.restaurant = Restaurant.objects.create(
+            restaurant_manager=self.manager,
+            restaurant_name='Test Kitchen',
+            restaurant_phone='0000000000',
+            opening_time='09:00',
+            closing_time='23:00',
+            latitude=18.52,
+            longitude=73.85,
+        )
+        self.order = Order.objects.create(user=customer, restaurant=self.restaurant, is_placed=True)
+        # The nearer rider is stuck across a river: its trip takes longer.
+        self.near, self.far = (
+            Rider.objects.create(
+                rider=User.objects.create_user(email=f'rider{index}@example.com', password='password',
+                                               role=User.RIDER),
+                latitude=latitude,
+                longitude=73.85,
+            )
+            for index, latitude in enumerate((18.521, 18.53))
+        )
+        self.eta_matrix = mock.Mock()
+        self.eta_matrix.etas_to.side_effect = lambda origins, latitude, longitude: [
+            900.0 if float(origin_latitude) == 18.521 else 300.0 for origin_latitude, _ in origins
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+
+    def assign(self, **params):
+        with mock.patch('restaurant.views.get_eta_matrix', return_value=self.eta_matrix):
+            return self.client.get(f'/api/restaurant/nearest-rider/{self.restaurant.pk}/{self.order.pk}', params)
+
+    def test_rank_by_eta_prefers_the_fastest_rider(self):
+        response = self.assign(rank='eta')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['eta_seconds'], 300.0)
+        self.assertEqual(Rider.objects.get(order=self.order).pk, self.far.pk)
+
+    def test_rank_by_distance_prefers_the_nearest_rider(self):
+        response = self.assign()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Rider.objects.get(order=self.order).pk, self.near.pk)
+        self.eta_matrix.etas_to.assert_not_called()
+
+    def test_an_assigned_order_is_not_assigned_again(self):
+        self.assertEqual(self.assign().status_code, 200)
+
+        response = self.assign()
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Rider.objects.filter(order=self.order).count(), 1)
+
+    def test_unknown_rank_is_rejected(self):
+        self.assertEqual(self.assign(rank='price').status_code, 400)
+
+
+class RestaurantSuggestionTests(TestCase):
+    """
+    Tests for the paginated restaurant suggestions.
+    """
+
+    url = '/api/restaurant/suggest_restaurants'
+
+    def setUp(self):
+        hours = [('Late Night', '22:00', '02:00'), ('Lunch Only', '11:00', '15:00')]
+        hours += [(f'Always Open {index}', '00:00', '00:00') for index in range(4)]
+        self.restaurants = {}
+        for index, (name, opening_time, closing_time) in enumerate(hours):
+            manager = User.objects.create_user(email=f'manager{index}@example.com', password='password',
+                                               role=User.RESTAURANT)
+            restaurant = Restaurant.objects.create(
+                restaurant_manager=manager,
+                restaurant_name=name,
+                restaurant_phone='0000000000',
+                opening_time=opening_time,
+                closing_time=closing_time,
+                latitude=18.52,
+                longitude=73.85,
+            )
+            restaurant.cuisines.add(*Cuisine.objects.resolve(['Thai']).values())
+            self.restaurants[name] = restaurant.pk
+        suggestion_index.load()
+        self.addCleanup(setattr, suggestion_index, 'loaded_at', None)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(email='customer@example.com', password='password',
+                                                                role=User.USER))
+
+    def suggest(self, desired_time, **params):
+        return self.client.post(self.url, {'kind_of_food': 'thai', 'desired_time': desired_time, **params},
+                                format='json')
+
+    def names(self, response):
+        return {row['restaurant_name'] for row in response.data['suggested_restaurants']}
+
+    def test_overnight_hours_span_midnight(self):
+        self.assertIn('Late Night', self.names(self.suggest('23:30')))
+        self.assertIn('Late Night', self.names(self.suggest('01:59:59')))
+        self.assertNotIn('Late Night', self.names(self.suggest('02:00')))
+        self.assertNotIn('Late Night', self.names(self.suggest('21:59')))
+        self.assertNotIn('Lunch Only', self.names(self.suggest('23:30')))
+
+    def test_pages_cover_every_restaurant_once(self):
+        # Late Night and the four Always Open restaurants: a full page then a partial one.
+        expected = sorted(pk for name, pk in self.restaurants.items() if name != 'Lunch Only')
+        seen, after, pages = [], None, 0
+        while True:
+            params = {'limit': 3} if after is None else {'limit': 3, 'after': after}
+            response = self.suggest('23:30', **params)
+            seen.extend(row['id'] for row in response.data['suggested_restaurants'])
+            after = response.data['next_after']
+            pages += 1
+            if after is None:
+                break
+
+        self.assertEqual(seen, expected)
+        self.assertEqual(pages, 2)
+
+    def test_exactly_full_last_page_has_no_next_page(self):
+        response = self.suggest('23:30', limit=5)
+
+        self.assertEqual(len(response.data['suggested_restaurants']), 5)
+        self.assertIsNone(response.data['next_after'])
+
+    def test_only_the_requested_fields_are_returned(self):
+        response = self.suggest('12:00', fields='restaurant_name, cuisines')
+
+        self.assertEqual(response.status_code, 200)
+        rows = response.data['suggested_restaurants']
+        self.assertEqual(len(rows), 5)
+        for row in rows:
+            self.assertEqual(set(row), {'restaurant_name', 'cuisines'})
+            self.assertEqual(row['cuisines'], ['Thai'])
+
+    def test_unknown_fields_are_rejected(self):
+        self.assertEqual(self.suggest('12:00', fields='restaurant_name,secret').status_code, 400)
+
+
+class ContentETagTests(TestCase):
+    """
+    Tests for the conditional GETs of a restaurant's details and menu.
+    """
+
+    def setUp(self):
+        menu_cache.clear()
+        self.addCleanup(menu_cache.clear)
+        self.manager = User.objects.create_user(email='manager@example.com', password='password',
+                                                role=User.RESTAURANT)
+        self.restaurant = Restaurant.objects.create(
+            restaurant_manager=self.manager,
+            restaurant_name='Test Kitchen',
+            restaurant_phone='0000000000',
+            opening_time='09:00',
+            closing_time='23:00',
+            latitude=18.52,
+            longitude=73.85,
+        )
+        Menu.objects.create(restaurant=self.restaurant, item='Pad thai', price=250)
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+        self.urls = (f'/api/restaurant/{self.restaurant.pk}', f'/api/restaurant/{self.restaurant.pk}/menu')
+
+    def test_unchanged_content_is_not_sent_again(self):
+        for url in self.urls:
+            first = self.client.get(url)
+            self.assertEqual(first.status_code, 200)
+
+            second = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+
+            self.assertEqual(second.status_code, 304)
+            self.assertEqual(second['ETag'], first['ETag'])
+            self.assertFalse(second.content)
+
+    def test_menu_change_invalidates_the_etags(self):
+        etags = [self.client.get(url)['ETag'] for url in self.urls]
+
+        response = self.client.post(f'/api/restaurant/{self.restaurant.pk}/add-menu-item',
+                                    {'item': 'Green curry', 'price': 300}, format='json')
+        self.assertEqual(response.status_code, 201)
+
+        for url, etag in zip(self.urls, etags):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+        self.assertIn({'item': 'Green curry', 'price': 300}, response.data)
+
+
+class OpeningHoursTests(SimpleTestCase):
+    """
+    Tests that the status and the suggestion index agree on opening hours.
+    """
+
+    def assertOpen(self, opening_time, closing_time, local_time, expected):
+        schedule = CuisineSchedule()
+        schedule.set(1, open_intervals(opening_time, closing_time))
+
+        self.assertEqual(is_open_at(opening_time, closing_time, local_time), expected)
+        self.assertEqual(schedule.open_at(seconds_of_day(local_time)) == (1,), expected)
+
+    def test_closing_time_is_excluded(self):
+        self.assertOpen(time(9), time(17), time(8, 59, 59), False)
+        self.assertOpen(time(9), time(17), time(9), True)
+        self.assertOpen(time(9), time(17), time(16, 59, 59), True)
+        self.assertOpen(time(9), time(17), time(17), False)
+
+    def test_equal_opening_and_closing_times_mean_always_open(self):
+        for local_time in (time(0), time(8, 59, 59), time(9), time(23, 59, 59)):
+            self.assertOpen(time(9), time(9), local_time, True)
+
+    def test_overnight_hours(self):
+        self.assertOpen(time(22), time(2), time(21, 59, 59), False)
+        self.assertOpen(time(22), time(2), time(22), True)
+        self.assertOpen(time(22), time(2), time(0), True)
+        self.assertOpen(time(22), time(2), time(1, 59, 59), True)
+        self.assertOpen(time(22), time(2), time(2), False)
+
+    def test_closing_at_midnight(self):
+        self.assertOpen(time(18), time(0), time(23, 59, 59), True)
+        self.assertOpen(time(18), time(0), time(0), False)
+
+
+class RestaurantSearchTests(TestCase):
+    """
+    Tests for the typo tolerance of the restaurant search.
+    """
+
+    def setUp(self):
+        manager = User.objects.create_user(email='manager@example.com', password='password', role=User.RESTAURANT)
+        self.restaurant = Restaurant.objects.create(
+            restaurant_manager=manager,
+            restaurant_name='Spice Route',
+            restaurant_phone='0000000000',
+            opening_time='09:00',
+            closing_time='23:00',
+            latitude=18.52,
+            longitude=73.85,
+        )
+        for item in ('Thai curry', 'Sushi platter', 'Pasta', 'Masala dosa', 'Chicken biryani'):
+            Menu.objects.create(restaurant=self.restaurant, item=item, price=100)
+        self.index = RestaurantSearchIndex()
+        self.index.load()
+
+    def test_short_words_with_transposed_letters_are_corrected(self):
+        for word, term in (('thia', 'thai'), ('suhsi', 'sushi'), ('psata', 'pasta'), ('dsoa', 'dosa')):
+            self.assertIn(term, self.index.expand(word))
+
+    def test_long_words_allow_two_typos(self):
+        self.assertIn('biryani', self.index.expand('biriyanni'))
+
+    def test_unrelated_short_words_are_not_matched(self):
+        self.assertEqual(self.index.expand('taco'), {})
+
+    def test_search_finds_the_restaurant_despite_a_typo(self):
+        ranked, matched_terms = self.index.search('psata')
+
+        self.assertEqual([restaurant_id for _, restaurant_id in ranked], [self.restaurant.pk])
+        self.assertEqual(matched_terms, {'pasta'})
+
+    def test_fts5_table_is_created_once(self):
+        backend = Fts5Search()
+        backend.search('pasta')
+
+        with CaptureQueriesContext(connection) as queries:
+            backend.search('pasta')
+        self.assertFalse(any('CREATE' in query['sql'] for query in queries.captured_queries))
+
+
+class CuisineManagerTests(TestCase):
+    """
+    Tests for resolving cuisine names through the process-local cache.
+    """
+
+    def setUp(self):
+        Cuisine.objects.forget()
+
+    def tearDown(self):
+        Cuisine.objects.forget()
+
+    def test_resolve_uses_one_query_for_cached_names(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            italian_id = Cuisine.objects.resolve(['Italian'])['Italian']
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(Cuisine.objects.resolve([' ITALIAN ']), {' ITALIAN ': italian_id})
+        self.assertEqual(len(queries), 1)
+
+    def test_resolve_drops_cuisines_deleted_by_another_process(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            italian_id = Cuisine.objects.resolve(['Italian'])['Italian']
+        # As dedupe_cuisines would from another process, without forget().
+        Cuisine.objects.filter(pk=italian_id).delete()
+
+        resolved = Cuisine.objects.resolve(['italian'])['italian']
+
+        self.assertNotEqual(resolved, italian_id)
+        self.assertTrue(Cuisine.objects.filter(pk=resolved, normalized_name='italian').exists())
+
+
+class MenuImportTests(TestCase):
+    """
+    Tests for the bulk menu import endpoint.
+    """
+
+    def setUp(self):
+        self.restaurants = []
+        for index in range(2):
+            manager = User.objects.create_user(email=f'manager{index}@example.com', password='password', role=User.RESTAURANT)
+            self.restaurants.append(Restaurant.objects.create(
+                restaurant_manager=manager,
+                restaurant_name=f'Kitchen {index}',
+                restaurant_phone='0000000000',
+                opening_time='09:00',
+                closing_time='23:00',
+                latitude=18.52,
+                longitude=73.85,
+            ))
+        Menu.objects.create(restaurant=self.restaurants[0], item='Dosa', price=80)
+        Menu.objects.create(restaurant=self.restaurants[0], item='Idli', price=60)
+        self.client = APIClient()
+        self.client.force_authenticate(self.restaurants[0].restaurant_manager)
+
+    def import_menu(self, body, file_format):
+        response = self.client.post(
+            f'/api/restaurant/menu/import?file_format={file_format}', data=body, content_type='text/plain'
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def menu(self, restaurant):
+        return dict(Menu.objects.filter(restaurant=restaurant).values_list('item', 'price'))
+
+    def test_csv_import_creates_updates_and_rejects_rows(self):
+        own, other = (restaurant.pk for restaurant in self.restaurants)
+        body = (
+            'restaurant_id,item,price\r\n'
+            f'{own},Dosa,90\r\n'
+            f'{own},Idli,60\r\n'
+            f'{own},Vada,50\r\n'
+            f'{own},Uttapam,-5\r\n'
+            f'{other},Pizza,300\r\n'
+        )
+
+        report = self.import_menu(body, 'csv')
+
+        self.assertEqual(
+            {key: report[key] for key in ('rows', 'created', 'updated', 'unchanged', 'error_count')},
+            {'rows': 5, 'created': 1, 'updated': 1, 'unchanged': 1, 'error_count': 2},
+        )
+        self.assertEqual({error['line'] for error in report['errors']}, {5, 6})
+        self.assertEqual(self.menu(self.restaurants[0]), {'Dosa': 90, 'Idli': 60, 'Vada': 50})
+        # Managers cannot write to another restaurant's menu.
+        self.assertEqual(self.menu(self.restaurants[1]), {})
+
+    def test_jsonl_import_keeps_the_last_row_of_an_item(self):
+        own = self.restaurants[0].pk
+        body = (
+            f'{{"restaurant_id": {own}, "item": "Vada", "price": 40}}\n'
+            'not json\n'
+            f'{{"restaurant_id": {own}, "item": "Vada", "price": 45}}\n'
+        )
+
+        report = self.import_menu(body, 'jsonl')
+
+        self.assertEqual((report['created'], report['error_count']), (1, 1))
+        self.assertEqual(report['errors'][0]['line'], 2)
+        self.assertEqual(self.menu(self.restaurants[0])['Vada'], 45)
+
+    def test_admin_can_import_into_any_restaurant(self):
+        admin = User.objects.create_user(email='admin@example.com', password='password', role=User.ADMIN)
+        self.client.force_authenticate(admin)
+
+        report = self.import_menu(f'restaurant_id,item,price\r\n{self.restaurants[1].pk},Pizza,300\r\n', 'csv')
+
+        self.assertEqual(report['created'], 1)
+        self.assertEqual(self.menu(self.restaurants[1]), {'Pizza': 300})
@@ -1,14 +1,20 @@
 from django.urls import path
 
-from .views import CreateRestaurantView, UpdateRestaurantView, AddCuisineToRestaurantView, AddMenuItemToRestaurantView, RestaurantSuggestionView, RestaurantMenuAPIView, NearestRiderView
+from .views import CreateRestaurantView, UpdateRestaurantView, RestaurantDetailView, AddCuisineToRestaurantView, AddMenuItemToRestaurantView, RestaurantSuggestionView, NearbyRestaurantView, RestaurantSearchView, RestaurantMenuAPIView, MenuCacheStatsView, MenuImportView, MenuExportView, NearestRiderView
 
 urlpatterns = [
     path('restaurant/create', CreateRestaurantView.as_view(), name='create-restaurant'),
     path('restaurant/update/<int:pk>', UpdateRestaurantView.as_view(), name='update-restaurant'),
+    path('restaurant/<int:pk>', RestaurantDetailView.as_view(), name='restaurant-detail'),
     path('restaurant/<int:restaurant_id>/add-cuisine', AddCuisineToRestaurantView.as_view(), name='add-cuisine'),
     path('restaurant/<int:restaurant_id>/add-menu-item', AddMenuItemToRestaurantView.as_view(), name='add-menu-item'),
     path('restaurant/suggest_restaurants', RestaurantSuggestionView.as_view(), name='suggest_restaurants'),
+    path('restaurant/nearby', NearbyRestaurantView.as_view(), name='nearby-restaurants'),
+    path('restaurant/search', RestaurantSearchView.as_view(), name='search-restaurants'),
     path('restaurant/<int:restaurant_id>/menu', RestaurantMenuAPIView.as_view(), name='restaurant-menu'),
+    path('restaurant/menu/import', MenuImportView.as_view(), name='import-menus'),
+    path('restaurant/menu/export', MenuExportView.as_view(), name='export-menus'),
+    path('restaurant/menu-cache/stats', MenuCacheStatsView.as_view(), name='menu-cache-stats'),
     path('restaurant/nearest-rider/<int:restaurant_id>/<int:order_id>', NearestRiderView.as_view(), name='nearest-rider'),
 ]
 
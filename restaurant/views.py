@@ -1,9 +1,12 @@
+from bisect import bisect_right
 from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from permissions import IsRestaurantRole
+from geo import get_eta_matrix
+from permissions import IsAdminRole, IsRestaurantRole
 from rider.models import Rider
 from orders.models import Order
 
@@ -12,10 +15,22 @@ from .serializers import (
    CuisineSerializer,
    MenuSerializer,
    RestaurantSuggestionSerializer,
-   NearestRiderSerializer
+   NearestRiderSerializer,
+   NearbyRestaurantQuerySerializer,
+   NearbyRestaurantSerializer,
+   RestaurantSearchQuerySerializer,
+   SUGGESTION_FIELDS,
+   MAX_NEARBY_PAGE,
+   MenuImportQuerySerializer,
+   MenuExportQuerySerializer,
 )
 
-from .models import Restaurant, Menu
+from .cache import menu_cache
+from .menu_io import CONTENT_TYPES, MenuImporter, export_rows, managed_restaurants
+from .etags import content_etag, etag_matches, not_modified, with_etag
+from .models import Cuisine, Restaurant, Menu
+from .search import search_backend
+from .suggestions import suggestion_index
 
 
 class CreateRestaurantView(APIView):
@@ -48,7 +63,10 @@ class CreateRestaurantView(APIView):
 
         valid = serializer.is_valid(raise_exception=True)
         if valid:
-            serializer.save()  # Assign the authenticated user as the owner of the restaurant
+            restaurant = serializer.save()  # Assign the authenticated user as the owner of the restaurant
+            suggestion_index.refresh(restaurant)
+            search_backend().refresh(restaurant)
+            restaurant.sync_location_index()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -84,11 +102,52 @@ class UpdateRestaurantView(APIView):
         restaurant = get_object_or_404(Restaurant, pk=pk)
         serializer = RestaurantSerializer(restaurant, data=request.data, partial=True)
         if serializer.is_valid():
-            serializer.save()
+            restaurant = serializer.save()
+            suggestion_index.refresh(restaurant)
+            search_backend().refresh(restaurant)
+            restaurant.sync_location_index()
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class RestaurantDetailView(APIView):
+    """
+    API view for getting a restaurant's details.
+
+    Attributes:
+        permission_classes (tuple): Tuple of permission classes.
+    """
+
+    permission_classes = (IsAuthenticated, )
+
+    def get(self, request, pk):
+        """
+        Handles retrieving a restaurant with its cuisines.
+
+        Args:
+            request (Request): HTTP request.
+            pk (int): The primary key of the restaurant.
+
+        Returns:
+            Response: HTTP response with the restaurant's details, or 304 if
+            the client's If-None-Match already holds their current version.
+        """
+
+        version = Restaurant.objects.filter(pk=pk).values_list('content_version', flat=True).first()
+        if version is None:
+            return Response({'error': 'Restaurant not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+        etag = content_etag('restaurant', pk, version)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+
+        restaurant = get_object_or_404(Restaurant.objects.prefetch_related('cuisines'), pk=pk)
+        serializer = RestaurantSerializer(restaurant)
+        # Tag what was read, in case the restaurant changed since the version check.
+        etag = content_etag('restaurant', pk, restaurant.content_version)
+        return with_etag(Response(serializer.data, status=status.HTTP_200_OK), etag)
+
+
 class AddCuisineToRestaurantView(APIView):
     """
     API view for adding a cuisine to a restaurant.
@@ -118,17 +177,18 @@ class AddCuisineToRestaurantView(APIView):
         serializer = CuisineSerializer(data=request.data)
         if serializer.is_valid():
             
-            cuisine = serializer.validated_data.get('name')
-            existing_cuisine = restaurant.cuisines.filter(name=cuisine).first() 
-            if existing_cuisine:
+            # Names differing only in case or spacing are the same cuisine
+            cuisine = Cuisine.objects.get_or_create_normalized(serializer.validated_data.get('name'))
+            if restaurant.cuisines.filter(pk=cuisine.pk).exists():
                 return Response({'error': 'This cuisine already exists for the restaurant.'}, 
                                 status=status.HTTP_400_BAD_REQUEST)
 
-            # Create the cuisine and add it to the restaurant
-            cuisine = serializer.save()
             restaurant.cuisines.add(cuisine)
+            restaurant.bump_content_version()
+            suggestion_index.refresh(restaurant)
+            search_backend().refresh(restaurant)
 
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            return Response(CuisineSerializer(cuisine).data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     
@@ -171,12 +231,91 @@ class AddMenuItemToRestaurantView(APIView):
             else:
                 # Save the new menu item
                 serializer.save(restaurant=restaurant)
+            restaurant.bump_content_version()
+            search_backend().refresh(restaurant)
             
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
 
+class MenuImportView(APIView):
+    """
+    API view for importing the menus of many restaurants at once.
+
+    Attributes:
+        permission_classes (tuple): Tuple of permission classes.
+    """
+
+    permission_classes = (IsAuthenticated, IsRestaurantRole)
+
+    def post(self, request):
+        """
+        Handles upserting menu items from a CSV or JSONL request body.
+
+        The body is parsed as it is read and written in batches, so its size
+        does not bound the import. CSV files start with a restaurant_id,
+        item, price header row; JSONL files hold one object with those keys
+        per line. Items are matched by restaurant and name, and managers can
+        only import into their own restaurant.
+
+        Args:
+            request (Request): HTTP request with the menu file as its body and
+                the optional file_format and batch_size query parameters.
+
+        Returns:
+            Response: HTTP response with the import counts and row errors.
+        """
+
+        query = MenuImportQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+
+        # The raw stream, so that the body is never loaded whole.
+        stream = request.stream
+        if stream is None:
+            return Response({'error': 'The request body is empty.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        importer = MenuImporter(managed_restaurants(request.user), batch_size=query.validated_data['batch_size'])
+        report = importer.run(stream, query.validated_data['file_format'])
+        return Response(report, status=status.HTTP_200_OK)
+
+
+class MenuExportView(APIView):
+    """
+    API view for exporting the menus of restaurants.
+
+    Attributes:
+        permission_classes (tuple): Tuple of permission classes.
+    """
+
+    permission_classes = (IsAuthenticated, IsRestaurantRole)
+
+    def get(self, request):
+        """
+        Handles streaming menus as CSV or JSONL, in the import format.
+
+        Args:
+            request (Request): HTTP request with the optional file_format and
+                restaurant_id query parameters.
+
+        Returns:
+            StreamingHttpResponse: The menus of the user's restaurants, or of
+            every restaurant for admins.
+        """
+
+        query = MenuExportQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        file_format = query.validated_data['file_format']
+
+        restaurants = managed_restaurants(request.user)
+        if 'restaurant_id' in query.validated_data:
+            restaurants = restaurants.filter(pk=query.validated_data['restaurant_id'])
+
+        response = StreamingHttpResponse(export_rows(restaurants, file_format), content_type=CONTENT_TYPES[file_format])
+        response['Content-Disposition'] = f'attachment; filename="menus.{file_format}"'
+        return response
+
+
 class RestaurantSuggestionView(APIView):
     """
     API view for suggesting restaurants.
@@ -191,29 +330,186 @@ class RestaurantSuggestionView(APIView):
         """
         Handles suggesting restaurants based on kind_of_food and desired_time.
 
+        The restaurants are returned by ID, one page at a time: a page
+        starts after the ID given as `after`, and `next_after` gives the
+        value for the following page. Since the suggestion index returns
+        sorted, distinct IDs, a page is a bisect away and at most two
+        queries read it, whatever the number of matching restaurants.
+
         Args:
-            request (Request): HTTP request.
+            request (Request): HTTP request with kind_of_food, desired_time
+                and the optional after, limit and fields.
 
         Returns:
-            Response: HTTP response with suggested restaurants.
+            Response: HTTP response with a page of suggested restaurants.
         """
 
         serializer = RestaurantSuggestionSerializer(data=request.data)
         if serializer.is_valid():
             kind_of_food = serializer.validated_data.get('kind_of_food')
             desired_time = serializer.validated_data.get('desired_time')
+            limit = serializer.validated_data['limit']
+            fields = serializer.validated_data.get('fields', SUGGESTION_FIELDS)
 
-            # Get restaurants based on kind_of_food and desired_time
-            suggested_restaurants = Restaurant.objects.filter(
-                cuisines__name__iexact=kind_of_food,
-                opening_time__lte=desired_time,
-                closing_time__gte=desired_time,
-            )
+            # Get restaurants based on kind_of_food and desired_time from the
+            # suggestion index, which also covers hours past midnight
+            restaurant_ids = suggestion_index.lookup(kind_of_food, desired_time)
+            start = bisect_right(restaurant_ids, serializer.validated_data.get('after', 0))
+            page_ids = restaurant_ids[start:start + limit]
 
-            return Response({'suggested_restaurants': suggested_restaurants.values()}, status=status.HTTP_200_OK)
+            response = {
+                'suggested_restaurants': self.project(page_ids, fields),
+                'next_after': page_ids[-1] if start + limit < len(restaurant_ids) else None,
+            }
+            return Response(response, status=status.HTTP_200_OK)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-    
+
+    @staticmethod
+    def project(restaurant_ids, fields):
+        """
+        Reads the requested fields of a page of restaurants.
+
+        The cuisines are read with a separate query on the link table rather
+        than joined, so every restaurant comes back once.
+
+        Args:
+            restaurant_ids (list): The sorted IDs of the restaurants.
+            fields (list): The fields to return, from SUGGESTION_FIELDS.
+
+        Returns:
+            list: One dict of the fields per restaurant, in ID order.
+        """
+        if not restaurant_ids:
+            return []
+
+        columns = [field for field in fields if field != 'cuisines']
+        rows = list(Restaurant.objects.filter(pk__in=restaurant_ids).order_by('pk').values('pk', *columns))
+        restaurants = [{field: row[field] for field in columns} for row in rows]
+        if 'cuisines' in fields:
+            cuisines = {}
+            links = (Restaurant.cuisines.through.objects.filter(restaurant_id__in=restaurant_ids)
+                     .order_by('cuisine__name').values_list('restaurant_id', 'cuisine__name'))
+            for restaurant_id, name in links:
+                cuisines.setdefault(restaurant_id, []).append(name)
+            for restaurant, row in zip(restaurants, rows):
+                restaurant['cuisines'] = cuisines.get(row['pk'], [])
+        return restaurants
+
+
+class NearbyRestaurantView(APIView):
+    """
+    API view for finding the restaurants near a customer.
+
+    Attributes:
+        permission_classes (tuple): Tuple of permission classes.
+    """
+
+    permission_classes = (IsAuthenticated, )
+
+    def get(self, request):
+        """
+        Handles searching the restaurants around a location, nearest first.
+
+        The candidates come from the restaurant index, and only the
+        restaurants up to the requested page are ranked, with a bounded heap.
+
+        Args:
+            request (Request): HTTP request with latitude, longitude and the
+                optional radius_km, cuisine, open_now, page and page_size
+                query parameters.
+
+        Returns:
+            Response: HTTP response with a page of restaurants and their distance.
+        """
+
+        query = NearbyRestaurantQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+
+        predicate = None
+        if params.get('cuisine'):
+            predicate = suggestion_index.serving(params['cuisine']).__contains__
+        # The open/closed status is kept up to date by the schedule_restaurant_status command.
+        find_nearest = Restaurant.nearest_open if params['open_now'] else Restaurant.nearest
+
+        page, page_size = params['page'], params['page_size']
+        offset = (page - 1) * page_size
+        # One extra restaurant tells whether there is a next page.
+        nearest = find_nearest(
+            params['latitude'], params['longitude'], offset + page_size + 1, params['radius_km'], predicate=predicate
+        )
+        page_entries = nearest[offset:offset + page_size]
+
+        restaurants = Restaurant.objects.in_bulk([restaurant_id for _, restaurant_id in page_entries])
+        results = []
+        for distance, restaurant_id in page_entries:
+            restaurant = restaurants.get(restaurant_id)
+            if restaurant is not None:
+                restaurant.distance = distance
+                results.append(restaurant)
+
+        response = {
+            'page': page,
+            'next_page': page + 1 if len(nearest) > offset + page_size and page < MAX_NEARBY_PAGE else None,
+            'results': NearbyRestaurantSerializer(results, many=True).data,
+        }
+        return Response(response, status=status.HTTP_200_OK)
+
+
+class RestaurantSearchView(APIView):
+    """
+    API view for searching restaurants by name, cuisine and menu item.
+
+    Attributes:
+        permission_classes (tuple): Tuple of permission classes.
+    """
+
+    permission_classes = (IsAuthenticated, )
+
+    def get(self, request):
+        """
+        Handles a text search over the restaurants and their menus.
+
+        Query words match as prefixes and, with the in-memory backend,
+        despite small typos.
+
+        Args:
+            request (Request): HTTP request with the q and optional limit
+                query parameters.
+
+        Returns:
+            Response: HTTP response with the best matching restaurants and
+            their menu items matching the query.
+        """
+
+        query = RestaurantSearchQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+
+        backend = search_backend()
+        hits, matched_terms = backend.search(query.validated_data['q'], query.validated_data['limit'])
+        restaurant_ids = [restaurant_id for _, restaurant_id in hits]
+        names = dict(Restaurant.objects.filter(pk__in=restaurant_ids).values_list('pk', 'restaurant_name'))
+
+        matches = backend.item_matcher(matched_terms)
+        items = {}
+        for restaurant_id, item, price in Menu.objects.filter(restaurant_id__in=restaurant_ids).values_list(
+            'restaurant_id', 'item', 'price'
+        ):
+            if matches(item):
+                items.setdefault(restaurant_id, []).append({'item': item, 'price': price})
+
+        results = [
+            {
+                'id': restaurant_id,
+                'restaurant_name': names[restaurant_id],
+                'score': round(score, 4),
+                'matched_items': items.get(restaurant_id, []),
+            }
+            for score, restaurant_id in hits if restaurant_id in names
+        ]
+        return Response({'results': results}, status=status.HTTP_200_OK)
+
 
 class RestaurantMenuAPIView(APIView):
     """
@@ -235,62 +531,83 @@ class RestaurantMenuAPIView(APIView):
             restaurant_id (int): The ID of the restaurant.
 
         Returns:
-            Response: HTTP response with the restaurant's menu.
+            Response: HTTP response with the restaurant's menu, or 304 if the
+            client's If-None-Match already holds its current version.
         """
 
-        try:
+        version = Restaurant.objects.filter(pk=restaurant_id).values_list('content_version', flat=True).first()
+        if version is None:
+            return Response([], status=status.HTTP_200_OK)
+
+        etag = content_etag('menu', restaurant_id, version)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+
+        def load_menu():
             menu = Menu.objects.filter(restaurant_id=restaurant_id)
-            serializer = MenuSerializer(menu, many=True, included_fields=['item', 'price'])
-            data = serializer.data
-            return Response(data, status=status.HTTP_200_OK)
-        except Menu.DoesNotExist:
-            return Response({"message": "Menu not found for this restaurant."},
-                            status=status.HTTP_404_NOT_FOUND)
-        
+            return [dict(item) for item in MenuSerializer(menu, many=True, included_fields=['item', 'price']).data]
 
-class NearestRiderView(APIView):
+        data = menu_cache.get(restaurant_id, version, load_menu)
+        return with_etag(Response(data, status=status.HTTP_200_OK), etag)
+
+
+class MenuCacheStatsView(APIView):
     """
-    API view for finding the nearest rider for an order.
+    API view for the hit and miss counters of the menu cache.
 
     Attributes:
         permission_classes (tuple): Tuple of permission classes.
     """
-    permission_classes = (IsAuthenticated, IsRestaurantRole)
 
-    def get_riders_within_range(self, restaurant_latitude, restaurant_longitude, distance_range):
+    permission_classes = (IsAuthenticated, IsAdminRole)
+
+    def get(self, request):
         """
-        Finds riders within a specified distance range from a restaurant.
+        Handles retrieving the menu cache counters of the serving process.
 
         Args:
-            restaurant_latitude (float): Latitude of the restaurant.
-            restaurant_longitude (float): Longitude of the restaurant.
-            distance_range (float): Distance range in kilometers.
+            request (Request): HTTP request.
 
         Returns:
-            QuerySet: Queryset of riders within the specified distance range.
+            Response: HTTP response with the cache counters.
         """
+        return Response(menu_cache.stats(), status=status.HTTP_200_OK)
 
-        return Rider.get_riders_within_range(restaurant_latitude, restaurant_longitude, distance_range)
 
-    def assign_order_to_rider(self, order_id, nearest_rider):
+class NearestRiderView(APIView):
+    """
+    API view for finding the nearest rider for an order.
+
+    Attributes:
+        permission_classes (tuple): Tuple of permission classes.
+        max_range (float): Maximum distance in kilometers to look for riders.
+        claim_candidates (int): Number of nearest riders tried when claiming.
+        eta_candidates (int): Number of nearest riders ranked when ranking by ETA.
+    """
+    permission_classes = (IsAuthenticated, IsRestaurantRole)
+    max_range = 2
+    claim_candidates = 5
+    eta_candidates = 20
+
+    def assign_order_to_rider(self, order, riders):
         """
-        Assigns an order to the nearest rider.
+        Assigns an order to the nearest rider that can still be claimed.
 
         Args:
-            order_id (int): The ID of the order.
-            nearest_rider (Rider): The nearest rider.
+            order (Order): The order to assign.
+            riders (list): Candidate riders sorted nearest first.
 
         Returns:
-            bool: True if the order is successfully assigned, False otherwise.
+            Rider: The rider the order was assigned to, or None if every
+            candidate or the order itself was taken.
         """
 
-        order = get_object_or_404(Order, pk=order_id)
-        if order.is_delivered:
-            return False
-        nearest_rider.order = order
-        nearest_rider.is_picked_up = True
-        nearest_rider.save()
-        return True
+        for rider in riders:
+            if rider.claim(order):
+                return rider
+            if not Rider.unassigned_orders().filter(pk=order.pk).exists():
+                break
+        return None
 
     def get(self, request, restaurant_id, order_id):
         """
@@ -301,26 +618,46 @@ class NearestRiderView(APIView):
             restaurant_id (int): The ID of the restaurant.
             order_id (int): The ID of the order.
 
+        Query Parameters:
+            rank (str): 'distance' (default) or 'eta' to prefer the rider
+                with the shortest estimated travel time to the restaurant.
+
         Returns:
             Response: HTTP response with the nearest rider information.
         """
+        rank = request.query_params.get('rank', 'distance')
+        if rank not in ('distance', 'eta'):
+            return Response({"error": "rank must be 'distance' or 'eta'."}, status=status.HTTP_400_BAD_REQUEST)
+
         restaurant = get_object_or_404(Restaurant, pk=restaurant_id)
         restaurant_latitude = float(restaurant.latitude)
         restaurant_longitude = float(restaurant.longitude)
 
-        initial_range = 1  # Initial range in kilometers
-        max_range = 2  # Maximum range in kilometers
-
-        while initial_range <= max_range:
-            riders = self.get_riders_within_range(restaurant_latitude, restaurant_longitude, initial_range)
-            if riders.exists():
-                nearest_rider = riders.first()  # Assuming the first rider is the nearest
-                order_status = self.assign_order_to_rider(order_id, nearest_rider)  # Assign the order to the nearest rider
-                if not order_status:
-                    return Response({"error": "Order has already been delivered."}, status=status.HTTP_400_BAD_REQUEST)
-                serializer = NearestRiderSerializer(nearest_rider)
-                return Response(serializer.data, status=status.HTTP_200_OK)
-            else:
-                initial_range += 0.2  # Increase the range by 0.2km
-
-        return Response({"message": "No riders available within the specified range."}, status=status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+        order = get_object_or_404(Order.objects.select_related('restaurant'), pk=order_id)
+        if order.is_delivered:
+            return Response({"error": "Order has already been delivered."}, status=status.HTTP_400_BAD_REQUEST)
+        if not Rider.unassigned_orders().filter(pk=order.pk).exists():
+            return Response({"error": "Order is already assigned to a rider."}, status=status.HTTP_409_CONFLICT)
+
+        # Fetch a few candidates so that losing a race for the nearest rider
+        # falls through to the next one instead of failing the dispatch.
+        # Without an ETA matrix, ranking by ETA falls back to the distance.
+        eta_matrix = get_eta_matrix() if rank == 'eta' else None
+        candidates = self.eta_candidates if eta_matrix is not None else self.claim_candidates
+        riders = Rider.nearest(restaurant_latitude, restaurant_longitude, k=candidates, max_km=self.max_range)
+        if eta_matrix is not None and riders:
+            etas = eta_matrix.etas_to(
+                [(rider.latitude, rider.longitude) for rider in riders], restaurant_latitude, restaurant_longitude
+            )
+            for rider, eta in zip(riders, etas):
+                rider.eta = eta
+            riders = sorted(riders, key=lambda rider: rider.eta)
+
+        nearest_rider = self.assign_order_to_rider(order, riders)
+        if nearest_rider:
+            serializer = NearestRiderSerializer(nearest_rider)
+            return Response(serializer.data, status=status.HTTP_200_OK)
+        if not Rider.unassigned_orders().filter(pk=order.pk).exists():
+            return Response({"error": "Order is already assigned to a rider."}, status=status.HTTP_409_CONFLICT)
+
+        return Response({"message": "No riders available within the specified range."}, status=status.HTTP_404_NOT_FOUND)
@@ -0,0 +1,302 @@
+import numpy as np
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Exists, IntegerField, OuterRef, Value, When
+from geo import bounding_box, distance_matrix
+from orders.tracking import order_hub
+from .index import rider_index
+from .locations import location_buffer
+from .models import DeliveryRecord, Rider
+
+HUNGARIAN = 'hungarian'
+GREEDY = 'greedy'
+AUTO = 'auto'
+
+
+def feasible_pairs(origins, destinations, max_km, chunk_size=256):
+    """
+    Finds every origin/destination pair that lies within a maximum distance.
+
+    The distances are computed a block of origins at a time, so memory use
+    grows with the number of feasible pairs instead of with n * m.
+
+    Args:
+        origins (ndarray): Array of shape (n, 2) holding latitudes and longitudes.
+        destinations (ndarray): Array of shape (m, 2) holding latitudes and longitudes.
+        max_km (float): Maximum distance in kilometers.
+        chunk_size (int): Number of origins processed per block.
+
+    Returns:
+        tuple: (rows, cols, distances) arrays describing the feasible pairs.
+    """
+    rows, cols, distances = [], [], []
+    for start in range(0, len(origins), chunk_size):
+        block = distance_matrix(origins[start:start + chunk_size], destinations)
+        block_rows, block_cols = np.nonzero(block <= max_km)
+        rows.append(block_rows + start)
+        cols.append(block_cols)
+        distances.append(block[block_rows, block_cols])
+
+    if not rows:
+        return np.empty(0, dtype=int), np.empty(0, dtype=int), np.empty(0)
+    return np.concatenate(rows), np.concatenate(cols), np.concatenate(distances)
+
+
+def solve_hungarian(cost):
+    """
+    Solves the rectangular assignment problem minimizing the total cost.
+
+    Shortest augmenting path variant of the Hungarian algorithm, running in
+    O(n^2 m) with the inner loop over columns vectorized.
+
+    Args:
+        cost (ndarray): Cost matrix of shape (n, m).
+
+    Returns:
+        list: (row, col) pairs of the optimal assignment, min(n, m) of them.
+    """
+    cost = np.asarray(cost, dtype=float)
+    transposed = cost.shape[0] > cost.shape[1]
+    if transposed:
+        cost = cost.T
+    n, m = cost.shape
+
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    assigned_row = np.zeros(m + 1, dtype=int)  # 1-based row matched to each column, 0 if none
+    way = np.zeros(m + 1, dtype=int)
+
+    for row in range(1, n + 1):
+        assigned_row[0] = row
+        col = 0
+        min_slack = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+
+        while True:
+            used[col] = True
+            current_row = assigned_row[col]
+            free = ~used[1:]
+            slack = cost[current_row - 1] - u[current_row] - v[1:]
+            improved = free & (slack < min_slack[1:])
+            min_slack[1:][improved] = slack[improved]
+            way[1:][improved] = col
+
+            candidates = np.where(free, min_slack[1:], np.inf)
+            next_col = int(np.argmin(candidates)) + 1
+            delta = candidates[next_col - 1]
+
+            u[assigned_row[used]] += delta
+            v[used] -= delta
+            min_slack[~used] -= delta
+
+            col = next_col
+            if assigned_row[col] == 0:
+                break
+
+        while col:
+            previous_col = way[col]
+            assigned_row[col] = assigned_row[previous_col]
+            col = previous_col
+
+    pairs = [(assigned_row[col] - 1, col - 1) for col in range(1, m + 1) if assigned_row[col]]
+    if transposed:
+        pairs = [(col, row) for row, col in pairs]
+    return sorted(pairs)
+
+
+def solve_greedy(rows, cols, distances):
+    """
+    Assigns pairs greedily, shortest distance first.
+
+    Args:
+        rows (ndarray): Row of each feasible pair.
+        cols (ndarray): Column of each feasible pair.
+        distances (ndarray): Distance of each feasible pair.
+
+    Returns:
+        list: (row, col) pairs of the assignment.
+    """
+    taken_rows = set()
+    taken_cols = set()
+    pairs = []
+    for index in np.argsort(distances, kind='stable'):
+        row, col = int(rows[index]), int(cols[index])
+        if row in taken_rows or col in taken_cols:
+            continue
+        taken_rows.add(row)
+        taken_cols.add(col)
+        pairs.append((row, col))
+    return pairs
+
+
+class BatchDispatcher:
+    """
+    Assigns all pending orders to free riders in one optimization round.
+
+    Attributes:
+        max_km (float): Maximum rider to restaurant distance in kilometers.
+        mode (str): One of 'hungarian', 'greedy' or 'auto'.
+        greedy_threshold (int): In auto mode, batches with more orders or
+            riders than this are solved greedily.
+    """
+
+    def __init__(self, max_km=2, mode=AUTO, greedy_threshold=2000):
+        self.max_km = max_km
+        self.mode = mode
+        self.greedy_threshold = greedy_threshold
+
+    def pending_orders(self):
+        """
+        Returns the placed orders that are neither delivered nor assigned.
+
+        Returns:
+            list: (order_id, latitude, longitude) tuples of the orders' restaurants.
+        """
+        return list(
+            Rider.unassigned_orders().filter(is_placed=True)
+            .values_list('pk', 'restaurant__latitude', 'restaurant__longitude')
+        )
+
+    def free_riders(self, orders):
+        """
+        Returns the free riders that can reach at least the area of the orders.
+
+        Args:
+            orders (list): (order_id, latitude, longitude) tuples.
+
+        Returns:
+            list: (rider_id, latitude, longitude) tuples.
+        """
+        latitudes = [float(latitude) for _, latitude, _ in orders]
+        longitudes = [float(longitude) for _, _, longitude in orders]
+        south = bounding_box(min(latitudes), 0, self.max_km)[0]
+        north = bounding_box(max(latitudes), 0, self.max_km)[1]
+        # Longitude margins are widest at the latitude furthest from the equator.
+        widest = max(latitudes, key=abs)
+        west = bounding_box(widest, min(longitudes), self.max_km)[2]
+        east = bounding_box(widest, max(longitudes), self.max_km)[3]
+
+        riders = Rider.objects.filter(
+            status=Rider.IDLE,
+            latitude__range=(south, north),
+            longitude__range=(west, east),
+        ).values_list('pk', 'latitude', 'longitude')
+        return [(pk, *location_buffer.position(pk, (latitude, longitude))) for pk, latitude, longitude in riders]
+
+    def solve(self, order_coords, rider_coords):
+        """
+        Matches orders to riders minimizing the total pickup distance.
+
+        Args:
+            order_coords (ndarray): Array of shape (n, 2) with the restaurants' positions.
+            rider_coords (ndarray): Array of shape (m, 2) with the riders' positions.
+
+        Returns:
+            list: (order_index, rider_index, distance) tuples.
+        """
+        rows, cols, distances = feasible_pairs(order_coords, rider_coords, self.max_km)
+        if not len(rows):
+            return []
+
+        # Only orders and riders with at least one feasible partner take part.
+        order_ids, rows = np.unique(rows, return_inverse=True)
+        rider_ids, cols = np.unique(cols, return_inverse=True)
+
+        mode = self.mode
+        if mode == AUTO:
+            too_big = max(len(order_ids), len(rider_ids)) > self.greedy_threshold
+            mode = GREEDY if too_big else HUNGARIAN
+
+        if mode == GREEDY:
+            pairs = solve_greedy(rows, cols, distances)
+        else:
+            # Infeasible pairs cost more than any full set of feasible ones, so
+            # the solver first maximizes the number of assignments.
+            infeasible_cost = self.max_km * min(len(order_ids), len(rider_ids)) + 1
+            cost = np.full((len(order_ids), len(rider_ids)), infeasible_cost)
+            cost[rows, cols] = distances
+            pairs = [(row, col) for row, col in solve_hungarian(cost) if cost[row, col] <= self.max_km]
+
+        pair_distance = dict(zip(zip(rows.tolist(), cols.tolist()), distances.tolist()))
+        return [
+            (int(order_ids[row]), int(rider_ids[col]), pair_distance[(row, col)])
+            for row, col in pairs
+        ]
+
+    def run(self):
+        """
+        Runs one dispatch round and writes the assignments.
+
+        Returns:
+            list: (order_id, rider_id, distance) tuples of the written assignments.
+        """
+        orders = self.pending_orders()
+        if not orders:
+            return []
+        riders = self.free_riders(orders)
+        if not riders:
+            return []
+
+        order_coords = np.array([(latitude, longitude) for _, latitude, longitude in orders], dtype=float)
+        rider_coords = np.array([(latitude, longitude) for _, latitude, longitude in riders], dtype=float)
+        matches = [
+            (orders[order_index][0], riders[rider_index][0], distance)
+            for order_index, rider_index, distance in self.solve(order_coords, rider_coords)
+        ]
+        return self.assign(matches)
+
+    def assign(self, matches):
+        """
+        Writes the assignments in a single conditional update.
+
+        Like Rider.claim, the update only touches riders that are still idle
+        and whose matched order is still undelivered and free, so riders or
+        orders claimed concurrently while the round was being solved are
+        skipped rather than overwritten. The written assignments are added to
+        the delivery ledger in the same transaction.
+
+        Args:
+            matches (list): (order_id, rider_id, distance) tuples.
+
+        Returns:
+            list: The (order_id, rider_id, distance) tuples that were written.
+        """
+        if not matches:
+            return []
+
+        order_of_rider = {rider_id: order_id for order_id, rider_id, _ in matches}
+        matched_order = Case(
+            *[When(pk=rider_id, then=Value(order_id)) for rider_id, order_id in order_of_rider.items()],
+            output_field=IntegerField(),
+        )
+        taken_riders = order_of_rider.keys()
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    claimed = Rider.objects.filter(pk__in=order_of_rider, status=Rider.IDLE).annotate(
+                        matched_order=matched_order,
+                    ).filter(
+                        Exists(Rider.unassigned_orders().filter(pk=OuterRef('matched_order'))),
+                    ).update(order=matched_order, status=Rider.ASSIGNED, is_picked_up=True)
+            except IntegrityError:
+                # A claim on another connection took one of the orders; the
+                # whole round is left to the next run.
+                return []
+
+            if claimed < len(matches):
+                riders = list(Rider.objects.filter(pk__in=order_of_rider).values_list('pk', 'order_id', 'status'))
+                won = {
+                    rider_id for rider_id, order_id, rider_status in riders
+                    if rider_status == Rider.ASSIGNED and order_of_rider[rider_id] == order_id
+                }
+                # Riders that only lost their order are still available.
+                taken_riders = [rider_id for rider_id, _, rider_status in riders if rider_status != Rider.IDLE]
+                matches = [match for match in matches if match[1] in won]
+            DeliveryRecord.objects.bulk_create(
+                [DeliveryRecord(rider_id=rider_id, order_id=order_id) for order_id, rider_id, _ in matches]
+            )
+
+        for rider_id in taken_riders:
+            rider_index.remove(rider_id)
+        for order_id, rider_id, _ in matches:
+            order_hub.publish(order_id, 'status', {'status': Rider.ASSIGNED, 'rider': rider_id})
+        return matches
@@ -0,0 +1,4 @@
+from geo import GridIndex
+
+# Process-local index of the riders that are free to take an order.
+rider_index = GridIndex()
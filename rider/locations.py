@@ -0,0 +1,224 @@
+import atexit
+import logging
+import threading
+import time
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindBuffer:
+    """
+    Base class for in-memory buffers flushed to the database in the background.
+
+    Subclasses implement flush() and call schedule_flush() after buffering
+    data. A daemon thread then calls flush() every flush interval.
+
+    Attributes:
+        flush_interval (float): Seconds between two flushes; 0 or less flushes
+            on every write, and None leaves flushing to the caller.
+    """
+
+    def __init__(self, flush_interval):
+        """
+        Initializes the buffer without starting the flush thread.
+
+        Args:
+            flush_interval (float): Seconds between two flushes.
+        """
+        self.flush_interval = flush_interval
+        self._flusher = None
+        self._flusher_lock = threading.Lock()
+
+    def flush(self):
+        """
+        Writes the buffered data to the database.
+        """
+        raise NotImplementedError
+
+    def schedule_flush(self):
+        """
+        Flushes right away in write-through mode, or makes sure the flush thread runs.
+        """
+        if self.flush_interval is None:
+            return
+        if self.flush_interval <= 0:
+            self.flush()
+            return
+        if self._flusher is not None:
+            return
+        with self._flusher_lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(
+                target=self._run_flusher, name=f'{type(self).__name__}-flusher', daemon=True
+            )
+            self._flusher.start()
+
+    def _run_flusher(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Failed to flush %s', type(self).__name__)
+            finally:
+                connection.close()
+
+
+class LocationBuffer(WriteBehindBuffer):
+    """
+    Write-behind buffer for rider GPS pings.
+
+    Only the latest position of each rider is kept in memory, pings older
+    than the last one recorded for the rider are dropped, and the buffer
+    is written to the database with a single bulk update every flush
+    interval, so a rider pinging many times between two flushes costs one
+    row write. Reads should go through position() so that they see pings
+    that are not flushed yet.
+
+    Attributes:
+        flush_interval (float): Seconds between two flushes; 0 or less writes every ping through.
+    """
+
+    def __init__(self, flush_interval):
+        """
+        Initializes an empty buffer.
+
+        Args:
+            flush_interval (float): Seconds between two flushes.
+        """
+        super().__init__(flush_interval)
+        self._pending = {}
+        self._flushing = {}
+        self._last_seen = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._started_at = time.monotonic()
+        self._pings = 0
+        self._writes = 0
+        self._flushes = 0
+
+    def record(self, rider_id, latitude, longitude, timestamp=None):
+        """
+        Records the latest position of a rider.
+
+        Args:
+            rider_id (int): The ID of the rider.
+            latitude (float): The rider's latitude.
+            longitude (float): The rider's longitude.
+            timestamp (float): When the position was taken, in seconds since the epoch; defaults to now.
+
+        Returns:
+            bool: True if the position was kept, False if a newer one was already recorded.
+        """
+        return rider_id in self.record_many([(rider_id, latitude, longitude, timestamp)])
+
+    def record_many(self, pings):
+        """
+        Records several positions at once, dropping out-of-order ones.
+
+        Args:
+            pings (iterable): (rider_id, latitude, longitude, timestamp) tuples,
+                with timestamps in seconds since the epoch or None for now.
+
+        Returns:
+            set: IDs of the riders whose position was kept.
+        """
+        now = time.time()
+        kept = set()
+        with self._lock:
+            for rider_id, latitude, longitude, timestamp in pings:
+                self._pings += 1
+                timestamp = now if timestamp is None else timestamp
+                if timestamp < self._last_seen.get(rider_id, float('-inf')):
+                    continue
+                self._last_seen[rider_id] = timestamp
+                self._pending[rider_id] = (latitude, longitude)
+                kept.add(rider_id)
+
+        self.schedule_flush()
+        return kept
+
+    def position(self, rider_id, default=None):
+        """
+        Returns the latest buffered position of a rider.
+
+        Args:
+            rider_id (int): The ID of the rider.
+            default: Value returned when the rider has no buffered position.
+
+        Returns:
+            tuple: (latitude, longitude), or default.
+        """
+        with self._lock:
+            return self._pending.get(rider_id) or self._flushing.get(rider_id) or default
+
+    def flush(self):
+        """
+        Writes the buffered positions to the database.
+
+        Returns:
+            int: Number of rider rows written.
+        """
+        from .models import Rider
+
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                self._flushing, self._pending = self._pending, {}
+
+            try:
+                Rider.objects.bulk_update(
+                    [Rider(pk=rider_id, latitude=latitude, longitude=longitude)
+                     for rider_id, (latitude, longitude) in self._flushing.items()],
+                    ['latitude', 'longitude'],
+                    batch_size=500,
+                )
+            except Exception:
+                # Keep the positions for the next flush unless newer ones arrived.
+                with self._lock:
+                    self._pending = {**self._flushing, **self._pending}
+                    self._flushing = {}
+                raise
+
+            with self._lock:
+                written = len(self._flushing)
+                self._flushing = {}
+                self._writes += written
+                self._flushes += 1
+            return written
+
+    def stats(self):
+        """
+        Returns ingestion counters since the buffer was created.
+
+        Returns:
+            dict: Ping and write counts, rates, and the coalescing ratio.
+        """
+        with self._lock:
+            pings, writes, flushes, pending = self._pings, self._writes, self._flushes, len(self._pending)
+        uptime = time.monotonic() - self._started_at
+        return {
+            'pings': pings,
+            'db_writes': writes,
+            'flushes': flushes,
+            'pending': pending,
+            'uptime_seconds': round(uptime, 3),
+            'pings_per_second': round(pings / uptime, 3) if uptime else 0,
+            'db_writes_per_second': round(writes / uptime, 3) if uptime else 0,
+            'coalescing_ratio': round(pings / writes, 3) if writes else None,
+        }
+
+
+location_buffer = LocationBuffer(getattr(settings, 'RIDER_LOCATION_FLUSH_INTERVAL', 2))
+
+
+@atexit.register
+def _flush_on_exit():
+    try:
+        location_buffer.flush()
+    except Exception:
+        logger.exception('Failed to flush rider locations on exit')
@@ -0,0 +1,79 @@
+import random
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import F, FloatField
+from django.db.models.functions import ACos, Cast, Cos, Radians, Sin
+from rider.management.seeding import CITY_CENTER, random_point, seed_riders
+from rider.models import Rider
+
+
+def full_scan_queryset(latitude, longitude, distance_range):
+    """
+    Builds the rider range query without the bounding-box prefilter.
+    """
+    return Rider.objects.annotate(
+        distance=Cast(
+            6371 * ACos(
+                Cos(Radians(latitude)) * Cos(Radians(F('latitude'))) *
+                Cos(Radians(F('longitude')) - Radians(longitude)) +
+                Sin(Radians(latitude)) * Sin(Radians(F('latitude')))
+            ),
+            output_field=FloatField()
+        )
+    ).filter(distance__lte=distance_range, status=Rider.IDLE).order_by('distance')
+
+
+class Command(BaseCommand):
+    """
+    Benchmarks the database rider range query with and without the bounding-box prefilter.
+
+    The riders are seeded inside a transaction that is rolled back at the end
+    of each run, so the command leaves the database untouched.
+    """
+
+    help = 'Benchmarks the rider range query at several fleet sizes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[10000, 100000, 1000000])
+        parser.add_argument('--queries', type=int, default=20, help='Number of timed queries per variant.')
+        parser.add_argument('--radius', type=float, default=2, help='Search radius in kilometers.')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        for size in options['sizes']:
+            with transaction.atomic():
+                self.run(size, options)
+                transaction.set_rollback(True)
+
+    def run(self, size, options):
+        rng = random.Random(options['seed'])
+        self.stdout.write(f'Seeding {size} riders...')
+        seed_riders(size, f'bench-range-{size}', rng, busy_ratio=0.3)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        centers = [random_point(rng, CITY_CENTER, 10) for _ in range(options['queries'])]
+        variants = (
+            ('full scan', full_scan_queryset),
+            ('bounding box', Rider._get_riders_within_range_from_db),
+        )
+
+        results = {}
+        for name, build_queryset in variants:
+            plan = build_queryset(*centers[0], options['radius']).explain()
+            self.stdout.write(f'\n[{size} riders] {name} query plan:\n{plan}')
+
+            timings = []
+            for latitude, longitude in centers:
+                started = time.perf_counter()
+                list(build_queryset(latitude, longitude, options['radius']).values_list('pk', 'distance'))
+                timings.append((time.perf_counter() - started) * 1000)
+            results[name] = statistics.median(timings)
+
+        speedup = results['full scan'] / results['bounding box'] if results['bounding box'] else float('inf')
+        self.stdout.write(self.style.SUCCESS(
+            f'\n[{size} riders] median full scan {results["full scan"]:.2f} ms, '
+            f'bounding box {results["bounding box"]:.2f} ms, speedup {speedup:.1f}x\n'
+        ))
@@ -0,0 +1,76 @@
+import random
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import Length
+from rider.management.seeding import seed_riders
+from rider.models import RiderTrackSegment
+from rider.tracks import BYTES_PER_PING, TrackStore
+
+
+class Command(BaseCommand):
+    """
+    Benchmarks the rider track store.
+
+    Simulates a day of pings for a fleet of riders, then reports the append
+    and flush throughput, the stored bytes per ping and the latency of a
+    one-hour window read. Everything is rolled back at the end.
+    """
+
+    help = 'Benchmarks appending to and reading from the rider track store.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--riders', type=int, default=1000)
+        parser.add_argument('--pings', type=int, default=500, help='Pings per rider.')
+        parser.add_argument('--flushes', type=int, default=10, help='Number of flushes the pings are spread over.')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.run(options)
+            transaction.set_rollback(True)
+
+    def run(self, options):
+        rng = random.Random(options['seed'])
+        riders = seed_riders(options['riders'], 'bench-tracks', rng)
+        store = TrackStore(flush_interval=None)
+
+        # Random walk starting at the riders' positions, one ping every 5-15 s
+        day_start = 1767225600  # 2026-01-01T00:00:00Z
+        state = {rider.pk: [day_start, float(rider.latitude), float(rider.longitude)] for rider in riders}
+        per_flush = max(1, options['pings'] // options['flushes'])
+
+        append_seconds = flush_seconds = 0
+        total = 0
+        for _ in range(0, options['pings'], per_flush):
+            batch = []
+            for rider_id, position in state.items():
+                for _ in range(per_flush):
+                    position[0] += rng.uniform(5, 15)
+                    position[1] += rng.gauss(0, 0.0002)
+                    position[2] += rng.gauss(0, 0.0002)
+                    batch.append((rider_id, position[0], position[1], position[2]))
+
+            started = time.perf_counter()
+            store.append_many(batch)
+            append_seconds += time.perf_counter() - started
+
+            started = time.perf_counter()
+            total += store.flush()
+            flush_seconds += time.perf_counter() - started
+
+        stored = RiderTrackSegment.objects.aggregate(size=Sum(Length('data')))['size'] or 0
+
+        rider_id = riders[0].pk
+        started = time.perf_counter()
+        window = store.window(rider_id, day_start + 3600, day_start + 7200)
+        window_ms = (time.perf_counter() - started) * 1000
+
+        self.stdout.write(
+            f'{total} pings for {len(riders)} riders\n'
+            f'append: {total / append_seconds:,.0f} pings/s\n'
+            f'flush: {total / flush_seconds:,.0f} pings/s ({options["flushes"]} flushes)\n'
+            f'storage: {stored / total:.2f} bytes/ping (target {BYTES_PER_PING})\n'
+            f'one-hour window read: {len(window)} pings in {window_ms:.2f} ms'
+        )
@@ -0,0 +1,69 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from geo import EtaMatrix, bounding_box
+from restaurant.models import Restaurant
+from rider.models import Rider
+
+
+class Command(BaseCommand):
+    """
+    Builds the cell-to-cell ETA matrix over the area of the restaurants and riders.
+
+    The travel times start from the straight-line distance between cell
+    centers and are then refined by the deliveries observed at run time.
+    Rebuilding discards those observations.
+    """
+
+    help = 'Builds the precomputed ETA matrix used to rank riders by travel time.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=str(getattr(settings, 'ETA_MATRIX_PATH', 'eta_matrix.npy')))
+        parser.add_argument('--cell-km', type=float, default=0.5, help='Side of a grid cell.')
+        parser.add_argument('--margin-km', type=float, default=2, help='Margin around the known locations.')
+        parser.add_argument('--speed-kmh', type=float, default=20, help='Average travel speed.')
+        parser.add_argument('--detour', type=float, default=1.3, help='Road to straight-line distance ratio.')
+        parser.add_argument('--overhead-seconds', type=float, default=60, help='Fixed time added to every trip.')
+        parser.add_argument('--smoothing', type=float, default=0.2, help='Weight of an observed travel time.')
+
+    def handle(self, *args, **options):
+        extents = [
+            model.objects.aggregate(
+                min_lat=Min('latitude'), max_lat=Max('latitude'), min_lng=Min('longitude'), max_lng=Max('longitude')
+            )
+            for model in (Restaurant, Rider)
+        ]
+        extents = [extent for extent in extents if extent['min_lat'] is not None]
+        if not extents:
+            raise CommandError('There are no restaurants or riders to derive the area from.')
+
+        min_lat = float(min(extent['min_lat'] for extent in extents))
+        max_lat = float(max(extent['max_lat'] for extent in extents))
+        min_lng = float(min(extent['min_lng'] for extent in extents))
+        max_lng = float(max(extent['max_lng'] for extent in extents))
+        # Longitude margins are widest at the latitude furthest from the equator.
+        widest = max(min_lat, max_lat, key=abs)
+        bounds = (
+            bounding_box(min_lat, min_lng, options['margin_km'])[0],
+            bounding_box(max_lat, max_lng, options['margin_km'])[1],
+            bounding_box(widest, min_lng, options['margin_km'])[2],
+            bounding_box(widest, max_lng, options['margin_km'])[3],
+        )
+
+        rows, cols, _, _ = EtaMatrix.grid_shape(bounds, options['cell_km'])
+        cells = rows * cols
+        self.stdout.write(f'Building a {rows}x{cols} grid: {cells} cells, {cells * cells * 4 / 2 ** 20:.1f} MiB')
+
+        started = time.perf_counter()
+        matrix = EtaMatrix.build(
+            options['path'],
+            bounds,
+            cell_km=options['cell_km'],
+            speed_kmh=options['speed_kmh'],
+            detour=options['detour'],
+            overhead_seconds=options['overhead_seconds'],
+            smoothing=options['smoothing'],
+        )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'Wrote {matrix.path} in {elapsed:.2f} s'))
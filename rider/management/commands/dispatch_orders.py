@@ -0,0 +1,43 @@
+import time
+from django.core.management.base import BaseCommand
+from rider.dispatch import AUTO, GREEDY, HUNGARIAN, BatchDispatcher
+
+
+class Command(BaseCommand):
+    """
+    Assigns pending orders to free riders in batches.
+
+    Runs a single round by default, or keeps running a round every
+    --interval seconds.
+    """
+
+    help = 'Assigns all pending orders to free riders in one optimization round.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=(AUTO, HUNGARIAN, GREEDY), default=AUTO)
+        parser.add_argument('--max-km', type=float, default=2, help='Maximum rider to restaurant distance.')
+        parser.add_argument('--greedy-threshold', type=int, default=2000,
+                            help='In auto mode, solve greedily above this many orders or riders.')
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Seconds between rounds; 0 runs a single round.')
+
+    def handle(self, *args, **options):
+        dispatcher = BatchDispatcher(
+            max_km=options['max_km'],
+            mode=options['mode'],
+            greedy_threshold=options['greedy_threshold'],
+        )
+
+        while True:
+            started = time.perf_counter()
+            assignments = dispatcher.run()
+            elapsed = (time.perf_counter() - started) * 1000
+
+            total_km = sum(distance for _, _, distance in assignments)
+            self.stdout.write(
+                f'Assigned {len(assignments)} orders ({total_km:.2f} km total pickup distance) in {elapsed:.1f} ms'
+            )
+
+            if options['interval'] <= 0:
+                break
+            time.sleep(options['interval'])
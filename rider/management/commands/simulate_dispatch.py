@@ -0,0 +1,337 @@
+import heapq
+import itertools
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+from accounts.models import User
+from geo.grid import KM_PER_DEGREE
+from orders.models import Order
+from restaurant.models import Restaurant
+from restaurant.views import NearestRiderView
+from rider.index import rider_index
+from rider.locations import location_buffer
+from rider.management.seeding import CITY_CENTER, random_point, seed_riders, seed_users
+from rider.models import Rider
+from rider.tracks import track_store
+from rider.views import RiderUpdateLocationView, RiderUpdateOrderView
+
+DISPATCH = 'dispatch'
+LOCATION = 'location'
+DELIVERY = 'delivery'
+RANGE = 'range'
+
+
+def poisson_arrivals(rng, rate, duration):
+    """
+    Draws the arrival times of a Poisson process.
+
+    Args:
+        rng (random.Random): Random number generator.
+        rate (float): Mean number of arrivals per second.
+        duration (float): Length of the process in seconds.
+
+    Returns:
+        list: The arrival times in seconds, in increasing order.
+    """
+    arrivals = []
+    if rate <= 0:
+        return arrivals
+    now = rng.expovariate(rate)
+    while now < duration:
+        arrivals.append(now)
+        now += rng.expovariate(rate)
+    return arrivals
+
+
+def summarize(samples, errors, elapsed):
+    """
+    Summarizes the latencies and query counts of one kind of operation.
+
+    Operations that raised have no meaningful latency, so they are only
+    counted, by exception type.
+
+    Args:
+        samples (list): (latency in seconds, query count, status) tuples of the completed operations.
+        errors (dict): {exception name: count} of the failed operations.
+        elapsed (float): Length of the run in seconds.
+
+    Returns:
+        dict: Counts, throughput, errors, latency percentiles and queries per request.
+    """
+    error_count = sum(errors.values())
+    if not samples:
+        return {'count': 0, 'errors': error_count, 'error_types': dict(sorted(errors.items()))}
+
+    latencies = np.array([latency for latency, _, _ in samples]) * 1000
+    queries = np.array([count for _, count, _ in samples])
+    statuses = defaultdict(int)
+    for _, _, status_code in samples:
+        statuses[str(status_code)] += 1
+
+    return {
+        'count': len(samples),
+        'throughput_per_second': round(len(samples) / elapsed, 2),
+        'statuses': dict(sorted(statuses.items())),
+        'errors': error_count,
+        'error_types': dict(sorted(errors.items())),
+        'latency_ms': {
+            'p50': round(float(np.percentile(latencies, 50)), 3),
+            'p95': round(float(np.percentile(latencies, 95)), 3),
+            'p99': round(float(np.percentile(latencies, 99)), 3),
+            'max': round(float(latencies.max()), 3),
+            'mean': round(float(latencies.mean()), 3),
+        },
+        'queries_per_request': {
+            'mean': round(float(queries.mean()), 3),
+            'max': int(queries.max()),
+        },
+    }
+
+
+def error_rate(summary):
+    """
+    Returns the share of the operations of a summary that raised.
+
+    Args:
+        summary (dict): A summary returned by summarize().
+
+    Returns:
+        float: Failed operations over all operations, 0 if there were none.
+    """
+    errors = summary.get('errors', 0)
+    total = summary.get('count', 0) + errors
+    return errors / total if total else 0.0
+
+
+class Command(BaseCommand):
+    """
+    Simulates a city's dispatch load against the real views, in-process.
+
+    Riders random-walk around the city and post their location, orders
+    arrive as a Poisson stream and are dispatched through NearestRiderView,
+    assigned riders deliver after a fixed time, and restaurants look up the
+    riders in range. Every operation is timed and its queries counted, and
+    the report is printed as JSON so that two builds can be diffed. Given a
+    --baseline report, the command fails when an operation's p95 latency,
+    mean query count or error rate regressed beyond --max-regression. Every seeded row is
+    deleted at the end of the run.
+    """
+
+    help = 'Simulates dispatch load and reports latency percentiles, queries per request and throughput as JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--restaurants', type=int, default=50)
+        parser.add_argument('--riders', type=int, default=1000)
+        parser.add_argument('--duration', type=float, default=10, help='Length of the simulation in seconds.')
+        parser.add_argument('--order-rate', type=float, default=20, help='Mean orders per second.')
+        parser.add_argument('--ping-interval', type=float, default=5, help='Mean seconds between two pings of a rider.')
+        parser.add_argument('--range-rate', type=float, default=10, help='Mean rider range lookups per second.')
+        parser.add_argument('--delivery-seconds', type=float, default=3, help='Time from assignment to delivery.')
+        parser.add_argument('--step-km', type=float, default=0.05, help='Standard deviation of a random-walk step.')
+        parser.add_argument('--spread-km', type=float, default=5, help='Half side of the simulated city.')
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout.')
+        parser.add_argument('--baseline', help='JSON report of a previous run to compare against.')
+        parser.add_argument('--max-regression', type=float, default=0.2,
+                            help='Allowed relative increase of p95 latency and mean queries over the baseline.')
+
+    def handle(self, *args, **options):
+        prefix = f'sim-{uuid.uuid4().hex[:8]}'
+        try:
+            report = self.simulate(prefix, options)
+        finally:
+            # Write the buffers before the rows they point to go away.
+            location_buffer.flush()
+            track_store.flush()
+            User.objects.filter(email__startswith=prefix).delete()
+            rider_index.clear()
+
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as report_file:
+                report_file.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+        if options['baseline']:
+            self.check_regressions(report, options['baseline'], options['max_regression'])
+
+    def simulate(self, prefix, options):
+        rng = random.Random(options['seed'])
+        center, spread_km = CITY_CENTER, options['spread_km']
+
+        riders = seed_riders(options['riders'], prefix, rng, center=center, spread_km=spread_km)
+        managers = seed_users(options['restaurants'], f'{prefix}-manager', User.RESTAURANT)
+        restaurants = []
+        for manager in managers:
+            latitude, longitude = random_point(rng, center, spread_km)
+            restaurants.append(Restaurant.objects.create(
+                restaurant_manager=manager,
+                restaurant_name=manager.email[:30],
+                restaurant_phone='0000000000',
+                opening_time='00:00',
+                closing_time='23:59',
+                latitude=latitude,
+                longitude=longitude,
+            ))
+        customer = seed_users(1, f'{prefix}-customer', User.USER)[0]
+
+        duration = options['duration']
+        order_times = poisson_arrivals(rng, options['order_rate'], duration)
+        orders = Order.objects.bulk_create([
+            Order(user=customer, restaurant=rng.choice(restaurants), is_placed=True) for _ in order_times
+        ])
+        users = {user.pk: user for user in User.objects.filter(email__startswith=f'{prefix}-rider')}
+        rider_users = {rider.pk: users[rider.rider_id] for rider in riders}
+        positions = {rider.pk: (float(rider.latitude), float(rider.longitude)) for rider in riders}
+        Rider.warm_location_index()
+
+        # Event schedule: (time, sequence, kind, payload).
+        counter = itertools.count()
+        schedule = [(at, next(counter), DISPATCH, order) for at, order in zip(order_times, orders)]
+        ping_rate = len(riders) / options['ping_interval'] if options['ping_interval'] > 0 else 0
+        schedule += [(at, next(counter), LOCATION, rng.choice(riders).pk)
+                     for at in poisson_arrivals(rng, ping_rate, duration)]
+        schedule += [(at, next(counter), RANGE, rng.choice(restaurants))
+                     for at in poisson_arrivals(rng, options['range_rate'], duration)]
+        heapq.heapify(schedule)
+
+        factory = APIRequestFactory()
+        views = {
+            DISPATCH: NearestRiderView.as_view(),
+            LOCATION: RiderUpdateLocationView.as_view(),
+            DELIVERY: RiderUpdateOrderView.as_view(),
+        }
+        lock = threading.Lock()
+        samples = defaultdict(list)
+        errors = defaultdict(lambda: defaultdict(int))
+        walk_rng = random.Random(options['seed'] + 1)
+        lat_step = options['step_km'] / KM_PER_DEGREE
+        lng_step = lat_step / math.cos(math.radians(center[0]))
+
+        def measure(kind, call):
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                status_code = call()
+                latency = time.perf_counter() - started
+            with lock:
+                samples[kind].append((latency, len(queries), status_code))
+            return status_code
+
+        def dispatch(order):
+            request = factory.get(f'/api/restaurant/nearest-rider/{order.restaurant_id}/{order.pk}')
+            force_authenticate(request, user=order.restaurant.restaurant_manager)
+            status_code = measure(DISPATCH, lambda: view_status(DISPATCH, request, restaurant_id=order.restaurant_id, order_id=order.pk))
+            if status_code == 200:
+                rider_id = Rider.objects.filter(order=order).values_list('pk', flat=True).first()
+                if rider_id is not None:
+                    with lock:
+                        deliver_at = time.perf_counter() - started_at + options['delivery_seconds']
+                        heapq.heappush(schedule, (deliver_at, next(counter), DELIVERY, rider_id))
+
+        def move(rider_id):
+            with lock:
+                latitude, longitude = positions[rider_id]
+                latitude += walk_rng.gauss(0, lat_step)
+                longitude += walk_rng.gauss(0, lng_step)
+                positions[rider_id] = (latitude, longitude)
+            request = factory.post('/api/rider/update/location', {'latitude': latitude, 'longitude': longitude}, format='json')
+            force_authenticate(request, user=rider_users[rider_id])
+            measure(LOCATION, lambda: view_status(LOCATION, request))
+
+        def deliver(rider_id):
+            request = factory.post('/api/rider/update/order', {}, format='json')
+            force_authenticate(request, user=rider_users[rider_id])
+            measure(DELIVERY, lambda: view_status(DELIVERY, request))
+
+        def lookup(restaurant):
+            def call():
+                len(Rider.get_riders_within_range(restaurant.latitude, restaurant.longitude, NearestRiderView.max_range))
+                return 200
+            measure(RANGE, call)
+
+        def view_status(kind, request, **kwargs):
+            return views[kind](request, **kwargs).status_code
+
+        handlers = {DISPATCH: dispatch, LOCATION: move, DELIVERY: deliver, RANGE: lookup}
+
+        in_flight = [0]
+
+        def run(kind, payload):
+            try:
+                handlers[kind](payload)
+            except Exception as exc:
+                with lock:
+                    errors[kind][type(exc).__name__] += 1
+            finally:
+                connection.close()
+                with lock:
+                    in_flight[0] -= 1
+
+        max_lag = 0.0
+        started_at = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as executor:
+            while True:
+                now = time.perf_counter() - started_at
+                with lock:
+                    # Deliveries are scheduled by the dispatches still running.
+                    if not schedule and not in_flight[0]:
+                        break
+                    event = heapq.heappop(schedule) if schedule and schedule[0][0] <= now else None
+                    if event is not None:
+                        in_flight[0] += 1
+                if event is None:
+                    time.sleep(0.001)
+                    continue
+                at, _, kind, payload = event
+                max_lag = max(max_lag, now - at)
+                executor.submit(run, kind, payload)
+        elapsed = time.perf_counter() - started_at
+
+        return {
+            'config': {
+                key: options[key] for key in (
+                    'restaurants', 'riders', 'duration', 'order_rate', 'ping_interval', 'range_rate',
+                    'delivery_seconds', 'step_km', 'spread_km', 'threads', 'seed',
+                )
+            },
+            'elapsed_seconds': round(elapsed, 3),
+            'max_schedule_lag_ms': round(max_lag * 1000, 3),
+            'operations': {
+                kind: summarize(samples[kind], errors[kind], elapsed) for kind in (DISPATCH, LOCATION, DELIVERY, RANGE)
+            },
+        }
+
+    def check_regressions(self, report, baseline_path, max_regression):
+        with open(baseline_path) as baseline_file:
+            baseline = json.load(baseline_file)
+
+        regressions = []
+        for kind, current in report['operations'].items():
+            previous = baseline.get('operations', {}).get(kind)
+            if not previous:
+                continue
+            before, after = error_rate(previous), error_rate(current)
+            if after > before * (1 + max_regression):
+                regressions.append(f'{kind} error rate: {before:.2%} -> {after:.2%}')
+            if not previous.get('count') or not current.get('count'):
+                continue
+            for metric, key in (('latency_ms', 'p95'), ('queries_per_request', 'mean')):
+                before, after = previous[metric][key], current[metric][key]
+                if before and after > before * (1 + max_regression):
+                    regressions.append(f'{kind} {metric}.{key}: {before} -> {after}')
+
+        if regressions:
+            raise CommandError('Performance regressions over the baseline:\n' + '\n'.join(regressions))
+        self.stderr.write(self.style.SUCCESS('No regression over the baseline.'))
@@ -0,0 +1,112 @@
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db import connection
+from rest_framework.test import APIRequestFactory, force_authenticate
+from accounts.models import User
+from orders.models import Order
+from restaurant.models import Restaurant
+from restaurant.views import NearestRiderView
+from rider.management.seeding import CITY_CENTER, random_point, seed_riders, seed_users
+from rider.models import Rider
+
+
+class Command(BaseCommand):
+    """
+    Hammers the nearest rider endpoint from a thread pool.
+
+    Restaurants and riders are packed into a small area so that concurrent
+    dispatches compete for the same riders. Every seeded row is deleted at
+    the end of the run.
+    """
+
+    help = 'Stress tests concurrent rider claiming and reports claims/sec and the conflict rate.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--restaurants', type=int, default=20)
+        parser.add_argument('--riders', type=int, default=200)
+        parser.add_argument('--orders', type=int, default=200)
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--spread-km', type=float, default=1, help='Half side of the seeded area.')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        prefix = f'stress-{uuid.uuid4().hex[:8]}'
+        try:
+            self.run(prefix, options)
+        finally:
+            User.objects.filter(email__startswith=prefix).delete()
+
+    def run(self, prefix, options):
+        rng = random.Random(options['seed'])
+        seed_riders(options['riders'], prefix, rng, spread_km=options['spread_km'])
+        managers = seed_users(options['restaurants'], f'{prefix}-manager', User.RESTAURANT)
+        restaurants = []
+        for manager in managers:
+            latitude, longitude = random_point(rng, CITY_CENTER, options['spread_km'])
+            restaurants.append(Restaurant.objects.create(
+                restaurant_manager=manager,
+                restaurant_name=manager.email[:30],
+                restaurant_phone='0000000000',
+                opening_time='00:00',
+                closing_time='23:59',
+                latitude=latitude,
+                longitude=longitude,
+            ))
+        customer = seed_users(1, f'{prefix}-customer', User.USER)[0]
+        orders = Order.objects.bulk_create([
+            Order(user=customer, restaurant=rng.choice(restaurants), is_placed=True)
+            for _ in range(options['orders'])
+        ])
+        Rider.warm_location_index()
+
+        lock = threading.Lock()
+        counts = {'attempts': 0, 'conflicts': 0}
+        claim = Rider.claim
+
+        def counting_claim(rider, order):
+            claimed = claim(rider, order)
+            with lock:
+                counts['attempts'] += 1
+                counts['conflicts'] += not claimed
+            return claimed
+
+        factory = APIRequestFactory()
+        view = NearestRiderView.as_view()
+
+        def dispatch(order):
+            request = factory.get(f'/api/restaurant/nearest-rider/{order.restaurant_id}/{order.pk}')
+            force_authenticate(request, user=order.restaurant.restaurant_manager)
+            try:
+                return view(request, restaurant_id=order.restaurant_id, order_id=order.pk).status_code
+            finally:
+                connection.close()
+
+        Rider.claim = counting_claim
+        try:
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['threads']) as executor:
+                statuses = list(executor.map(dispatch, orders))
+            elapsed = time.perf_counter() - started
+        finally:
+            Rider.claim = claim
+
+        claimed = statuses.count(200)
+        double_assigned = (
+            Rider.objects.filter(rider__email__startswith=prefix, status=Rider.ASSIGNED).count() != claimed
+        )
+        conflict_rate = counts['conflicts'] / counts['attempts'] if counts['attempts'] else 0
+
+        self.stdout.write(
+            f'{len(orders)} dispatches on {options["threads"]} threads in {elapsed:.2f} s\n'
+            f'claims: {claimed} ({claimed / elapsed:.1f}/s), no rider: {statuses.count(404)}, '
+            f'other errors: {len(statuses) - claimed - statuses.count(404)}\n'
+            f'claim attempts: {counts["attempts"]}, conflicts: {counts["conflicts"]} ({conflict_rate:.1%})'
+        )
+        if double_assigned:
+            self.stderr.write('Mismatch between successful claims and busy riders: a rider was claimed twice.')
+        else:
+            self.stdout.write(self.style.SUCCESS('Every claimed rider was assigned exactly once.'))
@@ -0,0 +1,82 @@
+import math
+from accounts.models import User
+from geo.grid import KM_PER_DEGREE
+from rider.models import Rider
+
+# Default center of the seeded city.
+CITY_CENTER = (18.5204, 73.8567)
+
+
+def random_point(rng, center=CITY_CENTER, spread_km=15):
+    """
+    Picks a uniformly random point in a square around a center.
+
+    Args:
+        rng (random.Random): Random number generator.
+        center (tuple): (latitude, longitude) of the square's center.
+        spread_km (float): Half the side of the square in kilometers.
+
+    Returns:
+        tuple: (latitude, longitude) rounded to the model's precision.
+    """
+    lat_delta = spread_km / KM_PER_DEGREE
+    lng_delta = lat_delta / math.cos(math.radians(center[0]))
+    return (
+        round(center[0] + rng.uniform(-lat_delta, lat_delta), 6),
+        round(center[1] + rng.uniform(-lng_delta, lng_delta), 6),
+    )
+
+
+def seed_users(count, prefix, role, batch_size=10000):
+    """
+    Bulk creates users that cannot log in.
+
+    Args:
+        count (int): Number of users to create.
+        prefix (str): Prefix of the generated email addresses.
+        role (int): Role of the users.
+        batch_size (int): Number of rows inserted per query.
+
+    Returns:
+        list: The created users.
+    """
+    users = []
+    for start in range(0, count, batch_size):
+        batch = [
+            User(email=f'{prefix}-{index}@example.com', phone='0000000000', role=role, password='!')
+            for index in range(start, min(count, start + batch_size))
+        ]
+        users.extend(User.objects.bulk_create(batch, batch_size=batch_size))
+    return users
+
+
+def seed_riders(count, prefix, rng, center=CITY_CENTER, spread_km=15, busy_ratio=0.0, batch_size=10000):
+    """
+    Bulk creates riders scattered around a city.
+
+    Args:
+        count (int): Number of riders to create.
+        prefix (str): Prefix of the generated email addresses.
+        rng (random.Random): Random number generator.
+        center (tuple): (latitude, longitude) of the city's center.
+        spread_km (float): Half the side of the seeded area in kilometers.
+        busy_ratio (float): Fraction of riders already busy with an order.
+        batch_size (int): Number of rows inserted per query.
+
+    Returns:
+        list: The created riders.
+    """
+    users = seed_users(count, f'{prefix}-rider', User.RIDER, batch_size=batch_size)
+    riders = []
+    for user in users:
+        latitude, longitude = random_point(rng, center, spread_km)
+        busy = rng.random() < busy_ratio
+        riders.append(Rider(
+            rider=user,
+            latitude=latitude,
+            longitude=longitude,
+            status=Rider.ASSIGNED if busy else Rider.IDLE,
+            is_picked_up=busy,
+        ))
+    return Rider.objects.bulk_create(riders, batch_size=batch_size)
+
@@ -1,9 +1,16 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.utils import timezone
 from accounts.models import User
 from orders.models import Order
-from django.db.models.functions import ACos, Cos, Radians, Sin
-from django.db.models import F, FloatField
-from django.db.models.functions import Cast
+from orders.tracking import order_hub
+from django.db.models import Exists, OuterRef, Q
+from geo import Haversine, bounding_box_q, haversine_km
+from .index import rider_index
+from .locations import location_buffer
+
+# Seconds after which the rider index is reloaded from the database, so that
+# changes made by other worker processes are eventually picked up.
+RIDER_INDEX_MAX_AGE = 60
 
 class Rider(models.Model):
     """
@@ -16,14 +23,62 @@ class Rider(models.Model):
         longitude (Decimal): The longitude of the rider's location.
         is_picked_up (bool): A flag indicating if the rider has been picked up for an order.
         is_delivered (bool): A flag indicating if the order has been delivered to the rider.
+        status (str): The rider's availability (choices defined in STATUS_CHOICES).
     """
 
+    OFFLINE = 'offline'
+    IDLE = 'idle'
+    ASSIGNED = 'assigned'
+    PICKED_UP = 'picked_up'
+    DELIVERING = 'delivering'
+
+    STATUS_CHOICES = (
+        (OFFLINE, 'Offline'),
+        (IDLE, 'Idle'),
+        (ASSIGNED, 'Assigned'),
+        (PICKED_UP, 'Picked up'),
+        (DELIVERING, 'Delivering'),
+    )
+
+    # Statuses a rider may move to from each status. Going back to idle
+    # from a busy status ends the current order.
+    TRANSITIONS = {
+        OFFLINE: (IDLE,),
+        IDLE: (OFFLINE, ASSIGNED),
+        ASSIGNED: (PICKED_UP, IDLE),
+        PICKED_UP: (DELIVERING, IDLE),
+        DELIVERING: (IDLE,),
+    }
+
+    BUSY_STATUSES = (ASSIGNED, PICKED_UP, DELIVERING)
+
+    class Meta:
+        indexes = [
+            # Partial index on the idle riders only: serves the bounding-box
+            # prefilter of dispatch without scanning busy or offline riders.
+            models.Index(
+                fields=['latitude', 'longitude'],
+                name='rider_idle_location_idx',
+                condition=Q(status='idle'),
+            ),
+        ]
+        constraints = [
+            # An order is held by at most one busy rider, even when two
+            # claims for it commit at the same time.
+            models.UniqueConstraint(
+                fields=['order'],
+                name='rider_busy_order_unique',
+                condition=Q(status__in=('assigned', 'picked_up', 'delivering')),
+            ),
+        ]
+
     rider = models.OneToOneField(User, on_delete=models.CASCADE)
     order = models.ForeignKey(Order, on_delete=models.CASCADE, blank=True, null=True)
     latitude = models.DecimalField(max_digits=9, decimal_places=6)
     longitude = models.DecimalField(max_digits=9, decimal_places=6)
     is_picked_up = models.BooleanField(default=False)
     is_delivered = models.BooleanField(default=False)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=IDLE)
 
     def __str__(self):
         """
@@ -34,26 +89,326 @@ class Rider(models.Model):
         """
         return str(self.rider)
 
+    @classmethod
+    def warm_location_index(cls):
+        """
+        Loads the locations of all available riders into the rider index.
+
+        Positions that are still waiting in the location buffer take
+        precedence over the ones stored in the database.
+        """
+        riders = cls.objects.filter(status=cls.IDLE).values_list('pk', 'latitude', 'longitude')
+        rider_index.load(
+            (pk, *location_buffer.position(pk, (latitude, longitude))) for pk, latitude, longitude in riders
+        )
+
     @classmethod
     def get_riders_within_range(cls, restaurant_latitude, restaurant_longitude, distance_range):
         """
         Gets riders within a specified distance range from a restaurant.
 
+        The rider index answers the lookup by visiting only the grid cells
+        around the restaurant. While the index is cold or stale the distance is
+        computed in the database instead, and the index is reloaded for the
+        next lookup.
+
         Args:
             restaurant_latitude (float): The latitude of the restaurant.
             restaurant_longitude (float): The longitude of the restaurant.
             distance_range (float): The distance range in kilometers.
 
         Returns:
-            QuerySet: Queryset of riders within the specified distance range.
+            list: Riders within the specified distance range, nearest first, each with a distance attribute.
         """
-        return cls.objects.annotate(
-            distance=Cast(
-                6371 * ACos(
-                    Cos(Radians(restaurant_latitude)) * Cos(Radians(F('latitude'))) *
-                    Cos(Radians(F('longitude')) - Radians(restaurant_longitude)) +
-                    Sin(Radians(restaurant_latitude)) * Sin(Radians(F('latitude')))
-                ),
-                output_field=FloatField()
+        if rider_index.is_stale(RIDER_INDEX_MAX_AGE):
+            riders = cls._with_buffered_locations(
+                cls._get_riders_within_range_from_db(restaurant_latitude, restaurant_longitude, distance_range),
+                restaurant_latitude, restaurant_longitude, distance_range,
             )
-        ).filter(distance__lte=distance_range, is_picked_up=False).order_by('distance')
+            cls.warm_location_index()
+            return riders
+
+        nearby = rider_index.within(restaurant_latitude, restaurant_longitude, distance_range)
+        if not nearby:
+            return []
+
+        # The distances are attached in Python: one CASE branch per rider
+        # would grow the query with the number of riders in range.
+        available = cls.objects.filter(status=cls.IDLE).in_bulk([pk for _, pk in nearby])
+        riders = []
+        for rider_distance, pk in nearby:
+            rider = available.get(pk)
+            if rider is not None:
+                rider.apply_buffered_location()
+                rider.distance = rider_distance
+                riders.append(rider)
+        return riders
+
+    @classmethod
+    def nearest(cls, latitude, longitude, k=1, max_km=2):
+        """
+        Gets the k nearest available riders in a single index probe or query.
+
+        The riders are fetched together with their user and their order's
+        restaurant, so serializing them triggers no further queries.
+
+        Args:
+            latitude (float): The latitude of the pickup location.
+            longitude (float): The longitude of the pickup location.
+            k (int): The maximum number of riders to return.
+            max_km (float): The maximum distance in kilometers.
+
+        Returns:
+            list: Up to k riders sorted nearest first, each with a distance attribute.
+        """
+        if rider_index.is_stale(RIDER_INDEX_MAX_AGE):
+            nearest_riders = cls._nearest_from_db(latitude, longitude, k, max_km)
+            cls.warm_location_index()
+            return nearest_riders
+
+        # Over-fetch a little in case riders were taken by another process
+        # since the index was loaded.
+        nearby = rider_index.nearest(latitude, longitude, 2 * k, max_km)
+        if not nearby:
+            return []
+
+        available = cls.objects.select_related('rider', 'order__restaurant').filter(
+            status=cls.IDLE
+        ).in_bulk([pk for _, pk in nearby])
+        nearest_riders = []
+        for rider_distance, pk in nearby:
+            rider = available.get(pk)
+            if rider is not None:
+                rider.apply_buffered_location()
+                rider.distance = rider_distance
+                nearest_riders.append(rider)
+
+        if len(nearest_riders) < k and len(available) < len(nearby):
+            # So many candidates were taken that idle riders further away may
+            # be missing; the database has them all.
+            return cls._nearest_from_db(latitude, longitude, k, max_km)
+        return nearest_riders[:k]
+
+    @classmethod
+    def _nearest_from_db(cls, latitude, longitude, k, max_km):
+        riders = cls._get_riders_within_range_from_db(latitude, longitude, max_km)
+        return cls._with_buffered_locations(riders.select_related('rider', 'order__restaurant')[:k],
+                                            latitude, longitude, max_km)
+
+    @staticmethod
+    def _with_buffered_locations(riders, latitude, longitude, max_km):
+        # The database may lag behind the location buffer.
+        riders = list(riders)
+        for rider in riders:
+            rider.apply_buffered_location()
+            rider.distance = haversine_km(latitude, longitude, rider.latitude, rider.longitude)
+        return sorted((rider for rider in riders if rider.distance <= max_km), key=lambda rider: rider.distance)
+
+    @classmethod
+    def _get_riders_within_range_from_db(cls, restaurant_latitude, restaurant_longitude, distance_range):
+        # Narrow the candidates with an indexed bounding box so that the
+        # distance is only computed for riders that can be in range.
+        return cls.objects.filter(
+            bounding_box_q(restaurant_latitude, restaurant_longitude, distance_range),
+            status=cls.IDLE
+        ).annotate(
+            distance=Haversine(restaurant_latitude, restaurant_longitude, 'latitude', 'longitude')
+        ).filter(distance__lte=distance_range).order_by('distance')
+
+    @classmethod
+    def can_transition(cls, current, new):
+        """
+        Checks whether a rider may move from one status to another.
+
+        Args:
+            current (str): The rider's current status.
+            new (str): The status to move to.
+
+        Returns:
+            bool: True if the transition is allowed.
+        """
+        return new in cls.TRANSITIONS.get(current, ())
+
+    @classmethod
+    def unassigned_orders(cls):
+        """
+        Returns the orders that are neither delivered nor held by a busy rider.
+
+        Returns:
+            QuerySet: The orders a rider may still be assigned to.
+        """
+        busy_riders = cls.objects.filter(order=OuterRef('pk'), status__in=cls.BUSY_STATUSES)
+        return Order.objects.filter(~Exists(busy_riders), is_delivered=False)
+
+    def transition(self, new_status, condition=None, **updates):
+        """
+        Moves the rider to a new status if nobody changed it meanwhile.
+
+        The update is conditioned on the status held by the instance, so of
+        several concurrent transitions from the same status exactly one
+        applies. is_picked_up is kept in sync with the status.
+
+        Args:
+            new_status (str): The status to move to.
+            condition (Q or Exists, optional): Extra condition checked in the same update.
+            **updates: Other fields to write along with the status.
+
+        Returns:
+            bool: True if the transition was applied, False if the rider's status changed meanwhile.
+
+        Raises:
+            ValueError: If the transition is not allowed.
+        """
+        if not self.can_transition(self.status, new_status):
+            raise ValueError(f"A rider cannot go from {self.status} to {new_status}.")
+
+        updates.update(status=new_status, is_picked_up=new_status in self.BUSY_STATUSES)
+        riders = Rider.objects.filter(pk=self.pk, status=self.status)
+        if condition is not None:
+            riders = riders.filter(condition)
+        if not riders.update(**updates):
+            return False
+
+        for field, value in updates.items():
+            setattr(self, field, value)
+        return True
+
+    def claim(self, order):
+        """
+        Atomically assigns an order to the rider if both are still free.
+
+        The assignment is a conditional transition from idle to assigned that
+        also requires the order to be undelivered and not held by another
+        busy rider, so when several dispatches race for the same rider or the
+        same order exactly one of them wins. The winner also opens the order's
+        entry in the delivery ledger.
+
+        Args:
+            order (Order): The order to assign.
+
+        Returns:
+            bool: True if the rider was claimed, False if the rider or the order was taken first.
+        """
+        claimed = False
+        if self.status == self.IDLE:
+            with transaction.atomic():
+                try:
+                    with transaction.atomic():
+                        claimed = self.transition(
+                            self.ASSIGNED,
+                            condition=Exists(self.unassigned_orders().filter(pk=order.pk)),
+                            order=order,
+                        )
+                except IntegrityError:
+                    # A concurrent claim of the same order committed first.
+                    claimed = False
+                if claimed:
+                    DeliveryRecord.objects.create(rider=self, order=order)
+        if not claimed:
+            # Only a rider taken by someone else leaves the pool; a lost order
+            # leaves the rider idle.
+            if not Rider.objects.filter(pk=self.pk, status=self.IDLE).exists():
+                rider_index.remove(self.pk)
+            return False
+
+        rider_index.remove(self.pk)
+        order_hub.publish(order.pk, 'status', {'status': self.ASSIGNED, 'rider': self.pk})
+        return True
+
+    def apply_buffered_location(self):
+        """
+        Replaces the rider's location with the latest buffered ping, if any.
+        """
+        self.latitude, self.longitude = location_buffer.position(self.pk, (self.latitude, self.longitude))
+
+    def sync_location_index(self):
+        """
+        Reflects the rider's availability and location in the rider index.
+        """
+        self.apply_buffered_location()
+        if self.status != self.IDLE:
+            rider_index.remove(self.pk)
+        elif rider_index.is_warm:
+            rider_index.update(self.pk, self.latitude, self.longitude)
+
+
+class RiderTrackSegment(models.Model):
+    """
+    Model for a chunk of a rider's location history within one day.
+
+    Each flush of the track store adds one segment per rider and UTC day
+    with the pings staged since the previous flush, so writing never
+    reads or rewrites the history already stored. The pings are packed
+    into a binary blob of little-endian int32 triples (time delta in
+    milliseconds, latitude delta, longitude delta), with the coordinates
+    in fixed point at 1e-6 degrees. The pings are sorted by time, each
+    value is relative to the previous ping, and the first ping is relative
+    to base_time and to (0, 0), so a ping costs 12 bytes.
+
+    Attributes:
+        rider (Rider): The rider the history belongs to.
+        day (date): The UTC day covered by the segment.
+        base_time (int): Time of the first ping, in milliseconds since the epoch.
+        last_time (int): Time of the last ping, in milliseconds since the epoch.
+        ping_count (int): Number of pings in the segment.
+        data (bytes): The delta-encoded pings.
+    """
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['rider', 'day'], name='rider_track_day_idx'),
+        ]
+
+    rider = models.ForeignKey(Rider, on_delete=models.CASCADE, related_name='track_segments')
+    day = models.DateField()
+    base_time = models.BigIntegerField()
+    last_time = models.BigIntegerField()
+    ping_count = models.PositiveIntegerField(default=0)
+    data = models.BinaryField(default=b'')
+
+    def __str__(self):
+        """
+        String representation of the track segment.
+
+        Returns:
+            str: The rider and the day of the segment.
+        """
+        return f"{self.rider} on {self.day}"
+
+
+class DeliveryRecord(models.Model):
+    """
+    Model for one entry of the append-only delivery ledger.
+
+    A row is added every time an order is assigned to a rider and is only
+    ever completed afterwards, so a rider's history survives the rider being
+    assigned a new order.
+
+    Attributes:
+        rider (Rider): The rider the order was assigned to.
+        order (Order): The assigned order.
+        assigned_at (datetime): When the order was assigned to the rider.
+        picked_at (datetime): When the rider picked the order up, if known.
+        delivered_at (datetime): When the order was delivered, None while in progress.
+    """
+
+    class Meta:
+        indexes = [
+            # Serves the rider's delivery history, newest first.
+            models.Index(fields=['rider', 'delivered_at'], name='delivery_rider_delivered_idx'),
+        ]
+
+    rider = models.ForeignKey(Rider, on_delete=models.CASCADE, related_name='deliveries')
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='delivery_records')
+    assigned_at = models.DateTimeField(default=timezone.now)
+    picked_at = models.DateTimeField(blank=True, null=True)
+    delivered_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        """
+        String representation of the delivery record.
+
+        Returns:
+            str: The order and the rider of the record.
+        """
+        return f"Order {self.order_id} by rider {self.rider_id}"
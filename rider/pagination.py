@@ -0,0 +1,22 @@
+from rest_framework.pagination import CursorPagination
+
+
+class DeliveryHistoryPagination(CursorPagination):
+    """
+    Keyset pagination of a rider's delivery history, newest first.
+
+    Pages are located by the delivery time of the last record seen rather
+    than by an offset, so every page costs one range scan of the
+    (rider, delivered_at) index however deep the rider's history is.
+
+    Attributes:
+        page_size (int): The default number of records per page.
+        page_size_query_param (str): The query parameter overriding the page size.
+        max_page_size (int): The largest page size a client may ask for.
+        ordering (tuple): The fields the records are sorted by.
+    """
+
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    ordering = ('-delivered_at', '-id')
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Rider
+from .models import DeliveryRecord, Rider
 from orders.serializers import OrderSerializer
 
 class RiderSerializer(serializers.ModelSerializer):
@@ -13,6 +13,87 @@ class RiderSerializer(serializers.ModelSerializer):
     class Meta:
         model = Rider
         fields = '__all__'
+        # Availability only changes through the status endpoints
+        read_only_fields = ['status', 'is_picked_up', 'is_delivered']
+
+
+class RiderLocationSerializer(serializers.Serializer):
+    """
+    Serializer for a rider location update.
+
+    Attributes:
+        latitude (float): The latitude of the rider's location.
+        longitude (float): The longitude of the rider's location.
+    """
+
+    latitude = serializers.FloatField(min_value=-90, max_value=90)
+    longitude = serializers.FloatField(min_value=-180, max_value=180)
+
+
+class RiderLocationPingSerializer(RiderLocationSerializer):
+    """
+    Serializer for a single timestamped ping of a batch location upload.
+
+    Attributes:
+        rider (int): The ID of the rider; only admins may send pings for other riders.
+        timestamp (datetime): When the position was taken.
+    """
+
+    rider = serializers.IntegerField(required=False)
+    timestamp = serializers.DateTimeField()
+
+
+class RiderLocationBatchSerializer(serializers.Serializer):
+    """
+    Serializer for a batch location upload.
+
+    Attributes:
+        pings (list): The timestamped pings, in any order.
+    """
+
+    MAX_PINGS = 10000
+
+    pings = RiderLocationPingSerializer(many=True, allow_empty=False)
+
+    def validate_pings(self, pings):
+        """
+        Limits the number of pings per batch.
+
+        Args:
+            pings (list): The validated pings.
+
+        Returns:
+            list: The validated pings.
+        """
+        if len(pings) > self.MAX_PINGS:
+            raise serializers.ValidationError(f"A batch can hold at most {self.MAX_PINGS} pings.")
+        return pings
+
+
+class RiderOrderStatusSerializer(serializers.Serializer):
+    """
+    Serializer for a step of the rider's current order.
+
+    Attributes:
+        status (str): The step reached; defaults to delivered.
+    """
+
+    PICKED_UP = 'picked_up'
+    DELIVERING = 'delivering'
+    DELIVERED = 'delivered'
+
+    status = serializers.ChoiceField(choices=[PICKED_UP, DELIVERING, DELIVERED], default=DELIVERED)
+
+
+class RiderAvailabilitySerializer(serializers.Serializer):
+    """
+    Serializer for the rider's online/offline toggle.
+
+    Attributes:
+        online (bool): Whether the rider accepts orders.
+    """
+
+    online = serializers.BooleanField()
 
 
 class NearestRiderSerializer(serializers.Serializer):
@@ -26,6 +107,7 @@ class NearestRiderSerializer(serializers.Serializer):
         longitude (Decimal): The longitude of the rider's location.
         order_id (int): The ID of the associated order.
         restaurant_name (str): The name of the associated restaurant.
+        eta_seconds (float): Estimated travel time to the restaurant, when ranked by ETA.
     """
 
     name = serializers.SerializerMethodField()
@@ -34,6 +116,7 @@ class NearestRiderSerializer(serializers.Serializer):
     longitude = serializers.DecimalField(max_digits=9, decimal_places=6)
     order_id = serializers.SerializerMethodField()
     restaurant_name = serializers.SerializerMethodField()
+    eta_seconds = serializers.SerializerMethodField()
 
     def get_name(self, obj):
         """
@@ -86,3 +169,32 @@ class NearestRiderSerializer(serializers.Serializer):
         if obj.order and obj.order.restaurant:
             return obj.order.restaurant.restaurant_name
         return None
+
+    def get_eta_seconds(self, obj):
+        """
+        Returns the estimated travel time of the rider to the restaurant.
+
+        Args:
+            obj (Rider): The Rider object.
+
+        Returns:
+            float: The travel time in seconds, or None when not ranked by ETA.
+        """
+        eta = getattr(obj, 'eta', None)
+        return None if eta is None else round(float(eta), 1)
+
+
+class DeliveryRecordSerializer(serializers.ModelSerializer):
+    """
+    Serializer for an entry of the delivery ledger.
+
+    Attributes:
+        order (dict): The delivered order.
+        Meta (class): Metadata options for the serializer.
+    """
+
+    order = OrderSerializer(read_only=True)
+
+    class Meta:
+        model = DeliveryRecord
+        fields = ['id', 'order', 'assigned_at', 'picked_at', 'delivered_at']
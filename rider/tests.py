@@ -1,3 +1,524 @@
-from django.test import TestCase
+from datetime import datetime, timedelta, timezone
+from itertools import permutations
+import random
+from unittest import mock
+import numpy as np
+from django.test import SimpleTestCase, TestCase
+from rest_framework.test import APIClient
+from accounts.models import User
+from orders.models import Order
+from geo import GridIndex, haversine_km
+from restaurant.models import Restaurant
+from .dispatch import BatchDispatcher, solve_hungarian
+from .index import rider_index
+from .locations import LocationBuffer
+from .serializers import RiderLocationBatchSerializer
+from .models import DeliveryRecord, Rider, RiderTrackSegment
+from .tracks import TrackStore, decode_segment, encode_pings
 
-# Create your tests here.
+
+class SolveHungarianTests(SimpleTestCase):
+    """
+    Tests for the assignment solver of the batch dispatcher.
+    """
+
+    def brute_force(self, cost):
+        # Tries every assignment of the shorter side into the longer one.
+        n, m = cost.shape
+        if n <= m:
+            return min(sum(cost[row, col] for row, col in enumerate(cols)) for cols in permutations(range(m), n))
+        return min(sum(cost[row, col] for col, row in enumerate(rows)) for rows in permutations(range(n), m))
+
+    def test_matches_brute_force(self):
+        rng = np.random.default_rng(42)
+        for _ in range(200):
+            shape = tuple(rng.integers(1, 7, size=2))
+            cost = rng.integers(0, 20, size=shape).astype(float)
+
+            pairs = solve_hungarian(cost)
+
+            self.assertEqual(len(pairs), min(shape))
+            self.assertEqual(len({row for row, _ in pairs}), len(pairs))
+            self.assertEqual(len({col for _, col in pairs}), len(pairs))
+            self.assertEqual(sum(cost[row, col] for row, col in pairs), self.brute_force(cost))
+
+    def test_avoids_infeasible_pairs_when_possible(self):
+        # The dispatcher prices infeasible pairs above any feasible assignment.
+        cost = np.array([[1.0, 100.0], [2.0, 3.0]])
+
+        self.assertEqual(sorted(solve_hungarian(cost)), [(0, 0), (1, 1)])
+
+
+class GridIndexTests(SimpleTestCase):
+    """
+    Tests for the in-memory spatial index of riders.
+    """
+
+    def test_nearest_matches_brute_force(self):
+        rng = random.Random(3)
+        points = [(key, 18.52 + rng.uniform(-0.05, 0.05), 73.85 + rng.uniform(-0.05, 0.05)) for key in range(500)]
+        index = GridIndex()
+        index.load(points)
+
+        for _ in range(20):
+            latitude, longitude = 18.52 + rng.uniform(-0.04, 0.04), 73.85 + rng.uniform(-0.04, 0.04)
+            max_km = rng.uniform(0.5, 4)
+            expected = sorted(
+                (haversine_km(latitude, longitude, point_latitude, point_longitude), key)
+                for key, point_latitude, point_longitude in points
+            )
+            expected = [hit for hit in expected if hit[0] <= max_km]
+
+            self.assertEqual(index.nearest(latitude, longitude, 7, max_km), expected[:7])
+            self.assertEqual(index.within(latitude, longitude, max_km), expected)
+
+
+class RiderLookupTests(TestCase):
+    """
+    Tests for finding the available riders around a pickup location.
+    """
+
+    center = (18.52, 73.85)
+
+    def setUp(self):
+        rider_index.clear()
+        self.addCleanup(rider_index.clear)
+        rng = random.Random(5)
+        users = User.objects.bulk_create([
+            User(email=f'rider{index}@example.com', role=User.RIDER) for index in range(40)
+        ])
+        self.riders = Rider.objects.bulk_create([
+            Rider(
+                rider=user,
+                latitude=round(self.center[0] + rng.uniform(-0.02, 0.02), 6),
+                longitude=round(self.center[1] + rng.uniform(-0.02, 0.02), 6),
+                status=Rider.IDLE if index % 4 else Rider.OFFLINE,
+            )
+            for index, user in enumerate(users)
+        ])
+
+    def brute_force(self, max_km):
+        distances = [
+            (haversine_km(*self.center, rider.latitude, rider.longitude), rider.pk)
+            for rider in self.riders if rider.status == Rider.IDLE
+        ]
+        return [pk for distance, pk in sorted(distances) if distance <= max_km]
+
+    def test_nearest_matches_brute_force_on_both_paths(self):
+        expected = self.brute_force(2)[:5]
+
+        # The first lookup runs in the database and warms the index.
+        from_db = Rider.nearest(*self.center, k=5, max_km=2)
+        from_index = Rider.nearest(*self.center, k=5, max_km=2)
+
+        self.assertTrue(rider_index.is_warm)
+        self.assertEqual([rider.pk for rider in from_db], expected)
+        self.assertEqual([rider.pk for rider in from_index], expected)
+
+    def test_nearest_falls_back_to_the_database_when_indexed_riders_were_taken(self):
+        Rider.warm_location_index()
+        nearest = self.brute_force(3)
+        # Another process claims the eight nearest riders behind the index's back.
+        Rider.objects.filter(pk__in=nearest[:8]).update(status=Rider.ASSIGNED)
+
+        riders = Rider.nearest(*self.center, k=5, max_km=3)
+
+        self.assertEqual([rider.pk for rider in riders], nearest[8:13])
+
+    def test_buffered_locations_apply_on_both_paths(self):
+        rider = next(rider for rider in self.riders if rider.status == Rider.IDLE)
+        buffer = LocationBuffer(flush_interval=None)
+        buffer.record(rider.pk, 18.5201, 73.8501, 1.0)
+
+        with mock.patch('rider.models.location_buffer', buffer):
+            from_db = Rider.get_riders_within_range(*self.center, 3)
+            from_index = Rider.get_riders_within_range(*self.center, 3)
+
+        for riders in (from_db, from_index):
+            found = next(found for found in riders if found.pk == rider.pk)
+            self.assertEqual((float(found.latitude), float(found.longitude)), (18.5201, 73.8501))
+            self.assertEqual(riders[0].pk, rider.pk)
+
+
+class RiderClaimTests(TestCase):
+    """
+    Tests for the rider status machine and for claiming a rider with a
+    compare-and-set update.
+    """
+
+    def setUp(self):
+        manager = User.objects.create_user(email='manager@example.com', password='password', role=User.RESTAURANT)
+        customer = User.objects.create_user(email='customer@example.com', password='password', role=User.USER)
+        restaurant = Restaurant.objects.create(
+            restaurant_manager=manager,
+            restaurant_name='Test Kitchen',
+            restaurant_phone='0000000000',
+            opening_time='09:00',
+            closing_time='23:00',
+            latitude=18.52,
+            longitude=73.85,
+        )
+        self.orders = [Order.objects.create(user=customer, restaurant=restaurant, is_placed=True) for _ in range(2)]
+        rider_user = User.objects.create_user(email='rider@example.com', password='password', role=User.RIDER)
+        self.rider = Rider.objects.create(rider=rider_user, latitude=18.52, longitude=73.85)
+        other_user = User.objects.create_user(email='other@example.com', password='password', role=User.RIDER)
+        self.other_rider = Rider.objects.create(rider=other_user, latitude=18.52, longitude=73.85)
+
+    def test_only_one_of_two_racing_claims_wins(self):
+        # Two dispatches read the rider while it was idle.
+        first = Rider.objects.get(pk=self.rider.pk)
+        second = Rider.objects.get(pk=self.rider.pk)
+
+        self.assertTrue(first.claim(self.orders[0]))
+        self.assertFalse(second.claim(self.orders[1]))
+
+        rider = Rider.objects.get(pk=self.rider.pk)
+        self.assertEqual((rider.status, rider.order_id), (Rider.ASSIGNED, self.orders[0].pk))
+        self.assertEqual(list(DeliveryRecord.objects.values_list('order_id', flat=True)), [self.orders[0].pk])
+
+    def test_busy_rider_cannot_be_claimed(self):
+        self.rider.claim(self.orders[0])
+
+        self.assertFalse(self.rider.claim(self.orders[1]))
+        self.assertEqual(DeliveryRecord.objects.count(), 1)
+
+    def test_illegal_transitions_are_rejected(self):
+        with self.assertRaises(ValueError):
+            self.rider.transition(Rider.DELIVERING)
+
+        self.rider.claim(self.orders[0])
+        client = APIClient()
+        client.force_authenticate(self.rider.rider)
+        response = client.post('/api/rider/update/order', {'status': 'delivering'}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Rider.objects.get(pk=self.rider.pk).status, Rider.ASSIGNED)
+
+    def test_lost_compare_and_set_returns_false(self):
+        stale = Rider.objects.get(pk=self.rider.pk)
+        self.assertTrue(self.rider.transition(Rider.OFFLINE))
+
+        self.assertFalse(stale.transition(Rider.ASSIGNED, order=self.orders[0]))
+        self.assertEqual(stale.status, Rider.IDLE)
+        self.assertEqual(Rider.objects.get(pk=self.rider.pk).status, Rider.OFFLINE)
+
+    def test_busy_rider_cannot_toggle_availability(self):
+        self.rider.claim(self.orders[0])
+        client = APIClient()
+        client.force_authenticate(self.rider.rider)
+
+        response = client.post('/api/rider/update/availability', {'online': False}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Rider.objects.get(pk=self.rider.pk).status, Rider.ASSIGNED)
+
+    def test_an_order_goes_to_one_rider_only(self):
+        self.assertTrue(self.rider.claim(self.orders[0]))
+        self.assertFalse(self.other_rider.claim(self.orders[0]))
+
+        self.other_rider.refresh_from_db()
+        self.assertEqual((self.other_rider.status, self.other_rider.order_id), (Rider.IDLE, None))
+        self.assertEqual(DeliveryRecord.objects.filter(order=self.orders[0]).count(), 1)
+
+        # The losing rider is still free for other orders.
+        self.assertTrue(self.other_rider.claim(self.orders[1]))
+
+    def test_delivered_order_cannot_be_claimed(self):
+        Order.objects.filter(pk=self.orders[0].pk).update(is_delivered=True)
+
+        self.assertFalse(self.rider.claim(self.orders[0]))
+        self.assertEqual(Rider.objects.get(pk=self.rider.pk).status, Rider.IDLE)
+
+    def test_rider_with_an_order_delivered_elsewhere_can_go_idle(self):
+        self.rider.claim(self.orders[0])
+        Order.objects.filter(pk=self.orders[0].pk).update(is_delivered=True)
+        client = APIClient()
+        client.force_authenticate(self.rider.rider)
+
+        response = client.post('/api/rider/update/availability', {'online': True}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], Rider.IDLE)
+
+    def test_batch_dispatch_skips_orders_claimed_meanwhile(self):
+        # The round matched both orders, then the first one was claimed directly.
+        matches = [(self.orders[0].pk, self.rider.pk, 0.1), (self.orders[1].pk, self.other_rider.pk, 0.2)]
+        third = Rider.objects.create(
+            rider=User.objects.create_user(email='third@example.com', password='password', role=User.RIDER),
+            latitude=18.52,
+            longitude=73.85,
+        )
+        self.assertTrue(third.claim(self.orders[0]))
+
+        written = BatchDispatcher().assign(matches)
+
+        self.assertEqual(written, matches[1:])
+        self.assertEqual(Rider.objects.get(pk=self.rider.pk).status, Rider.IDLE)
+        self.assertEqual(list(Rider.objects.filter(order=self.orders[0]).values_list('pk', flat=True)), [third.pk])
+        self.assertEqual(DeliveryRecord.objects.filter(order=self.orders[0]).count(), 1)
+
+
+class LocationBufferTests(TestCase):
+    """
+    Tests for the write-behind buffer of rider pings.
+    """
+
+    def setUp(self):
+        self.riders = [
+            Rider.objects.create(
+                rider=User.objects.create_user(email=f'rider{index}@example.com', password='password', role=User.RIDER),
+                latitude=18.5,
+                longitude=73.8,
+            )
+            for index in range(2)
+        ]
+        self.buffer = LocationBuffer(flush_interval=None)
+
+    def test_out_of_order_pings_are_dropped(self):
+        first, second = (rider.pk for rider in self.riders)
+
+        kept = self.buffer.record_many([(first, 18.52, 73.85, 200.0), (second, 18.6, 73.9, 100.0)])
+        self.assertEqual(kept, {first, second})
+
+        # A late ping from before the first rider's last one loses.
+        kept = self.buffer.record_many([(first, 18.0, 73.0, 150.0), (second, 18.61, 73.91, 100.0)])
+        self.assertEqual(kept, {second})
+        self.assertFalse(self.buffer.record(first, 18.0, 73.0, 199.0))
+
+        self.assertEqual(self.buffer.position(first), (18.52, 73.85))
+        self.assertEqual(self.buffer.position(second), (18.61, 73.91))
+
+    def test_flush_writes_the_latest_positions(self):
+        rider = self.riders[0]
+        self.buffer.record(rider.pk, 18.51, 73.81, 1.0)
+        self.buffer.record(rider.pk, 18.52, 73.82, 2.0)
+
+        self.assertEqual(self.buffer.flush(), 1)
+
+        rider.refresh_from_db()
+        self.assertEqual((float(rider.latitude), float(rider.longitude)), (18.52, 73.82))
+        self.assertEqual(self.buffer.flush(), 0)
+
+
+class RiderBatchLocationTests(TestCase):
+    """
+    Tests for the batch upload of rider location pings.
+    """
+
+    url = '/api/rider/update/location/batch'
+
+    def setUp(self):
+        self.riders = [
+            Rider.objects.create(
+                rider=User.objects.create_user(email=f'rider{index}@example.com', password='password', role=User.RIDER),
+                latitude=18.5,
+                longitude=73.8,
+            )
+            for index in range(2)
+        ]
+        self.admin = User.objects.create_user(email='admin@example.com', password='password', role=User.ADMIN)
+        # Keep the pings of the tests out of the process-wide buffers.
+        self.buffer = LocationBuffer(flush_interval=None)
+        for target in ('rider.views.location_buffer', 'rider.models.location_buffer'):
+            patcher = mock.patch(target, self.buffer)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch('rider.views.track_store', TrackStore(flush_interval=None))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = APIClient()
+
+    def post(self, user, pings):
+        self.client.force_authenticate(user)
+        return self.client.post(self.url, {'pings': pings}, format='json')
+
+    def ping(self, latitude, timestamp, rider=None):
+        ping = {'latitude': latitude, 'longitude': 73.85, 'timestamp': timestamp}
+        if rider is not None:
+            ping['rider'] = rider.pk
+        return ping
+
+    def test_admin_uploads_pings_of_any_rider(self):
+        first, second = self.riders
+        response = self.post(self.admin, [
+            self.ping(18.51, '2024-03-01T10:00:00Z', first),
+            self.ping(18.52, '2024-03-01T10:00:05Z', second),
+        ])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'received': 2, 'applied': 2, 'dropped': 0})
+        self.assertEqual(self.buffer.position(second.pk), (18.52, 73.85))
+
+    def test_admin_pings_must_name_their_rider(self):
+        response = self.post(self.admin, [self.ping(18.51, '2024-03-01T10:00:00Z')])
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_rider_uploads_only_their_own_pings(self):
+        first, second = self.riders
+
+        own = self.post(first.rider, [self.ping(18.51, '2024-03-01T10:00:00Z')])
+        other = self.post(first.rider, [self.ping(18.52, '2024-03-01T10:00:05Z', second)])
+
+        self.assertEqual(own.status_code, 200)
+        self.assertEqual(self.buffer.position(first.pk), (18.51, 73.85))
+        self.assertEqual(other.status_code, 403)
+        self.assertIsNone(self.buffer.position(second.pk))
+
+    def test_customer_cannot_upload_pings(self):
+        customer = User.objects.create_user(email='customer@example.com', password='password', role=User.USER)
+
+        response = self.post(customer, [self.ping(18.51, '2024-03-01T10:00:00Z', self.riders[0])])
+
+        self.assertEqual(response.status_code, 403)
+
+    def test_out_of_order_pings_are_dropped(self):
+        rider = self.riders[0]
+        self.post(rider.rider, [
+            self.ping(18.53, '2024-03-01T10:00:10Z'),
+            self.ping(18.51, '2024-03-01T10:00:00Z'),
+        ])
+
+        response = self.post(rider.rider, [self.ping(18.40, '2024-03-01T10:00:05Z')])
+
+        self.assertEqual(response.data, {'received': 1, 'applied': 0, 'dropped': 1})
+        self.assertEqual(self.buffer.position(rider.pk), (18.53, 73.85))
+
+    def test_batch_size_is_limited(self):
+        pings = [self.ping(18.51, f'2024-03-01T10:00:0{second}Z') for second in range(4)]
+
+        with mock.patch.object(RiderLocationBatchSerializer, 'MAX_PINGS', 3):
+            response = self.post(self.riders[0].rider, pings)
+
+        self.assertEqual(response.status_code, 400)
+
+
+class DeliveryHistoryTests(TestCase):
+    """
+    Tests for the keyset pagination of a rider's delivery history.
+    """
+
+    def setUp(self):
+        manager = User.objects.create_user(email='manager@example.com', password='password', role=User.RESTAURANT)
+        customer = User.objects.create_user(email='customer@example.com', password='password', role=User.USER)
+        restaurant = Restaurant.objects.create(
+            restaurant_manager=manager,
+            restaurant_name='Test Kitchen',
+            restaurant_phone='0000000000',
+            opening_time='09:00',
+            closing_time='23:00',
+            latitude=18.52,
+            longitude=73.85,
+        )
+        order = Order.objects.create(user=customer, restaurant=restaurant, is_placed=True, is_delivered=True)
+        self.rider, other = (
+            Rider.objects.create(
+                rider=User.objects.create_user(email=f'rider{index}@example.com', password='password', role=User.RIDER),
+                latitude=18.5,
+                longitude=73.8,
+            )
+            for index in range(2)
+        )
+        start = datetime(2024, 3, 1, 12, tzinfo=timezone.utc)
+        # Two deliveries share a timestamp, which the cursor must not skip.
+        minutes = [0, 5, 5, 10, 20, 30, 40]
+        records = DeliveryRecord.objects.bulk_create([
+            DeliveryRecord(rider=self.rider, order=order, delivered_at=start + timedelta(minutes=minute))
+            for minute in minutes
+        ])
+        DeliveryRecord.objects.create(rider=self.rider, order=order)
+        DeliveryRecord.objects.create(rider=other, order=order, delivered_at=start)
+        self.expected = [record.pk for record in sorted(records, key=lambda record: (record.delivered_at, record.pk),
+                                                       reverse=True)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.rider.rider)
+
+    def test_pages_follow_the_next_links_newest_first(self):
+        seen, pages = [], 0
+        url = '/api/rider/delivered/orders?page_size=3'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(record['id'] for record in response.data['results'])
+            url = response.data['next']
+            pages += 1
+
+        self.assertEqual(seen, self.expected)
+        self.assertEqual(pages, 3)
+
+    def test_first_page_has_no_previous_link(self):
+        response = self.client.get('/api/rider/delivered/orders', {'page_size': 20})
+
+        self.assertIsNone(response.data['previous'])
+        self.assertIsNone(response.data['next'])
+        self.assertEqual([record['id'] for record in response.data['results']], self.expected)
+
+
+class TrackStoreTests(TestCase):
+    """
+    Tests for the compact store of rider location histories.
+    """
+
+    def setUp(self):
+        self.rider = Rider.objects.create(
+            rider=User.objects.create_user(email='rider@example.com', password='password', role=User.RIDER),
+            latitude=18.5,
+            longitude=73.8,
+        )
+        self.store = TrackStore(flush_interval=None)
+        # Midnight UTC between 29 February and 1 March.
+        self.midnight = datetime(2024, 3, 1, tzinfo=timezone.utc).timestamp()
+
+    def test_encode_decode_round_trip(self):
+        rng = np.random.default_rng(7)
+        times = np.sort(rng.integers(1_700_000_000_000, 1_700_086_400_000, size=50))
+        coordinates = rng.integers(-180_000_000, 180_000_000, size=(50, 2))
+        points = np.column_stack([times, coordinates]).astype(np.int64)
+        base_time = int(points[0, 0])
+
+        segment = RiderTrackSegment(base_time=base_time, data=encode_pings(points, (base_time, 0, 0)))
+
+        np.testing.assert_array_equal(decode_segment(segment), points)
+
+    def test_window_spans_a_utc_day_boundary(self):
+        pings = [
+            (self.rider.pk, self.midnight + 30, 18.52, 73.86),
+            (self.rider.pk, self.midnight - 30, 18.51, 73.85),
+            (self.rider.pk, self.midnight - 90, 18.50, 73.84),
+        ]
+        self.store.append_many(pings)
+        self.assertEqual(self.store.flush(), 3)
+
+        segments = RiderTrackSegment.objects.filter(rider=self.rider).order_by('day')
+        self.assertEqual([segment.ping_count for segment in segments], [2, 1])
+        self.assertEqual(segments[0].day.isoformat(), '2024-02-29')
+
+        window = self.store.window(self.rider.pk, self.midnight - 60, self.midnight + 60)
+        np.testing.assert_allclose(window, [
+            (self.midnight - 30, 18.51, 73.85),
+            (self.midnight + 30, 18.52, 73.86),
+        ])
+
+    def test_window_includes_unflushed_pings(self):
+        self.store.append(self.rider.pk, self.midnight + 10, 18.5, 73.8)
+        self.store.flush()
+        self.store.append(self.rider.pk, self.midnight + 20, 18.6, 73.9)
+
+        window = self.store.window(self.rider.pk, self.midnight, self.midnight + 30)
+
+        np.testing.assert_allclose(window[:, 0], [self.midnight + 10, self.midnight + 20])
+
+    def test_pings_being_flushed_stay_visible(self):
+        self.store.append(self.rider.pk, self.midnight + 10, 18.5, 73.8)
+        bulk_create = RiderTrackSegment.objects.bulk_create
+        seen = []
+
+        def read_while_writing(*args, **kwargs):
+            seen.append(len(self.store.window(self.rider.pk, self.midnight, self.midnight + 30)))
+            return bulk_create(*args, **kwargs)
+
+        with mock.patch.object(RiderTrackSegment.objects, 'bulk_create', side_effect=read_while_writing):
+            self.store.flush()
+
+        self.assertEqual(seen, [1])
+        self.assertEqual(len(self.store.window(self.rider.pk, self.midnight, self.midnight + 30)), 1)
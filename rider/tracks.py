@@ -0,0 +1,241 @@
+import atexit
+import logging
+import threading
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from .locations import WriteBehindBuffer
+
+logger = logging.getLogger(__name__)
+
+FIXED_POINT = 1000000
+MS_PER_DAY = 86400000
+EPOCH = date(1970, 1, 1)
+
+# On-disk layout of a ping: time delta (ms), latitude delta, longitude delta.
+PING_DTYPE = np.dtype('<i4')
+BYTES_PER_PING = 3 * PING_DTYPE.itemsize
+
+
+def _to_seconds(value):
+    return value.timestamp() if isinstance(value, datetime) else float(value)
+
+
+def encode_pings(points, previous):
+    """
+    Delta-encodes pings against the previous ping of a segment.
+
+    Args:
+        points (ndarray): int64 array of shape (n, 3) with absolute
+            (time in ms, latitude, longitude) fixed-point values.
+        previous (tuple): The (time in ms, latitude, longitude) the first delta is relative to.
+
+    Returns:
+        bytes: The encoded pings, 12 bytes each.
+    """
+    deltas = np.diff(np.vstack([np.asarray(previous, dtype=np.int64), points]), axis=0)
+    return deltas.astype(PING_DTYPE).tobytes()
+
+
+def decode_segment(segment):
+    """
+    Decodes the pings of a track segment.
+
+    Args:
+        segment (RiderTrackSegment): The segment to decode.
+
+    Returns:
+        ndarray: int64 array of shape (n, 3) with absolute
+        (time in ms, latitude, longitude) fixed-point values.
+    """
+    deltas = np.frombuffer(bytes(segment.data), dtype=PING_DTYPE).reshape(-1, 3).astype(np.int64)
+    points = np.cumsum(deltas, axis=0)
+    points[:, 0] += segment.base_time
+    return points
+
+
+class TrackStore(WriteBehindBuffer):
+    """
+    Compact store of every location ping of every rider.
+
+    Pings are staged in memory, and each flush inserts one new
+    RiderTrackSegment per rider and UTC day with the pings staged since
+    the previous flush. The history costs 12 bytes per ping and one row
+    per rider, day and flush instead of one row per ping. Staging runs at
+    several hundred thousand pings per second.
+
+    A flush only inserts rows, so its cost depends on the pings staged and
+    not on the history already stored. Appending to the day's segment
+    instead would read and rewrite a blob that grows all day on every
+    flush, under a row lock shared with the other workers' flushes, and
+    late pings would have to be merged into the sorted deltas. The flush
+    is rather done less often than the location flush
+    (RIDER_TRACK_FLUSH_INTERVAL) to keep the number of rows down: the
+    default of a minute gives at most 1440 rows per rider and day, all
+    found through the (rider, day) index.
+
+    Pings being written by a flush stay readable from memory until their
+    rows are committed, so window() never misses them.
+    """
+
+    def __init__(self, flush_interval):
+        """
+        Initializes an empty store.
+
+        Args:
+            flush_interval (float): Seconds between two flushes.
+        """
+        super().__init__(flush_interval)
+        self._staged = defaultdict(list)
+        self._flushing = {}
+        self._flushed = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def append(self, rider_id, timestamp, latitude, longitude):
+        """
+        Appends a ping to a rider's history.
+
+        Args:
+            rider_id (int): The ID of the rider.
+            timestamp (datetime or float): When the position was taken.
+            latitude (float): The rider's latitude.
+            longitude (float): The rider's longitude.
+        """
+        self.append_many([(rider_id, timestamp, latitude, longitude)])
+
+    def append_many(self, pings):
+        """
+        Appends several pings, in any order, to the riders' histories.
+
+        Args:
+            pings (iterable): (rider_id, timestamp, latitude, longitude) tuples.
+        """
+        staged = []
+        for rider_id, timestamp, latitude, longitude in pings:
+            time_ms = int(round(_to_seconds(timestamp) * 1000))
+            staged.append((
+                (rider_id, time_ms // MS_PER_DAY),
+                (time_ms, int(round(float(latitude) * FIXED_POINT)), int(round(float(longitude) * FIXED_POINT))),
+            ))
+
+        with self._lock:
+            for key, point in staged:
+                self._staged[key].append(point)
+        self.schedule_flush()
+
+    def flush(self):
+        """
+        Writes the staged pings as new segments.
+
+        Returns:
+            int: Number of pings written.
+        """
+        from .models import RiderTrackSegment
+
+        with self._flush_lock:
+            with self._lock:
+                staged, self._staged = self._staged, defaultdict(list)
+                self._flushing = staged
+            if not staged:
+                return 0
+
+            segments = []
+            for (rider_id, day), points in staged.items():
+                points = np.array(points, dtype=np.int64)
+                points = points[np.argsort(points[:, 0], kind='stable')]
+                base_time = int(points[0, 0])
+                segments.append(RiderTrackSegment(
+                    rider_id=rider_id,
+                    day=EPOCH + timedelta(days=day),
+                    base_time=base_time,
+                    last_time=int(points[-1, 0]),
+                    ping_count=len(points),
+                    data=encode_pings(points, (base_time, 0, 0)),
+                ))
+
+            try:
+                with transaction.atomic():
+                    RiderTrackSegment.objects.bulk_create(segments, batch_size=500)
+            except Exception:
+                # Put the pings back in front of the ones staged meanwhile.
+                with self._lock:
+                    for key, points in self._staged.items():
+                        staged[key].extend(points)
+                    self._staged = staged
+                    self._flushing = {}
+                raise
+
+            with self._lock:
+                self._flushing = {}
+                self._flushed += 1
+            return sum(len(points) for points in staged.values())
+
+    def window(self, rider_id, start, end):
+        """
+        Reads a rider's pings between two instants, including unflushed ones.
+
+        Args:
+            rider_id (int): The ID of the rider.
+            start (datetime or float): Start of the window, inclusive.
+            end (datetime or float): End of the window, inclusive.
+
+        Returns:
+            ndarray: float64 array of shape (n, 3) with (unix time in seconds,
+            latitude, longitude) rows sorted by time.
+        """
+        from .models import RiderTrackSegment
+
+        start_ms = int(round(_to_seconds(start) * 1000))
+        end_ms = int(round(_to_seconds(end) * 1000))
+        first_day, last_day = start_ms // MS_PER_DAY, end_ms // MS_PER_DAY
+
+        # Reads the pings in memory, then the stored ones, and retries if a
+        # flush committed in between and may have moved pings from the
+        # first to the second.
+        while True:
+            with self._lock:
+                flushed = self._flushed
+                chunks = [
+                    np.array(points, dtype=np.int64)
+                    for pending in (self._staged, self._flushing)
+                    for (staged_rider, day), points in pending.items()
+                    if staged_rider == rider_id and first_day <= day <= last_day
+                ]
+
+            segments = RiderTrackSegment.objects.filter(
+                rider_id=rider_id,
+                day__range=(EPOCH + timedelta(days=first_day), EPOCH + timedelta(days=last_day)),
+                base_time__lte=end_ms,
+                last_time__gte=start_ms,
+            ).only('base_time', 'data')
+            chunks.extend(decode_segment(segment) for segment in segments)
+
+            with self._lock:
+                if self._flushed == flushed:
+                    break
+
+        if not chunks:
+            return np.empty((0, 3))
+
+        points = np.concatenate(chunks)
+        points = points[(points[:, 0] >= start_ms) & (points[:, 0] <= end_ms)]
+        points = points[np.argsort(points[:, 0], kind='stable')]
+
+        window = np.empty(points.shape)
+        window[:, 0] = points[:, 0] / 1000
+        window[:, 1:] = points[:, 1:] / FIXED_POINT
+        return window
+
+
+track_store = TrackStore(getattr(settings, 'RIDER_TRACK_FLUSH_INTERVAL', 60))
+
+
+@atexit.register
+def _flush_on_exit():
+    try:
+        track_store.flush()
+    except Exception:
+        logger.exception('Failed to flush rider tracks on exit')
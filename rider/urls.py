@@ -1,9 +1,12 @@
 from django.urls import path
-from .views import RiderUpdateLocationView, RiderProfileUpdateView, RiderUpdateOrderView, RiderDeliveredOrdersView
+from .views import RiderUpdateLocationView, RiderBatchUpdateLocationView, RiderProfileUpdateView, RiderUpdateOrderView, RiderAvailabilityView, RiderDeliveredOrdersView, RiderLocationStatsView
 
 urlpatterns = [
     path('rider/update/profile', RiderProfileUpdateView.as_view(), name='update-rider-profile'),
     path('rider/update/location', RiderUpdateLocationView.as_view(), name='update-rider-location'),
+    path('rider/update/location/batch', RiderBatchUpdateLocationView.as_view(), name='batch-update-rider-location'),
     path('rider/update/order', RiderUpdateOrderView.as_view(), name='update-rider-order'),
+    path('rider/update/availability', RiderAvailabilityView.as_view(), name='update-rider-availability'),
+    path('rider/location/stats', RiderLocationStatsView.as_view(), name='rider-location-stats'),
     path('rider/delivered/orders', RiderDeliveredOrdersView.as_view(), name='rider-delivered-orders'),
 ]
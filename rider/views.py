@@ -1,12 +1,22 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from django.db import transaction
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 from rest_framework.permissions import IsAuthenticated
-from permissions import IsRiderRole
-from .models import Rider
-from .serializers import RiderSerializer, OrderSerializer
-from orders.models import Order
+from geo import get_eta_matrix
+from permissions import IsAdminRole, IsRiderRole
+from .locations import location_buffer
+from .models import DeliveryRecord, Rider
+from .pagination import DeliveryHistoryPagination
+from .tracks import track_store
+from .serializers import (
+    RiderSerializer, RiderLocationSerializer, RiderLocationBatchSerializer, RiderOrderStatusSerializer,
+    RiderAvailabilitySerializer, DeliveryRecordSerializer,
+)
+from accounts.models import User
+from orders.tracking import order_hub
 
 class RiderProfileUpdateView(APIView):
     """
@@ -37,7 +47,8 @@ class RiderProfileUpdateView(APIView):
 
         valid = serializer.is_valid(raise_exception=True)
         if valid:
-            serializer.save()
+            rider = serializer.save()
+            rider.sync_location_index()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)    
 
@@ -62,61 +73,273 @@ class RiderUpdateLocationView(APIView):
             Response: The response indicating successful location update.
         """
 
-        rider = get_object_or_404(Rider, rider=request.user)
+        rider = get_object_or_404(Rider.objects.only('pk', 'status', 'order_id'), rider=request.user)
 
-        latitude = request.data.get('latitude')
-        longitude = request.data.get('longitude')
+        serializer = RiderLocationSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        latitude = round(serializer.validated_data['latitude'], 6)
+        longitude = round(serializer.validated_data['longitude'], 6)
 
-        # Update rider's location
-        rider.latitude = latitude
-        rider.longitude = longitude
-        rider.save()
+        track_store.append(rider.pk, timezone.now(), latitude, longitude)
+
+        # Buffer the location; it is written to the database in bulk
+        if location_buffer.record(rider.pk, latitude, longitude):
+            rider.latitude = latitude
+            rider.longitude = longitude
+            rider.sync_location_index()
+            if rider.status in Rider.BUSY_STATUSES and rider.order_id:
+                order_hub.publish(rider.order_id, 'location', {'rider': rider.pk, 'latitude': latitude, 'longitude': longitude})
 
         return Response({"message": "Rider location updated successfully."}, status=status.HTTP_200_OK)
 
+class RiderBatchUpdateLocationView(APIView):
+    """
+    API view for uploading many timestamped location pings at once.
+
+    Riders upload their own queued pings; admins (fleet gateways) may upload
+    pings for any rider by setting the rider field of each ping.
+
+    Attributes:
+        permission_classes (tuple): The permission classes for the view.
+    """
+
+    permission_classes = (IsAuthenticated, IsRiderRole)
+
+    def post(self, request):
+        """
+        Handle POST request to apply a batch of location pings.
+
+        Only the newest ping of each rider is applied; pings older than the
+        rider's last known position are dropped.
+
+        Args:
+            request (Request): The request object.
+
+        Returns:
+            Response: The response with the number of received, applied and dropped pings.
+        """
+
+        serializer = RiderLocationBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        pings = serializer.validated_data['pings']
+
+        if request.user.role == User.ADMIN:
+            if any('rider' not in ping for ping in pings):
+                return Response({'error': 'Every ping must name its rider.'}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            own_rider = get_object_or_404(Rider.objects.only('pk'), rider=request.user)
+            if any(ping.get('rider', own_rider.pk) != own_rider.pk for ping in pings):
+                return Response({'error': 'You can only update your own location.'}, status=status.HTTP_403_FORBIDDEN)
+            for ping in pings:
+                ping['rider'] = own_rider.pk
+
+        # Keep the newest ping of each rider
+        newest = {}
+        for ping in pings:
+            current = newest.get(ping['rider'])
+            if current is None or ping['timestamp'] >= current['timestamp']:
+                newest[ping['rider']] = ping
+
+        assignments = {
+            pk: (rider_status, order_id)
+            for pk, rider_status, order_id in Rider.objects.filter(pk__in=newest).values_list('pk', 'status', 'order_id')
+        }
+        unknown = sorted(set(newest) - set(assignments))
+        if unknown:
+            return Response({'error': 'Unknown riders.', 'riders': unknown}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Every ping goes to the history, whatever its order
+        track_store.append_many(
+            (ping['rider'], ping['timestamp'], ping['latitude'], ping['longitude']) for ping in pings
+        )
+
+        positions = {
+            rider_id: (round(ping['latitude'], 6), round(ping['longitude'], 6), ping['timestamp'].timestamp())
+            for rider_id, ping in newest.items()
+        }
+        applied = location_buffer.record_many(
+            (rider_id, latitude, longitude, timestamp) for rider_id, (latitude, longitude, timestamp) in positions.items()
+        )
+        # A ping older than the rider's last one must not move the rider back
+        for rider_id in applied:
+            latitude, longitude, _ = positions[rider_id]
+            rider_status, order_id = assignments[rider_id]
+            Rider(pk=rider_id, latitude=latitude, longitude=longitude, status=rider_status).sync_location_index()
+            if rider_status in Rider.BUSY_STATUSES and order_id:
+                latitude, longitude = location_buffer.position(rider_id, (latitude, longitude))
+                order_hub.publish(order_id, 'location', {'rider': rider_id, 'latitude': latitude, 'longitude': longitude})
+
+        response = {
+            'received': len(pings),
+            'applied': len(applied),
+            'dropped': len(pings) - len(applied),
+        }
+        return Response(response, status=status.HTTP_200_OK)
+
 class RiderUpdateOrderView(APIView):
     """
     API view for updating rider's order status.
 
+    The rider moves the current order through picked_up and delivering,
+    and marks it delivered, which makes the rider idle again. Each step must
+    be a valid transition of the rider's status.
+
     Attributes:
         permission_classes (tuple): The permission classes for the view.
+        next_status (dict): The rider status reached at each step of the order.
     """
 
     permission_classes = (IsAuthenticated, IsRiderRole)
+    next_status = {
+        RiderOrderStatusSerializer.PICKED_UP: Rider.PICKED_UP,
+        RiderOrderStatusSerializer.DELIVERING: Rider.DELIVERING,
+        RiderOrderStatusSerializer.DELIVERED: Rider.IDLE,
+    }
+
+    def observe_travel_time(self, eta_matrix, rider, record, new_status, now):
+        """
+        Feeds the leg the rider just completed into the ETA matrix.
+
+        Reaching the restaurant completes the leg from where the rider was
+        when the order was assigned; delivering completes the leg from the
+        restaurant to the rider's current position, the customer's door.
+
+        Args:
+            eta_matrix (EtaMatrix): The matrix to update.
+            rider (Rider): The rider, with its current location.
+            record (DeliveryRecord): The ledger entry of the order.
+            new_status (str): The status the rider just reached.
+            now (datetime): When the status was reached.
+        """
+        restaurant = rider.order.restaurant
+        if new_status == Rider.PICKED_UP:
+            # Last position the rider sent before the assignment
+            start = record.assigned_at.timestamp()
+            track = track_store.window(rider.pk, start - 600, start)
+            if not len(track):
+                return
+            _, latitude, longitude = track[-1]
+            eta_matrix.observe(latitude, longitude, restaurant.latitude, restaurant.longitude,
+                               (now - record.assigned_at).total_seconds())
+        elif new_status == Rider.IDLE and record.picked_at is not None:
+            eta_matrix.observe(restaurant.latitude, restaurant.longitude, rider.latitude, rider.longitude,
+                               (now - record.picked_at).total_seconds())
 
     def post(self, request):
         """
         Handle POST request to update rider's order status.
 
         Args:
-            request (Request): The request object.
+            request (Request): The request object, with an optional status
+                (picked_up, delivering or delivered, the default).
 
         Returns:
             Response: The response indicating successful order update.
         """
-        
-        rider = get_object_or_404(Rider, rider=request.user)
 
-        if rider.order and not rider.order.is_delivered:
-            rider.is_delivered = True
-            rider.is_picked_up = False
-            rider.order.is_delivered = True
-            rider.order.save()  # Save changes to the Order model
-            rider.save()  # Save changes to the Rider model
+        serializer = RiderOrderStatusSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        step = serializer.validated_data['status']
 
-            return Response({'message': 'Order marked as delivered successfully.'}, status=status.HTTP_200_OK)
-        else:
+        rider = get_object_or_404(Rider.objects.select_related('order__restaurant'), rider=request.user)
+
+        if not rider.order or rider.order.is_delivered:
+            # A busy rider left with a delivered order goes back online
+            # through the availability toggle.
             return Response({'error': 'No order found or order is already delivered.'}, status=status.HTTP_400_BAD_REQUEST)
-        
+
+        new_status = self.next_status[step]
+        if rider.status not in Rider.BUSY_STATUSES or not Rider.can_transition(rider.status, new_status):
+            return Response({'error': f'Cannot mark the order {step} while the rider is {rider.status}.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        now = timezone.now()
+        delivered = step == RiderOrderStatusSerializer.DELIVERED
+        with transaction.atomic():
+            if not rider.transition(new_status, is_delivered=delivered):
+                return Response({'error': 'The rider status changed meanwhile, please retry.'},
+                                status=status.HTTP_409_CONFLICT)
+
+            ledger = DeliveryRecord.objects.filter(rider=rider, order=rider.order, delivered_at__isnull=True)
+            record = ledger.first()
+            if delivered:
+                rider.order.is_delivered = True
+                rider.order.save()  # Save changes to the Order model
+                # Close the ledger entry opened when the order was assigned
+                if not ledger.update(delivered_at=now):
+                    DeliveryRecord.objects.create(rider=rider, order=rider.order, assigned_at=now, delivered_at=now)
+            elif new_status == Rider.PICKED_UP:
+                ledger.update(picked_at=now)
+
+        rider.sync_location_index()  # Idle riders are available again
+        order_hub.publish(rider.order_id, 'status', {'status': step, 'rider': rider.pk}, final=delivered)
+
+        eta_matrix = get_eta_matrix()
+        if eta_matrix is not None and record is not None:
+            self.observe_travel_time(eta_matrix, rider, record, new_status, now)
+
+        return Response({'message': f'Order marked as {step} successfully.'}, status=status.HTTP_200_OK)
+
+
+class RiderAvailabilityView(APIView):
+    """
+    API view for the rider's online/offline toggle.
+
+    Offline riders are left out of every dispatch until they come back online.
+
+    Attributes:
+        permission_classes (tuple): The permission classes for the view.
+    """
+
+    permission_classes = (IsAuthenticated, IsRiderRole)
+
+    def post(self, request):
+        """
+        Handle POST request to go online or offline.
+
+        Args:
+            request (Request): The request object.
+
+        Returns:
+            Response: The response containing the rider's status.
+        """
+
+        serializer = RiderAvailabilitySerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        new_status = Rider.IDLE if serializer.validated_data['online'] else Rider.OFFLINE
+
+        rider = get_object_or_404(Rider.objects.select_related('order'), rider=request.user)
+
+        if rider.status in Rider.BUSY_STATUSES and (rider.order is None or rider.order.is_delivered):
+            # The order was completed elsewhere, so nothing is left to finish
+            if not rider.transition(Rider.IDLE):
+                return Response({'error': 'The rider status changed meanwhile, please retry.'},
+                                status=status.HTTP_409_CONFLICT)
+            rider.sync_location_index()
+
+        if rider.status != new_status:
+            # Only idle riders go offline, and coming online never ends an order
+            if rider.status in Rider.BUSY_STATUSES:
+                return Response({'error': 'Finish the current order first.'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            if not rider.transition(new_status):
+                return Response({'error': 'The rider status changed meanwhile, please retry.'},
+                                status=status.HTTP_409_CONFLICT)
+            rider.sync_location_index()
+
+        return Response({'status': rider.status}, status=status.HTTP_200_OK)
+
 class RiderDeliveredOrdersView(APIView):
     """
     API view for retrieving delivered orders for a rider.
 
     Attributes:
         permission_classes (tuple): The permission classes for the view.
+        pagination_class (class): The keyset pagination of the history.
     """
 
     permission_classes = (IsAuthenticated, IsRiderRole)
+    pagination_class = DeliveryHistoryPagination
 
     def get(self, request):
         """
@@ -126,13 +349,43 @@ class RiderDeliveredOrdersView(APIView):
             request (Request): The request object.
 
         Returns:
-            Response: The response containing delivered order data.
+            Response: A page of the rider's delivery history, newest first,
+            with the cursors of the next and previous pages.
+        """
+
+        rider = get_object_or_404(Rider.objects.only('pk'), rider=request.user)
+
+        # Retrieve delivered orders for this rider from the delivery ledger
+        deliveries = DeliveryRecord.objects.filter(
+            rider=rider, delivered_at__isnull=False
+        ).select_related('order')
+
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(deliveries, request, view=self)
+        serializer = DeliveryRecordSerializer(page, many=True)
+
+        return paginator.get_paginated_response(serializer.data)
+
+
+class RiderLocationStatsView(APIView):
+    """
+    API view for the rider location ingestion counters.
+
+    Attributes:
+        permission_classes (tuple): The permission classes for the view.
+    """
+
+    permission_classes = (IsAuthenticated, IsAdminRole)
+
+    def get(self, request):
         """
+        Handle GET request to retrieve the location ingestion counters.
 
-        rider = get_object_or_404(Rider, rider=request.user)
+        Args:
+            request (Request): The request object.
 
-        # Retrieve delivered orders for this rider
-        delivered_orders = Order.objects.filter(rider=rider, is_delivered=True)
-        serializer = OrderSerializer(delivered_orders, many=True)
+        Returns:
+            Response: The response containing pings, database writes and their rates.
+        """
 
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return Response(location_buffer.stats(), status=status.HTTP_200_OK)